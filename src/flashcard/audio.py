@@ -0,0 +1,82 @@
+# audio previews - renders our Score model straight to WAV audio with NumPy, without a MIDI synth
+#
+# Each note is a short additive tone (a few harmonics under a decaying envelope), rendered once per
+# MIDI note and length and cached, so a deck of chords mostly reuses the same few hundred arrays.
+# A chord is the sum of its notes' arrays, and each Sequence is mixed into the same buffer at the
+# tick's offset.  Timing follows smf.py (120 quarter notes per minute), so a one-beat card plays
+# for half a second.  It's the 'wav' output format (see score.output_formats).
+
+import io
+import wave
+
+import numpy
+
+try:
+    import smf
+except:
+    from flashcard import smf
+
+sample_rate = 22050
+tempo = smf.tempo # quarter notes per minute
+harmonics = numpy.array([1.0, 0.5, 0.3, 0.15, 0.08]) # amplitude of each harmonic, from the fundamental up
+decay = 2.5 # the envelope falls by e every 1/decay seconds
+attack = 0.005 # seconds to fade in, and
+release = 0.03 # out, so notes don't click
+volume = 0.25 # amplitude of one note; a mix louder than 1 is scaled down to fit
+
+# (midi, samples) -> read-only float32 array
+_waves = {}
+
+def frequency(midi:int) -> float:
+    return 440.0 * 2 ** ((midi - 69) / 12)
+
+def note_wave(midi:int, samples:int) -> numpy.ndarray:
+    '''Return the tone for a MIDI note, samples long (cached; don't modify it)'''
+    key = (midi, samples)
+    tone = _waves.get(key)
+    if tone is None:
+        t = numpy.arange(samples, dtype=numpy.float64) / sample_rate
+        f = frequency(midi) * numpy.arange(1, len(harmonics) + 1)
+        amplitudes = numpy.where(f < sample_rate / 2, harmonics, 0.0) # nothing above Nyquist
+        tone = amplitudes @ numpy.sin(2 * numpy.pi * numpy.outer(f, t))
+        envelope = numpy.exp(-decay * t)
+        envelope *= numpy.minimum(1.0, t / attack)
+        envelope *= numpy.minimum(1.0, (samples - 1 - numpy.arange(samples)) / (release * sample_rate))
+        tone = (volume / amplitudes.sum() * tone * envelope).astype(numpy.float32)
+        tone.flags.writeable = False
+        _waves[key] = tone
+    return tone
+
+def sample_at(quarters:float) -> int:
+    return round(quarters * 60 / tempo * sample_rate)
+
+def score_to_pcm(score) -> numpy.ndarray:
+    '''Return a Score as float32 samples between -1 and 1'''
+    length = max((sum(t.duration.quarterLength for t in s.ticks) for s in score.sequences), default=0)
+    mix = numpy.zeros(sample_at(length), dtype=numpy.float32)
+    for sequence in score.sequences:
+        quarters = 0.0
+        for tick in sequence.ticks:
+            (start, end) = (sample_at(quarters), sample_at(quarters + tick.duration.quarterLength))
+            for note in tick.notes:
+                midi = note.midi()
+                if midi is not None:
+                    mix[start:end] += note_wave(midi, end - start)
+            quarters += tick.duration.quarterLength
+    peak = numpy.abs(mix).max(initial=0.0)
+    if peak > 1.0:
+        mix /= peak
+    return mix
+
+def pcm_to_wav(pcm:numpy.ndarray) -> bytes:
+    '''Return samples between -1 and 1 as a 16-bit mono WAV file'''
+    f = io.BytesIO()
+    with wave.open(f, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes((pcm * 32767).astype('<i2').tobytes())
+    return f.getvalue()
+
+def score_to_wav(score) -> bytes:
+    return pcm_to_wav(score_to_pcm(score))
@@ -0,0 +1,47 @@
+import io
+import wave
+
+import numpy
+
+try:
+    import audio
+    from score import Duration, Note, Score, Sequence, Tick
+except:
+    from flashcard import audio
+    from flashcard.score import Duration, Note, Score, Sequence, Tick
+
+def test_note_wave():
+    tone = audio.note_wave(69, 1000)
+    assert tone is audio.note_wave(69, 1000) # cached
+    assert tone.dtype == numpy.float32 and len(tone) == 1000
+    assert not tone.flags.writeable
+    assert abs(tone[0]) < 1e-6 and abs(tone[-1]) < 1e-6 # faded in and out
+    # the fundamental is the strongest frequency
+    spectrum = numpy.abs(numpy.fft.rfft(audio.note_wave(69, audio.sample_rate)))
+    assert spectrum.argmax() == 440
+
+def test_chord_is_sum():
+    samples = audio.sample_at(1)
+    notes = [Note('C4'), Note('E4'), Note('G4')]
+    pcm = audio.score_to_pcm(Score([Sequence(None, [Tick(Duration(1), set(notes))])]))
+    assert len(pcm) == samples == audio.sample_rate // 2
+    assert numpy.allclose(pcm, sum(audio.note_wave(n.midi(), samples) for n in notes))
+
+def test_sequences_and_rests():
+    treble = Sequence(None, [Tick(Duration(1), {Note('C5')}), Tick(Duration(1), {Note('D5')})])
+    bass = Sequence(None, [Tick(Duration(2), set())])
+    pcm = audio.score_to_pcm(Score([treble, bass]))
+    assert len(pcm) == audio.sample_at(2)
+    half = audio.sample_at(1)
+    assert numpy.allclose(pcm[half:], audio.note_wave(Note('D5').midi(), half))
+
+def test_loud_chord_fits():
+    notes = {Note(f"{step}{octave}") for step in "CDEFGAB" for octave in (3, 4, 5)}
+    pcm = audio.score_to_pcm(Score([Sequence(None, [Tick(Duration(1), notes)])]))
+    assert numpy.abs(pcm).max() <= 1.0
+
+def test_wav():
+    data = audio.score_to_wav(Score([Sequence(None, [Tick(Duration(1), {Note('A4')})])]))
+    with wave.open(io.BytesIO(data)) as w:
+        assert (w.getnchannels(), w.getsampwidth(), w.getframerate()) == (1, 2, audio.sample_rate)
+        assert w.getnframes() == audio.sample_at(1)
@@ -0,0 +1,245 @@
+# benchmarks - how long the main paths take, compared with a saved baseline
+#
+#   python src/flashcard/benchmark.py --save    # measure, and save the results as the baseline
+#   python src/flashcard/benchmark.py           # measure, and fail if anything's slower than the baseline
+#
+# Run from the repo directory.  Each benchmark reports the median time per call over several
+# repeats.  A benchmark regresses if it takes more than --threshold times its baseline time.
+# Baselines depend on the machine, so save one on the machine you compare on.
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import runpy
+import sys
+import tempfile
+import time
+
+try:
+    from score import Clef, Duration, Key, KeyAndMode, Mode, Note, Score, Sequence, Tick, chord, sanitize
+    from chords import Chord, ChordType, Voicing
+    from fcgen import NoteRange, exercise, fc_chord, fc_interval, fc_randnote
+    import fcset_gen
+    import scheduler
+    import score
+except:
+    from flashcard.score import Clef, Duration, Key, KeyAndMode, Mode, Note, Score, Sequence, Tick, chord, sanitize
+    from flashcard.chords import Chord, ChordType, Voicing
+    from flashcard.fcgen import NoteRange, exercise, fc_chord, fc_interval, fc_randnote
+    from flashcard import fcset_gen
+    from flashcard import scheduler
+    from flashcard import score
+
+baseline_filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def timed(fn, min_time:float=0.2, repeats:int=5) -> float:
+    '''Return the median seconds per call of fn(), over repeats runs of enough calls to take min_time'''
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for i in range(calls):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or calls >= 1_000_000:
+            break
+        calls = max(calls * 2, int(calls * min_time / max(elapsed, 1e-9)))
+    times = [elapsed / calls]
+    for r in range(repeats - 1):
+        start = time.perf_counter()
+        for i in range(calls):
+            fn()
+        times.append((time.perf_counter() - start) / calls)
+    return sorted(times)[len(times) // 2]
+
+def with_writer(writer:str, fn):
+    '''Return fn wrapped to run with score's XML and MIDI writers set to writer'''
+    def run():
+        (xml_writer, midi_writer) = (score.xml_writer, score.midi_writer)
+        score.xml_writer = score.midi_writer = writer
+        try:
+            return fn()
+        finally:
+            (score.xml_writer, score.midi_writer) = (xml_writer, midi_writer)
+    return run
+
+def chord_score() -> Score:
+    parts = chord(Note('F#4'), Key.D, Chord(ChordType.dom9, Voicing.blues).parts)
+    seqs = [Sequence(Clef.Treble if i == 0 else Clef.Bass, [Tick(Duration(1), part)]) for (i, part) in enumerate(parts)]
+    return Score(seqs, keyAndMode=KeyAndMode(Key.D, Mode.major))
+
+def uncached_note():
+    Note._interned.clear()
+    return Note('C#4')
+
+def scheduler_cycle():
+    '''Return a function that picks a learner's next card in a 100k-card deck, and reviews it'''
+    deck = scheduler.synthetic_deck(100_000)
+    learner = scheduler.Learner(deck, seed=1)
+    learner.seen(range(0, deck.size, 10), [0] * (deck.size // 10))
+    clock = itertools.count(1)
+    def run():
+        now = next(clock)
+        learner.review(learner.next(now), 4, now)
+    return run
+
+def xml_generator(name:str, scratch:str):
+    '''Return a function that runs one of the repo's xml_generator_*.py scripts in a scratch directory'''
+    path = os.path.join(repo_dir, f"xml_generator_{name}.py")
+    def run():
+        os.makedirs(os.path.join(scratch, "output"), exist_ok=True)
+        cwd = os.getcwd()
+        os.chdir(scratch)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                runpy.run_path(path, run_name="__main__")
+        finally:
+            os.chdir(cwd)
+    if repo_dir not in sys.path:
+        sys.path.append(repo_dir) # for common.py
+    return run
+
+def gen_chords(ncards:int, scratch:str):
+    '''Return a function that writes the first ncards chord cards into a scratch directory'''
+    def run():
+        outdir = fcset_gen.outdir
+        fcset_gen.outdir = scratch
+        try:
+            cards = itertools.islice(fcset_gen.chord_cards(), ncards)
+            with contextlib.redirect_stdout(io.StringIO()):
+                fcset_gen.write_cards(cards)
+        finally:
+            fcset_gen.outdir = outdir
+    return run
+
+def fixed(fn):
+    '''A factory for a benchmark that needs no setup'''
+    return lambda: fn
+
+def with_fixture(make, call):
+    '''A factory for a benchmark that calls call(fixture), where the fixture is made by make()'''
+    def factory():
+        fixture = make()
+        return lambda: call(fixture)
+    return factory
+
+def exercise_1000() -> Score:
+    return exercise(1000, NoteRange(Note('C3'), Note('C6')), KeyAndMode(Key.Eflat, Mode.major),
+                    chord_size=2, rests=0.1, seed=1)
+
+def fc_chord_xml() -> str:
+    return fc_chord(Note('C4'), ChordType.dom7, Voicing.blues, Key.C).xml
+
+def benchmarks(scratch:str, quick:bool=False) -> dict:
+    '''name -> factory that sets up a benchmark and returns the function to time
+
+    Nothing is set up until a factory is called, so listing the benchmarks or running a few is quick.
+    The slower ones write files under scratch.
+    '''
+    kam = KeyAndMode(Key.Eflat, Mode.major)
+    nr = NoteRange(Note('C4'), Note('C5'))
+    out = {
+        'note_by_name': fixed(lambda: Note('C#4')),
+        'note_by_name_uncached': fixed(uncached_note),
+        'note_by_midi_with_key': fixed(lambda: Note(61, kam)),
+    }
+    for voicing in Voicing:
+        out[f'chord_{voicing.name}'] = with_fixture(
+            lambda voicing=voicing: [Chord(t, voicing).parts for t in ChordType],
+            lambda types: [chord(Note('C4'), Key.C, parts) for parts in types])
+    out.update({
+        'score_score': with_fixture(chord_score, lambda s: s.score()),
+        'to_xml_music21': with_fixture(chord_score, lambda s: s.toXml('music21')),
+        'to_xml_native': with_fixture(chord_score, lambda s: s.toXml('native')),
+        'to_midi_music21': with_fixture(chord_score, lambda s: s.toMidi('music21')),
+        'to_midi_native': with_fixture(chord_score, lambda s: s.toMidi('native')),
+        'to_wav': with_fixture(chord_score, lambda s: s.toOutputs().get('wav')),
+        'sanitize': with_fixture(lambda: chord_score().toXml('music21'), sanitize),
+        'fc_randnote': fixed(lambda: fc_randnote(nr).xml),
+        'fc_interval': fixed(lambda: fc_interval(Note('C4'), 'M3').xml),
+        'fc_chord': fixed(fc_chord_xml),
+        'exercise_1000_xml_native': with_fixture(exercise_1000, lambda ex: ex.writeXml(io.StringIO(), 'native')),
+        'exercise_1000_score': with_fixture(exercise_1000, lambda ex: ex.score()),
+        'scheduler_next_review': scheduler_cycle,
+        'fc_chord_native': fixed(with_writer('native', fc_chord_xml)),
+        'gen_chords_60': lambda: gen_chords(60, scratch),
+        'gen_chords_60_native': lambda: with_writer('native', gen_chords(60, scratch)),
+        'xml_generator_xmltree': lambda: xml_generator('xmltree', scratch),
+        'xml_generator_music21': lambda: xml_generator('music21', scratch),
+    })
+    if quick:
+        out = {name: factory for (name, factory) in out.items() if not name.startswith(('gen_', 'xml_generator_'))}
+    return out
+
+def run(names=None, quick:bool=False, min_time:float=0.2, repeats:int=5) -> dict:
+    '''Return name -> seconds per call for the benchmarks (all, or the given names)'''
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        for (name, factory) in benchmarks(scratch, quick).items():
+            if names and name not in names:
+                continue
+            fn = factory()
+            fn() # warm up: imports, caches
+            results[name] = timed(fn, min_time, repeats)
+    return results
+
+def compare(results:dict, baseline:dict, threshold:float) -> list:
+    '''Return the names of the benchmarks that took more than threshold times their baseline'''
+    return [name for (name, seconds) in results.items()
+            if name in baseline and seconds > baseline[name] * threshold]
+
+def report(results:dict, baseline:dict, regressions:list):
+    print(f"{'benchmark':28} {'ms per call':>12} {'baseline':>12} {'ratio':>7}")
+    for (name, seconds) in results.items():
+        line = f"{name:28} {seconds * 1e3:12.4f}"
+        if name in baseline:
+            line += f" {baseline[name] * 1e3:12.4f} {seconds / baseline[name]:6.2f}x"
+        if name in regressions:
+            line += "  REGRESSED"
+        print(line)
+
+def load_baseline(filename:str) -> dict:
+    try:
+        with open(filename) as f:
+            return json.load(f)['results']
+    except FileNotFoundError:
+        return {}
+
+def save_baseline(filename:str, results:dict):
+    with open(filename, "w") as f:
+        json.dump({'python': sys.version.split()[0], 'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                   'results': results}, f, indent=2)
+        f.write("\n")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Time the main paths and compare them with a baseline")
+    parser.add_argument("names", nargs="*", help="benchmarks to run (default all)")
+    parser.add_argument("--baseline", default=baseline_filename, help="baseline JSON file (default %(default)s)")
+    parser.add_argument("--save", action="store_true", help="save the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=1.5,
+                        help="fail if a benchmark takes more than this times its baseline (default %(default)s)")
+    parser.add_argument("--quick", action="store_true", help="skip the slow benchmarks, and time less")
+    parser.add_argument("--list", action="store_true", help="list the benchmarks")
+    args = parser.parse_args(argv)
+    if args.list:
+        print("\n".join(benchmarks(tempfile.gettempdir())))
+        return 0
+
+    (min_time, repeats) = (0.05, 3) if args.quick else (0.2, 5)
+    results = run(args.names, args.quick, min_time, repeats)
+    baseline = {} if args.save else load_baseline(args.baseline)
+    regressions = compare(results, baseline, args.threshold)
+    report(results, baseline, regressions)
+    if args.save:
+        save_baseline(args.baseline, {**load_baseline(args.baseline), **results})
+        print(f"saved baseline in {args.baseline}")
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed past {args.threshold}x: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+import json
+
+try:
+    import benchmark
+except:
+    from flashcard import benchmark
+
+def test_timed():
+    calls = []
+    seconds = benchmark.timed(lambda: calls.append(1), min_time=0.001, repeats=3)
+    assert seconds > 0
+    assert len(calls) >= 3
+
+def test_compare():
+    baseline = {'a': 1.0, 'b': 1.0}
+    results = {'a': 1.4, 'b': 1.6, 'c': 100.0} # c isn't in the baseline
+    assert benchmark.compare(results, baseline, 1.5) == ['b']
+
+def test_save_and_regress(tmp_path, capsys):
+    filename = str(tmp_path / "baseline.json")
+    assert benchmark.main(["note_by_name", "sanitize", "--quick", "--save", "--baseline", filename]) == 0
+    with open(filename) as f:
+        saved = json.load(f)['results']
+    assert sorted(saved) == ['note_by_name', 'sanitize']
+
+    # pretend the baseline was much faster
+    with open(filename, "w") as f:
+        json.dump({'results': {name: seconds / 1000 for (name, seconds) in saved.items()}}, f)
+    assert benchmark.main(["note_by_name", "--quick", "--baseline", filename]) == 1
+    assert "REGRESSED" in capsys.readouterr().out
+
+def test_fixtures_built_on_demand(monkeypatch, capsys):
+    # listing, or running one cheap benchmark, doesn't build the others' fixtures
+    def fail(*args, **kwargs):
+        raise AssertionError("built a fixture that wasn't asked for")
+    monkeypatch.setattr(benchmark.scheduler, "synthetic_deck", fail)
+    monkeypatch.setattr(benchmark, "exercise_1000", fail)
+    monkeypatch.setattr(benchmark, "chord_score", fail)
+    assert benchmark.main(["--list"]) == 0
+    assert "scheduler_next_review" in capsys.readouterr().out
+    assert list(benchmark.run(["note_by_name"], quick=True, min_time=0.001, repeats=1)) == ['note_by_name']
@@ -0,0 +1,162 @@
+# card database - the cards in SQLite, to find them by what they are rather than by their paths
+#
+# Each card is a row with its MusicXML and MIDI, and indexed columns for what the card shows:
+#
+#   key         e.g. 'chords/keysig-Bb/blues/dom7/Fdom7' (the same keys as pack.py)
+#   kind        'single', 'interval' or 'chord'
+#   keysig      key signature, e.g. 'Bb' ('C' for the cards without one)
+#   mode        'major', ...
+#   sharps      sharps in the key signature, negative for flats
+#   voicing     chord voicing name, e.g. 'blues'
+#   ctype       chord type name, e.g. 'dom7'
+#   root        the note, or the root of the interval or chord, e.g. 'F#'
+#   octave      its octave
+#   interval    e.g. 'M3'
+#   difficulty  'simple', or 'full' if the card shows double sharps or flats
+#
+# The database is in WAL mode, so any number of readers can query it while it's being written.
+#
+#   with CardDB("output/cards.db") as db:
+#       for card in db.query(ctype='dom7', voicing='blues', keysig=flat_keys):
+#           print(card['key'], card['description'])
+#       xml = db.xml('chords/keysig-Bb/blues/dom7/Fdom7')
+
+import os
+import sqlite3
+
+columns = ('kind', 'keysig', 'mode', 'sharps', 'voicing', 'ctype', 'root', 'octave', 'interval', 'difficulty')
+
+# key signatures with flats or sharps, for queries such as keysig=flat_keys
+flat_keys = ('F', 'Bb', 'Eb', 'Ab', 'Db', 'Gb', 'Cb')
+sharp_keys = ('G', 'D', 'A', 'E', 'B', 'F#', 'C#')
+
+schema = f"""
+create table if not exists cards (
+    key text primary key,
+    {', '.join(f'{c} {"integer" if c in ("sharps", "octave") else "text"}' for c in columns)},
+    title text,
+    description text,
+    xml blob,
+    midi blob
+);
+create index if not exists cards_kind on cards (kind, keysig);
+create index if not exists cards_chord on cards (ctype, voicing, keysig);
+create index if not exists cards_keysig on cards (keysig, mode);
+create index if not exists cards_root on cards (root, octave);
+create index if not exists cards_interval on cards (interval, keysig);
+create index if not exists cards_difficulty on cards (difficulty);
+"""
+
+class CardDB(object):
+    '''A card database; use as a context manager, or call close()
+
+    Cards added with add() (or db[key] = entry, from fcset_gen) are written in batches, and
+    committed by commit() or close().
+    '''
+    batch_size = 500
+
+    def __init__(self, filename:str, readonly:bool=False):
+        self.filename = filename
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{filename}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+            # written from fcset_gen's writer thread
+            self.conn = sqlite3.connect(filename, check_same_thread=False)
+            self.conn.execute("pragma journal_mode=wal")
+            self.conn.execute("pragma synchronous=normal")
+            self.conn.executescript(schema)
+        self.conn.row_factory = sqlite3.Row
+        self.pending = []
+        self.count = 0
+
+    def add(self, key:str, fields:dict, xml:bytes, midi:bytes=None, title:str=None, description:str=None):
+        '''Add (or replace) a card; fields has any of the columns'''
+        self.pending.append((key, *(fields.get(c) for c in columns), title, description, xml, midi))
+        self.count += 1
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def __setitem__(self, key:str, entry:dict):
+        '''Add a card from its fcset_gen write_cards() entry (under the entry's 'key'), if it has one'''
+        if 'fields' in entry:
+            self.add(entry['key'], entry['fields'], entry['xml'], entry.get('midi'), entry.get('title'), entry.get('description'))
+
+    def flush(self):
+        if self.pending:
+            names = ('key',) + columns + ('title', 'description', 'xml', 'midi')
+            self.conn.executemany(f"insert or replace into cards ({', '.join(names)}) "
+                                  f"values ({', '.join('?' * len(names))})", self.pending)
+            self.pending = []
+
+    def commit(self):
+        self.flush()
+        self.conn.commit()
+
+    def query(self, order:str='key', limit:int=None, **where) -> list:
+        '''Return the cards (without their XML and MIDI) matching all the given columns
+
+        Each value can be a single value, or a list, tuple or set of values any of which matches,
+        e.g. query(ctype='dom7', voicing='blues', keysig=flat_keys).  Rows act like dicts.
+        '''
+        clauses = []
+        params = []
+        for (column, value) in where.items():
+            if column not in columns and column != 'key':
+                raise ValueError(f"no column '{column}'")
+            if isinstance(value, (list, tuple, set, frozenset)):
+                value = list(value)
+                clauses.append(f"{column} in ({', '.join('?' * len(value))})")
+                params += value
+            elif value is None:
+                clauses.append(f"{column} is null")
+            else:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if order not in columns + ('key',):
+            raise ValueError(f"can't order by '{order}'")
+        sql = f"select key, {', '.join(columns)}, title, description from cards"
+        if clauses:
+            sql += " where " + " and ".join(clauses)
+        sql += f" order by {order}"
+        if limit is not None:
+            sql += f" limit {int(limit)}"
+        return self.conn.execute(sql, params).fetchall()
+
+    def get(self, key:str, column:str):
+        row = self.conn.execute(f"select {column} from cards where key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0]
+
+    def xml(self, key:str) -> str:
+        '''Return a card's MusicXML; raises KeyError if there's no such card'''
+        return bytes(self.get(key, 'xml')).decode()
+
+    def midi(self, key:str) -> bytes:
+        '''Return a card's MIDI (None if it wasn't stored)'''
+        midi = self.get(key, 'midi')
+        return None if midi is None else bytes(midi)
+
+    def __len__(self) -> int:
+        return self.conn.execute("select count(*) from cards").fetchone()[0]
+
+    def __contains__(self, key:str) -> bool:
+        return self.conn.execute("select 1 from cards where key = ?", (key,)).fetchone() is not None
+
+    def close(self):
+        if self.conn is None:
+            return
+        self.commit()
+        self.conn.close()
+        self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and self.conn is not None:
+            # leave the database as it was
+            self.pending = []
+            self.conn.rollback()
+        self.close()
@@ -0,0 +1,50 @@
+import pytest
+
+try:
+    import carddb
+except:
+    from flashcard import carddb
+
+def chord(root:str, keysig:str, sharps:int, ctype:str='dom7') -> dict:
+    return {'kind': 'chord', 'keysig': keysig, 'mode': 'major', 'sharps': sharps, 'voicing': 'blues',
+            'ctype': ctype, 'root': root, 'octave': 3, 'difficulty': 'simple'}
+
+def test_query(tmp_path):
+    filename = str(tmp_path / "cards.db")
+    with carddb.CardDB(filename) as db:
+        db.add('chords/keysig-Bb/blues/dom7/Fdom7', chord('F', 'Bb', -2), b"<Fdom7/>", b"MThd F", "F7")
+        db.add('chords/keysig-D/blues/dom7/Adom7', chord('A', 'D', 2), b"<Adom7/>", None, "A7")
+        db.add('chords/keysig-Eb/blues/maj7/Bbmaj7', chord('Bb', 'Eb', -3, 'maj7'), b"<Bbmaj7/>")
+        db.add('single/keysig-C/C4', {'kind': 'single', 'keysig': 'C', 'root': 'C', 'octave': 4}, b"<C4/>")
+        # a reader sees what's been committed while the writer's still open
+        with carddb.CardDB(filename, readonly=True) as reader:
+            assert len(reader) == 0
+            db.commit()
+            assert len(reader) == 4
+
+    with carddb.CardDB(filename, readonly=True) as db:
+        assert [c['key'] for c in db.query(ctype='dom7', keysig=carddb.flat_keys)] == ['chords/keysig-Bb/blues/dom7/Fdom7']
+        assert [c['root'] for c in db.query(kind='chord', order='root')] == ['A', 'Bb', 'F']
+        assert [c['key'] for c in db.query(voicing=None)] == ['single/keysig-C/C4']
+        assert len(db.query(kind='chord', limit=2)) == 2
+        fdom7 = db.query(root='F')[0]
+        assert (fdom7['title'], fdom7['sharps'], fdom7['octave']) == ("F7", -2, 3)
+        assert db.xml('chords/keysig-Bb/blues/dom7/Fdom7') == "<Fdom7/>"
+        assert db.midi('chords/keysig-Bb/blues/dom7/Fdom7') == b"MThd F"
+        assert db.midi('chords/keysig-D/blues/dom7/Adom7') is None
+        assert 'single/keysig-C/C4' in db
+        with pytest.raises(KeyError):
+            db.xml('single/keysig-C/D4')
+        with pytest.raises(ValueError):
+            db.query(xml=b"<C4/>")
+
+def test_rollback(tmp_path):
+    filename = str(tmp_path / "cards.db")
+    with carddb.CardDB(filename) as db:
+        db.add('single/keysig-C/C4', {'kind': 'single'}, b"<C4/>")
+    with pytest.raises(RuntimeError):
+        with carddb.CardDB(filename) as db:
+            db.add('single/keysig-C/D4', {'kind': 'single'}, b"<D4/>")
+            raise RuntimeError("stopped part way")
+    with carddb.CardDB(filename, readonly=True) as db:
+        assert [c['key'] for c in db.query()] == ['single/keysig-C/C4']
@@ -2,6 +2,13 @@
 
 from enum import Enum
 
+import numpy
+
+try:
+    import intervals
+except:
+    from flashcard import intervals
+
 # see https://en.wikipedia.org/wiki/Chord_(music) -- not all are here
 # The goal isn't to produce all possible chords, but to cover the main ones.
 
@@ -15,6 +22,9 @@ from enum import Enum
 # and hit the gear in the upper right and "Difficulty" setting.
 double_accidental_quickfix = True
 
+__all__ = ['ChordType', 'standard_voicing', 'blues_voicing', 'blues_tight_voicing',
+           'Voicing', 'Chord', 'ChordTable', 'catalog']
+
 
 class ChordType(Enum):
     # triads
@@ -147,3 +157,75 @@ class Chord(object):
         parts = voicing(type)
         self.parts = parts
 
+
+
+# Chord tables: realize a chord for many roots at once.
+#
+# A voicing of a chord type compiles to a table of (diatonic step, semitone) offsets from the root,
+# one row per note, so realizing every root is just adding the root to each row.  The pitches
+# don't depend on the key signature, so the whole catalog can be computed once and shared.
+
+_step_semitones = numpy.array(intervals.step_semitones)
+
+class ChordTable(object):
+    '''The offsets of the notes of a chord type in a voicing
+
+    parts is the number of notes in each part, in the order chord() returns them (treble first).
+    '''
+    def __init__(self, type:ChordType, voicing:Voicing):
+        self.type = type
+        self.voicing = voicing
+        self.parts = None
+        voiced = Chord(type, voicing).parts
+        if voiced is None:
+            return
+        offsets = []
+        for part in reversed(voiced):
+            for change in part:
+                changes = change if isinstance(change, tuple) else (change,)
+                parsed = [intervals.parse(c) for c in changes]
+                offsets.append((sum(p[0] for p in parsed), sum(p[1] for p in parsed)))
+        self.parts = tuple(len(part) for part in reversed(voiced))
+        self.steps = numpy.array([o[0] for o in offsets])
+        self.semitones = numpy.array([o[1] for o in offsets])
+
+    def realize(self, roots:list) -> tuple:
+        '''Return (MIDI numbers, names) for the chord on each root, or None if there's no such voicing
+
+        roots are (step, alter, octave) tuples.  MIDI numbers are an array with a row per root;
+        names are, per root, a list of parts, each a list of music21-style note names (e.g. 'E-4').
+        '''
+        if self.parts is None:
+            return None
+        root_steps = numpy.array([intervals.steps.index(r[0]) for r in roots])
+        root_alters = numpy.array([r[1] for r in roots])
+        root_octaves = numpy.array([r[2] for r in roots])
+        diatonic = (root_octaves * 7 + root_steps)[:, None] + self.steps
+        semitone = (root_octaves * 12 + _step_semitones[root_steps] + root_alters)[:, None] + self.semitones
+        (octaves, steps) = numpy.divmod(diatonic, 7)
+        alters = semitone - (octaves * 12 + _step_semitones[steps])
+        midi = semitone + 12
+        names = []
+        for (row_steps, row_alters, row_octaves) in zip(steps.tolist(), alters.tolist(), octaves.tolist()):
+            row = [intervals.steps[s] + intervals.accidental_text[a] + str(o) for (s, a, o) in zip(row_steps, row_alters, row_octaves)]
+            parts = []
+            start = 0
+            for size in self.parts:
+                parts.append(row[start:start + size])
+                start += size
+            names.append(parts)
+        return (midi, names)
+
+def catalog(roots:list) -> dict:
+    '''Realize every chord type in every voicing on every root
+
+    Returns {(voicing, type): (MIDI numbers, names)} as from ChordTable.realize(), leaving out
+    voicings that don't exist for a chord type.
+    '''
+    out = {}
+    for voicing in Voicing:
+        for type in ChordType:
+            realized = ChordTable(type, voicing).realize(roots)
+            if realized is not None:
+                out[(voicing, type)] = realized
+    return out
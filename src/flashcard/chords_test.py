@@ -15,3 +15,23 @@ def test_chords_nones():
     for voicing in chords.Voicing:
         ch = chords.Chord(None, voicing)
         assert ch.parts == None, f"expected parts==None for unmapped chord type for {voicing} voicing"
+
+def test_catalog_matches_chord():
+    try:
+        from score import Note, chord, root_notes
+    except:
+        from flashcard.score import Note, chord, root_notes
+    roots = [Note(k + '3') for k in root_notes] + [Note('F##4'), Note('C-5')]
+    table = chords.catalog([(n.step, n.alter, n.octave) for n in roots])
+    for voicing in chords.Voicing:
+        for ch_type in chords.ChordType:
+            parts = chords.Chord(ch_type, voicing).parts
+            if parts is None:
+                assert (voicing, ch_type) not in table
+                continue
+            (midi, names) = table[(voicing, ch_type)]
+            assert midi.shape[0] == len(roots)
+            for (root, row, root_names) in zip(roots, midi.tolist(), names):
+                expected = chord(root, None, parts)
+                assert root_names == [[n.name for n in part] for part in expected]
+                assert row == [n.midi() for part in expected for n in part]
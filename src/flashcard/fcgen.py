@@ -2,12 +2,25 @@
 
 import random
 
+import numpy
+
 try:
     from score import *
     from chords import *
+    import chords
+    import musicxml
+    import score
 except:
     from flashcard.score import *
     from flashcard.chords import *
+    from flashcard import chords
+    from flashcard import musicxml
+    from flashcard import score
+
+# the generators, and everything from score and chords, as before
+__all__ = ['NoteRange', 'random_note', 'fc_randnote', 'fc_notes', 'fc_interval', 'fc_chord',
+           'Session', 'random_choices', 'random_cards', 'exercise_lengths', 'exercise', 'select_key', 'select_mode'
+           ] + score.__all__ + chords.__all__
 
 class NoteRange(object):
     def __init__(self, low:Note, high:Note):
@@ -24,30 +37,40 @@ def random_note(range:NoteRange, keyAndMode:KeyAndMode=None):
     chosen = random.randint(low, high)
     return Note(chosen, keyAndMode)
 
-def fc_randnote(range:NoteRange, clef:Clef=None, keyAndMode:KeyAndMode=None) -> typing.Tuple[str, str]:
+def fc_randnote(range:NoteRange, clef:Clef=None, keyAndMode:KeyAndMode=None) -> Outputs:
     '''Generate musicXml and MIDI for a random quarter note in the given range, clef, and mode'''
     note = random_note(range, keyAndMode)
     tick = Tick(Duration(1), {note})
     seq = Sequence(clef, [tick])
     return Score((seq,), keyAndMode=keyAndMode).toOutputs()
 
-def fc_notes(notes:list[Note], clef:Clef=None, keyAndMode:KeyAndMode=None) -> typing.Tuple[str, str]:
+def fc_notes(notes:list[Note], clef:Clef=None, keyAndMode:KeyAndMode=None) -> Outputs:
     '''Generate musicXml and MIDI for the given sequence of notes, as quarter notes, in the given range, clef, and mode'''
     tick = Tick(Duration(1), notes)
     seq = Sequence(clef, [tick])
     return Score((seq,), keyAndMode=keyAndMode).toOutputs()
 
-def fc_interval(n1:Note, interval:int, clef:Clef=None, keyAndMode:KeyAndMode=None) -> typing.Tuple[str, str]:
+def fc_interval(n1:Note, interval:int, clef:Clef=None, keyAndMode:KeyAndMode=None) -> Outputs:
     '''Create musicXml and MIDI for the given interval vertically, given note, interval#, clef, and mode'''
-    n2 = Note(n1.note.pitch.transpose(interval))
+    n2 = n1.transpose(interval)
     tick = Tick(Duration(1), {n1, n2})
     seq = Sequence(clef, [tick])
     return Score((seq,), keyAndMode=keyAndMode).toOutputs()
 
-def fc_chord(n1:Note, type:ChordType, voicing:Voicing, key: Key) -> typing.Tuple[str, str]:
-    '''Create musicXml and MIDI for the given chord, given root, type, voicing, and key signature'''
-    ch = Chord(type, voicing)
-    parts = chord(n1, key, ch.parts)
+def fc_chord(n1:Note, type:ChordType, voicing:Voicing, key: Key, parts:list=None,
+             difficulty:Difficulty=Difficulty.full) -> Outputs:
+    '''Create musicXml and MIDI for the given chord, given root, type, voicing, and key signature
+
+    parts can give the note names per part if they're already known (e.g. from chords.catalog()).
+    Returns None if there's no such chord, or it's too hard for the difficulty.
+    '''
+    if parts is not None:
+        parts = [[Note(name) for name in part] for part in parts]
+        if difficulty != Difficulty.full and too_hard(parts, KeyAndMode(key, Mode.major), difficulty) is not None:
+            return None
+    else:
+        ch = Chord(type, voicing)
+        parts = chord(n1, key, ch.parts, difficulty)
     # parts is a list of parts, where a part is a list of notes.
     if parts is None:
         return None
@@ -64,6 +87,113 @@ def fc_chord(n1:Note, type:ChordType, voicing:Voicing, key: Key) -> typing.Tuple
     return Score(seqs, keyAndMode=KeyAndMode(key, Mode.major)).toOutputs()
 
 
+class Session(object):
+    '''Random card choices for a quiz session: a seeded generator, and (if unique) the cards already drawn'''
+    def __init__(self, seed:int=None, unique:bool=False):
+        self.rng = numpy.random.default_rng(seed)
+        self.unique = unique
+        self.seen = {} # (low, high, keys, modes) -> set of card numbers drawn
+
+def random_choices(range:NoteRange, keys:set[Key], modes:set[Mode], count:int, session:Session) -> list:
+    '''Draw count random (Note, KeyAndMode) pairs at once
+
+    Each card is numbered within the range × keys × modes, and all the numbers are drawn in one
+    step.  With a unique session, cards already drawn in the session aren't drawn again; it's a
+    ValueError to ask for more cards than are left.
+    '''
+    # sets of enums iterate in a different order each run, so sort them to make the seed mean something
+    keys = sorted(keys, key=lambda k: k.name)
+    modes = sorted(modes, key=lambda m: m.value)
+    low = range.low.midi()
+    high = range.high.midi()
+    total = (high - low + 1) * len(keys) * len(modes)
+    if session.unique:
+        seen = session.seen.setdefault((low, high, tuple(keys), tuple(modes)), set())
+        left = numpy.setdiff1d(numpy.arange(total), numpy.fromiter(seen, int, len(seen)))
+        if count > len(left):
+            raise ValueError(f"only {len(left)} unused cards left in the session, not {count}")
+        drawn = session.rng.choice(left, size=count, replace=False)
+        seen.update(drawn.tolist())
+    else:
+        drawn = session.rng.integers(0, total, size=count)
+    (rest, mode_numbers) = numpy.divmod(drawn, len(modes))
+    (note_numbers, key_numbers) = numpy.divmod(rest, len(keys))
+
+    kams = {}
+    choices = []
+    for (n, k, m) in zip((note_numbers + low).tolist(), key_numbers.tolist(), mode_numbers.tolist()):
+        kam = kams.get((k, m))
+        if kam is None:
+            kam = kams[(k, m)] = KeyAndMode(keys[k], modes[m])
+        choices.append((Note(n, kam), kam))
+    return choices
+
+def random_cards(range:NoteRange, keys:set[Key], modes:set[Mode], count:int, clef:Clef=None,
+                 seed:int=None, session:Session=None):
+    '''Generate count random note cards (Outputs), drawn all at once; the same seed gives the same cards
+
+    Pass a Session to keep drawing from one generator across calls, e.g. to avoid repeats.
+    '''
+    if session is None:
+        session = Session(seed)
+    for (note, kam) in random_choices(range, keys, modes, count, session):
+        yield Score((Sequence(clef, [Tick(Duration(1), {note})]),), keyAndMode=kam).toOutputs()
+
+# note lengths for exercises, in quarters: eighth, quarter, dotted quarter, half, dotted half, whole
+exercise_lengths = (0.5, 1, 1.5, 2, 3, 4)
+
+def fillable(measure:float, lengths:list) -> set:
+    '''What's left of a measure (from measure down to 0) that some of the lengths add up to exactly'''
+    can = {0: True}
+    def fill(left):
+        if left not in can:
+            can[left] = any([fill(left - length) for length in lengths if length <= left])
+        return can[left]
+    fill(measure)
+    return {left for (left, ok) in can.items() if ok}
+
+def exercise(count:int, range:NoteRange, keyAndMode:KeyAndMode=None, chord_size:int=1, clef:Clef=None,
+             lengths=exercise_lengths, rests:float=0.0, seed:int=None, session:Session=None) -> Score:
+    '''Generate a sight-reading exercise: a Score of count random notes (or chords) in the range
+
+    Each tick has chord_size notes (fewer if a note's drawn twice), or is a rest with probability
+    rests, and a random length that fits in what's left of its measure, and leaves what the lengths
+    can fill (so lengths=(1.5, 1) never leaves half a beat).  In a key, the notes are
+    in its scale.  All the random numbers are drawn at once; the same seed gives the same exercise.
+    Write a long one with Score.writeXml(f, 'native'), which writes a measure at a time without
+    building a music21 stream.
+    '''
+    if session is None:
+        session = Session(seed)
+    pitches = numpy.arange(range.low.midi(), range.high.midi() + 1)
+    if keyAndMode is not None:
+        pitches = pitches[numpy.isin(pitches % 12, list(keyAndMode.diatonic))]
+    measure = musicxml.beats * 4 / musicxml.beat_type
+    lengths = sorted(lengths)
+    ends = fillable(measure, lengths)
+    if len(pitches) == 0 or measure not in ends:
+        raise ValueError(f"no exercise with notes in {range} and lengths {lengths}")
+    drawn = pitches[session.rng.integers(0, len(pitches), size=(count, chord_size))].tolist()
+    is_rest = (session.rng.random(count) < rests).tolist()
+    picks = session.rng.random(count).tolist()
+
+    durations = {length: Duration(length) for length in lengths}
+    notes = {} # midi -> Note, spelled in the key
+    ticks = []
+    left = measure
+    for (pick, rest, chord_midis) in zip(picks, is_rest, drawn):
+        fits = [length for length in lengths if length <= left and left - length in ends]
+        length = fits[int(pick * len(fits))]
+        left = left - length if left > length else measure
+        if rest:
+            ticks.append(Tick(durations[length]))
+            continue
+        for midi in chord_midis:
+            if midi not in notes:
+                notes[midi] = Note(midi, keyAndMode)
+        ticks.append(Tick(durations[length], {notes[midi] for midi in chord_midis}))
+    return Score([Sequence(clef, ticks)], keyAndMode=keyAndMode)
+
 def select_key(key:set[Key]):
     '''Select a random key from the given set'''
     return random.choice(list(key))
@@ -26,20 +26,17 @@ def test_random_note():
     assert isinstance(randnote, Note)
 
 
-@pytest.mark.skip # Note() isn't working correctly yet regarding sharps & flats based on mode
 @pytest.mark.timeout(10)
 def test_random_note_coverage():
     # generate random notes until we hit them all
     nr = NoteRange(Note('C4'), Note('C5'))
     notes = set() # set of names of notes found
-    # while len(notes) < len(Key) + 1:
-    for n in range(1,100):
+    while len(notes) < 13:
         randnote = random_note(nr, keyAndMode=KeyAndMode(Key('C'), Mode.minor))
-        name = str(randnote)
-        notes.update((name,))
-    
-    # show what notes we found
-    assert str(sorted(notes)) == ""
+        notes.add(str(randnote))
+
+    # C minor has 3 flats, so the notes not in the key are flats too
+    assert sorted(notes) == ['A-4', 'A4', 'B-4', 'B4', 'C4', 'C5', 'D-4', 'D4', 'E-4', 'E4', 'F4', 'G-4', 'G4']
 
 def test_fc_randnote():
     nr = NoteRange(Note('C4'), Note('C5'))
@@ -113,6 +110,13 @@ def test_fc_interval():
         assert re.search(pattern, xml, flags=re.DOTALL) != None, (
             f"didn't find {expnote}{expoctave}[{expalter}] for {notename} {interval} interval")
 
+def test_fc_interval_semitones():
+    # an int is semitones, spelled the way music21 spells it
+    for (semitones, expnote, expoctave, expalter) in ((4, 'E', 4, 0), (6, 'F', 4, +1), (10, 'B', 4, -1), (-3, 'A', 3, 0)):
+        xml, midi = fc_interval(Note('C4'), semitones)
+        pattern = xml_ll_note_re(expnote, expoctave, expalter)
+        assert re.search(pattern, xml, flags=re.DOTALL) != None, f"didn't find {expnote}{expoctave}[{expalter}] for {semitones} semitones"
+
 def test_fc_chord():
     table = (
         # root, type, voicing, key, [expected notes]
@@ -156,3 +160,70 @@ def test_select_mode():
     while len(selected_modes) < len(Mode):
         m = select_mode(modes)
         selected_modes.update((m,))
+
+def test_random_choices_seeded():
+    nr = NoteRange(Note('C4'), Note('C5'))
+    keys = {Key.C, Key.D, Key.Eflat}
+    modes = {Mode.major, Mode.minor}
+    first = random_choices(nr, keys, modes, 200, Session(seed=7))
+    again = random_choices(nr, keys, modes, 200, Session(seed=7))
+    assert [(n.name, str(kam)) for (n, kam) in first] == [(n.name, str(kam)) for (n, kam) in again]
+    assert all(nr.low.midi() <= n.midi() <= nr.high.midi() for (n, kam) in first)
+    assert {str(kam) for (n, kam) in first} == {'C major', 'D major', 'Eb major', 'C minor', 'D minor', 'Eb minor'}
+
+def test_random_choices_unique():
+    nr = NoteRange(Note('C4'), Note('B4'))
+    session = Session(seed=1, unique=True)
+    drawn = random_choices(nr, {Key.C, Key.G}, {Mode.major}, 20, session)
+    drawn += random_choices(nr, {Key.C, Key.G}, {Mode.major}, 4, session)
+    assert len(drawn) == 24
+    (seen,) = session.seen.values()
+    assert seen == set(range(24))
+    with pytest.raises(ValueError):
+        random_choices(nr, {Key.C, Key.G}, {Mode.major}, 1, session)
+
+def test_random_cards():
+    nr = NoteRange(Note('C4'), Note('C5'))
+    cards = list(random_cards(nr, {Key.C}, {Mode.major}, 10, clef=Clef.Treble, seed=3))
+    assert len(cards) == 10
+    assert [c.score.sequences[0].ticks[0].notes for c in cards] == \
+        [c.score.sequences[0].ticks[0].notes for c in random_cards(nr, {Key.C}, {Mode.major}, 10, seed=3)]
+    assert cards[0].xml.startswith('<?xml')
+
+def test_exercise():
+    nr = NoteRange(Note('C3'), Note('C6'))
+    kam = KeyAndMode(Key.Eflat, Mode.major)
+    s = exercise(500, nr, kam, chord_size=2, rests=0.2, seed=5)
+    ticks = s.sequences[0].ticks
+    assert len(ticks) == 500
+    assert [str(t) for t in ticks] == [str(t) for t in exercise(500, nr, kam, chord_size=2, rests=0.2, seed=5).sequences[0].ticks]
+    rests = [t for t in ticks if not t.notes]
+    assert 50 < len(rests) < 150
+    notes = {n for t in ticks for n in t.notes}
+    assert all(nr.low.midi() <= n.midi() <= nr.high.midi() and n.midi() % 12 in kam.diatonic for n in notes)
+    assert all(1 <= len(t.notes) <= 2 for t in ticks if t.notes)
+    assert {t.duration.quarterLength for t in ticks} == set(exercise_lengths)
+
+    # no tick crosses a barline
+    offset = 0
+    for t in ticks:
+        assert offset % 4 + t.duration.quarterLength <= 4
+        offset += t.duration.quarterLength
+
+    with pytest.raises(ValueError):
+        exercise(10, nr, lengths=(8,))
+
+def test_exercise_lengths_fill_measures():
+    nr = NoteRange(Note('C4'), Note('C5'))
+    # lengths that can't fill a 4/4 measure exactly
+    for lengths in ((3,), (1.5,), (2.5,), (3, 2.5)):
+        with pytest.raises(ValueError):
+            exercise(20, nr, lengths=lengths)
+    # lengths that can, if they're picked so as not to leave half a beat
+    for lengths in ((1.5, 1), (1.5, 2), (3, 1), (0.5, 3)):
+        ticks = exercise(200, nr, lengths=lengths, seed=2).sequences[0].ticks
+        assert len(ticks) == 200
+        offset = 0
+        for t in ticks:
+            assert offset % 4 + t.duration.quarterLength <= 4, lengths
+            offset += t.duration.quarterLength
@@ -1,22 +1,72 @@
 # generate sets of flashcards
 
-# NOTE: no coverage testing for this file.  It takes a long time generating lots of files.
-# If refactored perhaps parts could be tested.
+# NOTE: no coverage testing for the full run.  It takes a long time generating lots of files.
+# fcset_gen_test.py exercises the card writers on a small slice of the deck instead.
 
-import shutil
+import argparse
+import collections
+import hashlib
+import itertools
+import json
+import multiprocessing
 import os
+import queue
+import shutil
+import sys
+import threading
+import time
 
 try:
-    from score import *
-    from chords import *
-    from fcgen import *
+    from score import Difficulty, Key, KeyAndMode, Mode, Note, chord, circle, root_notes, too_hard
+    from chords import Chord, ChordType, Voicing, catalog
+    from fcgen import fc_chord, fc_interval, fc_notes
+    import instrument
+    import carddb
+    import pack
+    import score
+    import store
+    import web
 except:
-    from flashcard.score import *
-    from flashcard.chords import *
-    from flashcard.fcgen import *
+    from flashcard.score import Difficulty, Key, KeyAndMode, Mode, Note, chord, circle, root_notes, too_hard
+    from flashcard.chords import Chord, ChordType, Voicing, catalog
+    from flashcard.fcgen import fc_chord, fc_interval, fc_notes
+    from flashcard import instrument
+    from flashcard import carddb
+    from flashcard import pack
+    from flashcard import score
+    from flashcard import store
+    from flashcard import web
 
 
 deleteDirs = True
+outdir = "output"
+
+# Incremental mode: instead of deleting everything and starting again, keep a manifest of what
+# went into each card, regenerate only the cards whose inputs changed, and remove files for cards
+# that are gone.
+incremental = False
+manifest_filename = "manifest.json" # in outdir
+generator_version = 3 # bump this when the same inputs should give different files
+made_dirs = set() # directories mkdirs() made (or kept) in this run
+
+# Pack mode: write each deck (singles, intervals, chords) into one pack file in outdir (see pack.py)
+# instead of an XML and an HTML file per card.
+packing = False
+
+# Dedupe mode: each distinct XML body is written once into a content-addressed store (see store.py)
+# in outdir, and the cards' XML files are hard links to it.
+content_store = None # a store.ContentStore in dedupe mode
+
+# Database mode: write each card, with its MIDI and what it shows, into one SQLite database (see
+# carddb.py) instead of an XML and an HTML file per card.
+database = None # a carddb.CardDB in database mode
+
+# what the workers render for each card (MIDI too in database mode, and a WAV preview with --audio)
+formats = ('xml',)
+
+# cards with double sharps or flats are skipped before they're rendered (see Card.too_hard)
+# FIXME: Difficulty.simple kills diminished chords and alt chords, some of which have double flats.
+difficulty = Difficulty.simple
 
 def mkdir(dir:str):
     if deleteDirs:
@@ -27,26 +77,388 @@ def mkdir(dir:str):
         pass
 
 def mkdirs(dir:str):
-    htmldir = f"output/html/{dir}"
-    xmldir = f"output/xml/{dir}"
-    mkdir(htmldir)
-    mkdir(xmldir)
+    htmldir = f"{outdir}/html/{dir}"
+    xmldir = f"{outdir}/xml/{dir}"
+    if packing or database is not None:
+        return htmldir, xmldir # the names are the cards' keys, but there are no files
+    if incremental:
+        os.makedirs(htmldir, exist_ok=True)
+        os.makedirs(xmldir, exist_ok=True)
+    else:
+        mkdir(htmldir)
+        mkdir(xmldir)
+    made_dirs.update((os.path.normpath(htmldir), os.path.normpath(xmldir)))
     return htmldir, xmldir
 
-def fcset_write(scoreXml:str, title:str, html_filename:str, xml_filename:str, description=None):
-    # ignore scores with double-sharp or flat-flat accidentals
-    # FIXME: this kills diminished chords and alt chords, some of which have double flats.
-    # TODO: use RE as it's faster
-    if "<accidental>double-sharp</accidental>" in scoreXml:
-        return
-    if "<accidental>flat-flat</accidental>" in scoreXml:
-        return
-    with open(xml_filename, "w") as f:
-        f.write(scoreXml)
-    web.gen_musichtml(title, html_filename, xml_filename, description)
-
-def gen_singles():
-    ''' generate single note flashcards'''
+def audio_filename(xml_filename:str) -> str:
+    '''A card's audio preview goes next to its XML'''
+    return os.path.splitext(xml_filename)[0] + ".wav"
+
+def fcset_write(scoreXml:str, title:str, html_filename:str, xml_filename:str, description=None,
+                pages:list=None, wav:bytes=None) -> str:
+    '''Write a card's XML, HTML and (if given) audio preview, and return a hash of the XML
+
+    If pages is given, the HTML page is added to it to write later with web.gen_musichtml_batch().
+    '''
+    data = scoreXml.encode()
+    if content_store is not None:
+        digest = content_store.add(data, xml_filename)
+    else:
+        web.write_file(xml_filename, data)
+        digest = hashlib.sha1(data).hexdigest()
+    if wav is not None:
+        web.write_file(audio_filename(xml_filename), wav)
+    if pages is not None:
+        pages.append((title, html_filename, xml_filename, description))
+    else:
+        web.gen_musichtml(title, html_filename, xml_filename, description)
+    return digest
+
+accidentals = {-2: 'bb', -1: 'b', 0: '', 1: '#', 2: '##'}
+
+class Card(object):
+    '''One flashcard in the set: what to render, and where to write it'''
+    def __init__(self, kind:str, notename:str, html_filename:str, xml_filename:str,
+                 key:Key=None, mode:Mode=None, interval:str=None,
+                 voicing:Voicing=None, ctype:ChordType=None, title:str=None, description:str=None,
+                 parts:list=None):
+        self.kind = kind            # 'single', 'interval' or 'chord'
+        self.notename = notename    # the note, or the root of the interval or chord
+        self.key = key              # key signature (None for the plain C singles and intervals)
+        self.mode = mode
+        self.interval = interval
+        self.voicing = voicing
+        self.ctype = ctype
+        self.html_filename = html_filename
+        self.xml_filename = xml_filename
+        self.title = xml_filename if title is None else title
+        self.description = description
+        self.parts = parts          # chord note names per part, if already realized (see chords.catalog)
+
+    def __str__(self):
+        return f"Card({self.kind} {self.xml_filename})"
+
+    def keyAndMode(self):
+        if self.mode is not None:
+            return KeyAndMode(self.key, self.mode)
+        if self.kind == 'chord':
+            return KeyAndMode(self.key, Mode.major) # as fc_chord() does
+        return None
+
+    def notes(self) -> list:
+        '''Return the card's notes: lists of Notes sounding together, one per clef (None if there's no such card)'''
+        root = Note(self.notename)
+        match self.kind:
+            case 'single':
+                return [[root]]
+            case 'interval':
+                return [[root, root.transpose(self.interval)]]
+            case 'chord':
+                if self.parts is not None:
+                    return [[Note(name) for name in part] for part in self.parts]
+                return chord(root, self.key, Chord(self.ctype, self.voicing).parts)
+
+    def too_hard(self, difficulty:Difficulty) -> str:
+        '''Return why the card is too hard for the difficulty, or None'''
+        notes = self.notes()
+        if notes is None or difficulty == Difficulty.full:
+            return None
+        return too_hard(notes, self.keyAndMode(), difficulty)
+
+    def fields(self) -> dict:
+        '''Return what the card shows, as carddb columns'''
+        note = Note(self.notename)
+        kam = self.keyAndMode()
+        return {
+            'kind': self.kind,
+            'keysig': 'C' if kam is None else kam.tonic.value,
+            'mode': 'major' if kam is None else kam.mode.name,
+            'sharps': 0 if kam is None else kam.sharps,
+            'voicing': None if self.voicing is None else self.voicing.name,
+            'ctype': None if self.ctype is None else self.ctype.name,
+            'root': note.step + accidentals[note.alter],
+            'octave': note.octave,
+            'interval': self.interval,
+            'difficulty': 'simple' if self.too_hard(Difficulty.simple) is None else 'full',
+        }
+
+    def spec(self) -> str:
+        '''Return a hash of everything that goes into the card's files, for the incremental manifest'''
+        fields = [generator_spec(), self.kind, self.notename, self.html_filename, self.xml_filename,
+                  self.interval, self.title, self.description, self.parts]
+        fields += [None if e is None else e.name for e in (self.key, self.mode, self.voicing, self.ctype)]
+        return hashlib.sha1(json.dumps(fields).encode()).hexdigest()
+
+    def render(self):
+        '''Return the Outputs for this card, or None if there's no such card'''
+        kam = None if self.mode is None else KeyAndMode(self.key, self.mode)
+        match self.kind:
+            case 'single':
+                return fc_notes((Note(self.notename),), keyAndMode=kam)
+            case 'interval':
+                return fc_interval(Note(self.notename), self.interval, keyAndMode=kam)
+            case 'chord':
+                return fc_chord(Note(self.notename), self.ctype, self.voicing, self.key, parts=self.parts)
+
+def generator_spec() -> list:
+    '''What besides the card itself goes into its files'''
+    global _generator_spec
+    if _generator_spec is None:
+        with open(web.template_filename, "rb") as f:
+            template_hash = hashlib.sha1(f.read()).hexdigest()
+        _generator_spec = [generator_version, template_hash]
+    # audio previews are only in the spec when they're on, so turning them on or off rewrites the cards
+    return _generator_spec + [score.xml_writer, difficulty.value] + (['wav'] if 'wav' in formats else [])
+
+_generator_spec = None
+
+# stages here for instrument to time, besides score's and web's: instrument.enable(instrumented_stages)
+instrumented_stages = (
+    (sys.modules[__name__], 'too_hard', 'too_hard', None), # as Card.too_hard() calls it
+    (sys.modules[__name__], 'fcset_write', 'fcset_write', instrument.card_size),
+)
+
+def manifest_key(card:Card) -> str:
+    return os.path.relpath(card.xml_filename, outdir)
+
+def card_key(manifest_key:str) -> str:
+    '''Return a card's pack or database key from its manifest key'''
+    # 'xml/chords/keysig-C/standard/maj7/Cmaj7.xml' -> 'chords/keysig-C/standard/maj7/Cmaj7'
+    return os.path.splitext(os.path.relpath(manifest_key, 'xml'))[0].replace(os.sep, '/')
+
+# Cards go through a pipeline of stages, each in its own thread, with a bounded queue between them:
+#
+#   enumerate -> filter -> render -> write
+#
+# Rendering is the CPU work (spread over worker processes if jobs > 1) and writing is the I/O, so
+# they overlap.  Cards the filter rejects go straight to the writer, to be counted.  The queue
+# depths are sampled as the cards go through: a queue that's usually full means the stage after
+# it is the bottleneck.
+queue_size = 64 # cards waiting between stages
+done = None # end of the cards, on a pipeline queue
+
+def store_card(card:Card, reason:str, rendered:dict, pages:list=None) -> dict:
+    '''Write a card's files (if it has any); return its manifest entry
+
+    The entry has 'skipped' with the reason if the card was too hard, or 'output' with a hash of
+    its XML and 'html' with its HTML file (relative to outdir) if it was written, and 'audio'
+    with its WAV file if that was rendered too.  If pages is
+    given, the HTML page is added to it rather than written (see fcset_write).
+
+    In pack mode nothing is written: the entry has 'packed' with the encoded XML instead (encoded
+    by render_card, in the worker), and the card's 'title' and 'description', for Packs to add to
+    a pack.  In database mode the entry has
+    the card's 'key', 'fields', 'xml' and 'midi', for the CardDB to add.
+    '''
+    if reason is not None:
+        return {'skipped': reason}
+    if rendered is None:
+        return {}
+    if packing:
+        return {'packed': rendered['packed'], 'title': card.title, 'description': card.description}
+    xml = rendered['xml']
+    if database is not None:
+        return {'key': card_key(manifest_key(card)), 'fields': card.fields(), 'xml': xml.encode(),
+                'midi': rendered.get('midi'), 'title': card.title, 'description': card.description}
+    wav = rendered.get('wav')
+    output = fcset_write(xml, card.title, card.html_filename, card.xml_filename,
+                         description=card.description, pages=pages, wav=wav)
+    entry = {'output': output, 'html': os.path.relpath(card.html_filename, outdir)}
+    if wav is not None:
+        entry['audio'] = os.path.relpath(audio_filename(card.xml_filename), outdir)
+    return entry
+
+def render_card(card:Card) -> dict:
+    '''Return a card's outputs (format -> output, for the formats), or None if there's no such card
+
+    In pack mode it's just 'packed', the XML compressed for the pack, so the compression is done by
+    the workers rather than the single writer thread (and less is sent back from them).
+    '''
+    outputs = card.render()
+    if outputs is None:
+        return None
+    # only the formats asked for are rendered; MIDI isn't needed for the files
+    rendered = {f: outputs.get(f) for f in formats}
+    if packing:
+        return {'packed': pack.encode(rendered['xml'])}
+    return rendered
+
+def write_card(card:Card, pages:list=None) -> dict:
+    '''Filter, render and write one card, without the pipeline; return its manifest entry (see store_card)'''
+    reason = card.too_hard(difficulty)
+    rendered = None if reason is not None else render_card(card)
+    return store_card(card, reason, rendered, pages)
+
+def render_chunk(cards:list[Card]):
+    '''Worker: render a chunk of cards, and return (pid, seconds, outputs per card, instrument stats)'''
+    start = time.perf_counter()
+    rendered = []
+    for card in cards:
+        instrument.section(f"{card.kind}s")
+        rendered.append(render_card(card))
+    return (os.getpid(), time.perf_counter() - start, rendered, instrument.take())
+
+def init_worker(xml_writer:str, midi_writer:str, card_formats:tuple, card_packing:bool=False,
+                instrumented:bool=False):
+    '''Worker: use the same settings as the parent, even if the worker wasn't forked from it'''
+    global formats, packing
+    score.xml_writer = xml_writer
+    score.midi_writer = midi_writer
+    formats = card_formats
+    packing = card_packing
+    if instrumented:
+        instrument.enable(instrumented_stages)
+        instrument.take() # drop anything a forked worker inherited; the parent has it
+
+def chunks(cards, size:int):
+    '''Split an iterable of cards into lists of (at most) the given size'''
+    it = iter(cards)
+    while chunk := list(itertools.islice(it, size)):
+        yield chunk
+
+class Pipeline(object):
+    '''Runs cards through the stages; see write_cards()'''
+    queues = ('filter', 'render', 'write') # named for the stage that takes from them
+
+    def __init__(self, jobs:int, chunksize:int, add):
+        self.jobs = jobs
+        self.chunksize = chunksize
+        self.add = add # add(manifest key, entry), called from the writer
+        self.queue = {name: queue.Queue(queue_size) for name in self.queues}
+        self.depths = {name: [] for name in self.queues}
+        self.errors = []
+        self.running = True
+        self.stats = {} # worker pid -> [cards, seconds]
+
+    def take(self, name:str):
+        '''Yield what comes off a queue until the end of the cards'''
+        q = self.queue[name]
+        while (item := q.get()) is not done:
+            yield item
+
+    def stage(self, work, name:str, next:str):
+        '''Thread: run a stage, and pass on the end of the cards even if it fails'''
+        try:
+            work()
+        except BaseException as e:
+            self.errors.append(e)
+            if name is not None:
+                for item in self.take(name):
+                    pass # drain the queue so the stage before doesn't wait forever
+        finally:
+            if next is not None:
+                self.queue[next].put(done)
+
+    def enumerate(self, cards):
+        for card in cards:
+            if self.errors:
+                break
+            self.queue['filter'].put(card)
+
+    def filter(self):
+        for card in self.take('filter'):
+            instrument.section(f"{card.kind}s")
+            reason = card.too_hard(difficulty)
+            if reason is None:
+                self.queue['render'].put(card)
+            else:
+                self.queue['write'].put((card, reason, None))
+
+    def render(self):
+        cards = chunks(self.take('render'), self.chunksize)
+        if self.jobs <= 1:
+            for chunk in cards:
+                (pid, seconds, rendered, timings) = render_chunk(chunk)
+                instrument.merge(timings)
+                for (card, outputs) in zip(chunk, rendered):
+                    self.queue['write'].put((card, None, outputs))
+            return
+
+        sent = collections.deque() # chunks handed to the pool, in order
+        def send():
+            for chunk in cards:
+                sent.append(chunk)
+                yield chunk
+        with multiprocessing.Pool(self.jobs, initializer=init_worker,
+                                  initargs=(score.xml_writer, score.midi_writer, formats, packing, instrument.enabled)) as pool:
+            for (pid, seconds, rendered, timings) in pool.imap(render_chunk, send()):
+                chunk = sent.popleft()
+                instrument.merge(timings)
+                for (card, outputs) in zip(chunk, rendered):
+                    self.queue['write'].put((card, None, outputs))
+                worker = self.stats.setdefault(pid, [0, 0.0])
+                worker[0] += len(chunk)
+                worker[1] += seconds
+
+    def write(self):
+        pages = []
+        section = None
+        for (card, reason, rendered) in self.take('write'):
+            if pages and f"{card.kind}s" != section:
+                # write the pages of the section before, so their time is recorded under it
+                web.gen_musichtml_batch(pages)
+                pages = []
+            section = f"{card.kind}s"
+            instrument.section(section)
+            self.add(manifest_key(card), store_card(card, reason, rendered, pages))
+            if len(pages) >= self.chunksize or (pages and self.queue['write'].empty()):
+                web.gen_musichtml_batch(pages)
+                pages = []
+        if pages:
+            web.gen_musichtml_batch(pages)
+
+    def monitor(self):
+        while self.running:
+            for name in self.queues:
+                self.depths[name].append(self.queue[name].qsize())
+            time.sleep(0.05)
+
+    def run(self, cards):
+        threads = [
+            threading.Thread(target=self.stage, args=(lambda: self.enumerate(cards), None, 'filter')),
+            threading.Thread(target=self.stage, args=(self.filter, 'filter', 'render')),
+            threading.Thread(target=self.stage, args=(self.write, 'write', None)),
+            threading.Thread(target=self.monitor),
+        ]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        self.stage(self.render, 'render', 'write')
+        for t in threads[:-1]:
+            t.join()
+        self.running = False
+        threads[-1].join()
+        if self.errors:
+            raise self.errors[0]
+
+    def report(self, elapsed:float):
+        for (n, (pid, (ncards, seconds))) in enumerate(sorted(self.stats.items()), 1):
+            print(f"  worker {n} (pid {pid}): {ncards} cards in {seconds:.1f}s, {ncards / seconds:.1f} cards/s")
+        depths = ", ".join(f"{name} {sum(d) / max(len(d), 1):.1f} (max {max(d, default=0)})"
+                           for (name, d) in self.depths.items())
+        print(f"  {elapsed:.1f}s; average queue depths, of {queue_size}: {depths}")
+
+def write_cards(cards, jobs:int=1, chunksize:int=16, manifest:dict=None) -> collections.Counter:
+    '''Write the given cards through the pipeline, rendering in a pool of worker processes if jobs > 1
+
+    Returns how many cards were skipped, by reason.  If manifest is given (a dict, or Packs), each
+    card's entry is added to it (see store_card).  A CardDB can be the manifest in database mode.
+    '''
+    skipped = collections.Counter()
+    def add(key:str, entry:dict):
+        if 'skipped' in entry:
+            skipped[entry['skipped']] += 1
+        if manifest is not None:
+            manifest[key] = entry
+
+    start = time.perf_counter()
+    pipeline = Pipeline(jobs, chunksize, add)
+    pipeline.run(cards)
+    pipeline.report(time.perf_counter() - start)
+    return skipped
+
+def single_cards():
+    '''Make the directories for the single note flashcards, and yield their cards'''
     dir = "single/keysig-C"
     htmldir, xmldir = mkdirs(dir)
     print(f"generating singles in {dir}")
@@ -55,8 +467,7 @@ def gen_singles():
             notename = n.name + octave
             html_fname = f"{htmldir}/{notename}.html"
             xml_fname = f"{xmldir}/{notename}.xml"
-            (scoreXml, scoreMidi) = fc_notes((Note(notename),))
-            fcset_write(scoreXml, xml_fname, html_fname, xml_fname)
+            yield Card('single', notename, html_fname, xml_fname)
 
     for k in circle:
         if k == 'C':
@@ -70,21 +481,21 @@ def gen_singles():
             notename = n.name
             html_fname = f"{htmldir}/{notename}.html"
             xml_fname = f"{xmldir}/{notename}.xml"
-            (scoreXml, scoreMidi) = fc_notes({Note(notename)}, keyAndMode=kam)
-            fcset_write(scoreXml, xml_fname, html_fname, xml_fname)
-
-def gen_intervals():
-    intervals = (
-        ('m3', 'minor3rd'),
-        ('M3', '3rd'),
-        ('P4', '4th'),
-        ('d5', 'flat5th'),
-        ('P5', '5th'),
-        ('M6', '6th'),
-        ('P8', 'octave')
-    )
-
-    for interval in intervals:    
+            yield Card('single', notename, html_fname, xml_fname, key=Key(k), mode=Mode.major)
+
+intervals = (
+    ('m3', 'minor3rd'),
+    ('M3', '3rd'),
+    ('P4', '4th'),
+    ('d5', 'flat5th'),
+    ('P5', '5th'),
+    ('M6', '6th'),
+    ('P8', 'octave')
+)
+
+def interval_cards():
+    '''Make the directories for the interval flashcards, and yield their cards'''
+    for interval in intervals:
         print(f"generating {interval[1]} intervals")
         dir = f"intervals/keysig-C/{interval[1]}"
         htmldir, xmldir = mkdirs(dir)
@@ -93,9 +504,8 @@ def gen_intervals():
                 notename = n.name + octave
                 html_fname = f"{htmldir}/{notename}.html"
                 xml_fname = f"{xmldir}/{notename}.xml"
-                (scoreXml, scoreMidi) = fc_interval(Note(notename), interval[0])
-                fcset_write(scoreXml, xml_fname, html_fname, xml_fname)
-        
+                yield Card('interval', notename, html_fname, xml_fname, interval=interval[0])
+
         for k in root_notes:
             if k == 'C':
                 continue # already handled above
@@ -107,50 +517,231 @@ def gen_intervals():
                 notename = n.name
                 html_fname = f"{htmldir}/{notename}.html"
                 xml_fname = f"{xmldir}/{notename}.xml"
-                (scoreXml, scoreMidi) = fc_interval(Note(notename), interval[0], keyAndMode=kam)
-                fcset_write(scoreXml, xml_fname, html_fname, xml_fname)
+                yield Card('interval', notename, html_fname, xml_fname, key=Key(k), mode=Mode.major,
+                           interval=interval[0])
 
-def gen_chords():
+def chord_cards():
+    '''Make the directories for the chord flashcards, and yield their cards'''
     mkdirs("chords")
     dropkeys = ('Gb', 'G', 'G#', 'Ab', 'A', 'A#','Bb', 'B')
+    roots = []
+    for k in root_notes:
+        octave = '4'  # default octave
+        if k in dropkeys:
+            octave = '3'  # for "drop keys" use a lower octave
+        roots.append(k + octave)
+    # the notes don't depend on the key signature, so realize every chord once up front
+    chord_notes = catalog([(n.step, n.alter, n.octave) for n in map(Note, roots)])
     for keysig in circle:
         print(f"generating chords in {keysig}")
         key = Key(keysig)
         for voicing in Voicing:
             for ctype in ChordType:
-                found = False
+                if (voicing, ctype) not in chord_notes:
+                    continue # no such voicing, so no directory either
+                (midi, names) = chord_notes[(voicing, ctype)]
                 dir = f"chords/keysig-{keysig}/{voicing.name}/{ctype.name}"
                 htmldir, xmldir = mkdirs(dir)
-                for k in root_notes:
-                    octave = '4'  # default octave
-                    if k in dropkeys:
-                        octave = '3'  # for "drop keys" use a lower octave
-                    notename = k + octave
+                for (k, notename, parts) in zip(root_notes, roots, names):
                     # print(f"  {notename} {ctype.name} {voicing.name} in {keysig}")
-                    note = Note(notename)
                     html_fname = f"{htmldir}/{k}{ctype.name}.html"
                     xml_fname = f"{xmldir}/{k}{ctype.name}.xml"
-                    outputs = fc_chord(note, ctype, voicing, key)
-                    if outputs is None:
-                        continue
-                    (scoreXml, scoreMidi) = outputs
-                    found = True
-                    fcset_write(scoreXml, "fcset-chord", html_fname, xml_fname, description=f"{k}{ctype.value} {voicing.name} voicing in {keysig}")
-                if not found:
-                    os.rmdir(htmldir)
-                    os.rmdir(xmldir)
+                    yield Card('chord', notename, html_fname, xml_fname, key=key,
+                               voicing=voicing, ctype=ctype, title="fcset-chord",
+                               description=f"{k}{ctype.value} {voicing.name} voicing in {keysig}",
+                               parts=parts)
+
+class Packs(object):
+    '''Add packed cards to one pack per deck in a directory, as write_cards() adds their entries
+    with packs[manifest key] = entry.  Use as a context manager, or call close().'''
+    def __init__(self, dir:str):
+        self.dir = dir
+        self.writers = {}
+        self.count = 0
+        os.makedirs(dir, exist_ok=True)
+
+    def __setitem__(self, key:str, entry:dict):
+        if 'packed' not in entry:
+            return
+        key = card_key(key)
+        deck = key.split('/')[0]
+        writer = self.writers.get(deck)
+        if writer is None:
+            writer = self.writers[deck] = pack.PackWriter(f"{self.dir}/{deck}{pack.suffix}")
+        writer.add(key, entry['packed'], entry['title'], entry['description'])
+        self.count += 1
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for writer in self.writers.values():
+            writer.__exit__(exc_type, exc_value, traceback)
+
+def load_manifest() -> dict:
+    '''Return the manifest from the last run: manifest key -> entry, with the card's 'spec' added'''
+    try:
+        with open(f"{outdir}/{manifest_filename}") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def remove_orphans(manifest:dict) -> int:
+    '''Remove files under outdir that no card in the manifest wrote, and empty directories mkdirs()
+    didn't make.  Returns the number of files removed.'''
+    keep = set()
+    for (key, entry) in manifest.items():
+        if 'output' in entry:
+            keep.update((os.path.normpath(f"{outdir}/{key}"), os.path.normpath(f"{outdir}/{entry['html']}")))
+            if 'audio' in entry:
+                keep.add(os.path.normpath(f"{outdir}/{entry['audio']}"))
+    removed = 0
+    for top in (f"{outdir}/html", f"{outdir}/xml"):
+        for (dirpath, dirnames, filenames) in os.walk(top, topdown=False):
+            for fname in filenames:
+                path = os.path.normpath(os.path.join(dirpath, fname))
+                if path not in keep:
+                    os.remove(path)
+                    removed += 1
+            if os.path.normpath(dirpath) not in made_dirs and not os.listdir(dirpath):
+                os.rmdir(dirpath)
+    return removed
+
+def update_cards(cards, jobs:int=1) -> tuple:
+    '''Write the cards and their manifest.  In incremental mode, only write the cards whose inputs
+    changed since the last run (or whose files are missing), and remove files for cards that are gone.
+
+    Returns (skipped by reason, #unchanged cards, #files removed).
+    '''
+    old = load_manifest() if incremental else {}
+    manifest = {}
+    skipped = collections.Counter()
+    unchanged = 0
+    specs = {}
+
+    def changed():
+        nonlocal unchanged
+        for card in cards:
+            key = manifest_key(card)
+            spec = card.spec()
+            entry = old.get(key)
+            if entry is not None and entry.get('spec') == spec and (
+                    'output' not in entry or
+                    (os.path.exists(card.xml_filename) and os.path.exists(card.html_filename) and
+                     ('audio' not in entry or os.path.exists(f"{outdir}/{entry['audio']}")))):
+                manifest[key] = entry
+                unchanged += 1
+                if 'skipped' in entry:
+                    skipped[entry['skipped']] += 1
+                continue
+            specs[key] = spec
+            yield card
+
+    skipped.update(write_cards(changed(), jobs, manifest=manifest))
+    for (key, spec) in specs.items():
+        manifest[key]['spec'] = spec
+    removed = remove_orphans(manifest)
+    web.write_file(f"{outdir}/{manifest_filename}", json.dumps(manifest, indent=0, sort_keys=True))
+    return (skipped, unchanged, removed)
+
+def gen_singles(jobs:int=1):
+    ''' generate single note flashcards'''
+    return write_cards(single_cards(), jobs)
+
+def gen_intervals(jobs:int=1):
+    return write_cards(interval_cards(), jobs)
+
+def gen_chords(jobs:int=1):
+    return write_cards(chord_cards(), jobs)
 
 if __name__ == "__main__":
-    import web
+    parser = argparse.ArgumentParser(description="Generate a suite of flashcards")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="number of worker processes (default 1, 0 for one per CPU)")
+    parser.add_argument("--xml-writer", choices=("music21", "native"), default=score.xml_writer,
+                        help="how to write MusicXML (default %(default)s)")
+    parser.add_argument("--midi-writer", choices=("music21", "native"), default=score.midi_writer,
+                        help="how to write MIDI, for --db (default %(default)s)")
+    parser.add_argument("--incremental", "-i", action="store_true",
+                        help="only regenerate cards whose inputs changed since the last run")
+    parser.add_argument("--pack", action="store_true",
+                        help=f"write each deck into one {pack.suffix} file in {outdir} instead of a file per card")
+    parser.add_argument("--dedupe", action="store_true",
+                        help=f"write each distinct card XML once into {outdir}/store, and hard link the cards to it")
+    parser.add_argument("--db", metavar="FILE",
+                        help="write the cards, with their MIDI, into a SQLite database (see carddb.py) "
+                             "instead of a file per card")
+    parser.add_argument("--audio", action="store_true",
+                        help="also write a WAV preview of each card next to its XML (see audio.py)")
+    parser.add_argument("--difficulty", choices=[d.value for d in Difficulty], default=difficulty.value,
+                        help="skip cards that are too hard, e.g. with double sharps or flats (default %(default)s)")
+    parser.add_argument("--profile", nargs="?", const=f"{outdir}/profile.json", metavar="FILE",
+                        help="time each stage, print a table at the end, and save it as JSON in FILE "
+                             "(default %(const)s)")
+    args = parser.parse_args()
+    score.xml_writer = args.xml_writer
+    score.midi_writer = args.midi_writer
+    difficulty = Difficulty(args.difficulty)
+    incremental = args.incremental
+    packing = args.pack
+    if incremental and packing:
+        parser.error("--incremental and --pack can't be used together")
+    if args.dedupe and packing:
+        parser.error("--dedupe and --pack can't be used together")
+    if args.db and (packing or incremental or args.dedupe):
+        parser.error("--db can't be used with --pack, --incremental or --dedupe")
+    if args.audio and (packing or args.db):
+        parser.error("--audio can't be used with --pack or --db")
+    if args.audio:
+        formats = ('xml', 'wav')
+    if args.dedupe:
+        content_store = store.ContentStore(f"{outdir}/store")
+    if args.db:
+        # written under a temporary name, so anyone reading the old database can go on reading it
+        db_tmp_filename = f"{args.db}.tmp{os.getpid()}"
+        database = carddb.CardDB(db_tmp_filename)
+        formats = ('xml', 'midi')
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+    if args.profile:
+        instrument.enable(instrumented_stages)
 
     # Generate a suite of flashcards
 
     deleteDirs = True # delete all files first
     # deleteDirs = False # TEMP: don't delete all files first (don't check in uncommented)
-    mkdirs("") # clear the decks (empties xml and html dirs if they exist)
-
-    gen_singles()
-    gen_intervals()
-    gen_chords()
+    mkdirs("") # clear the decks (empties xml and html dirs if they exist), unless incremental
 
-    print(f"{web.file_count} flashcards generated")
+    # one pool for the whole set, so the workers stay busy across sections
+    cards = itertools.chain(single_cards(), interval_cards(), chord_cards())
+    if packing:
+        with Packs(outdir) as packs:
+            skipped = write_cards(cards, jobs, manifest=packs)
+        print(f"{packs.count} flashcards packed into {', '.join(sorted(packs.writers))} in {outdir}")
+    elif database is not None:
+        try:
+            with database:
+                skipped = write_cards(cards, jobs, manifest=database)
+        except:
+            os.remove(db_tmp_filename)
+            raise
+        os.replace(db_tmp_filename, args.db)
+        print(f"{database.count} flashcards written to {args.db}")
+    else:
+        (skipped, unchanged, removed) = update_cards(cards, jobs)
+        if incremental:
+            print(f"{unchanged} flashcards unchanged, {removed} old files removed")
+        print(f"{web.file_count} flashcards generated")
+        if content_store is not None:
+            pruned = content_store.prune({e['output'] for e in load_manifest().values() if 'output' in e})
+            print(f"{content_store.report()}; {pruned} unused bodies removed")
+    if skipped:
+        reasons = ", ".join(f"{n} {reason}" for (reason, n) in skipped.most_common())
+        print(f"{sum(skipped.values())} cards skipped as too hard for {difficulty.value}: {reasons}")
+    if args.profile:
+        instrument.report()
+        instrument.save(args.profile)
+        print(f"saved the stage timings in {args.profile}")
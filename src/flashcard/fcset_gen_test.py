@@ -0,0 +1,220 @@
+import itertools
+import os
+import pytest
+
+try:
+    import fcset_gen
+    import web
+except:
+    from flashcard import fcset_gen
+    from flashcard import web
+
+def read_tree(root:str) -> dict:
+    '''map each file under root (relative path) to its contents, with root itself blanked out'''
+    files = {}
+    for (dirpath, dirnames, filenames) in os.walk(root):
+        for fname in filenames:
+            path = os.path.join(dirpath, fname)
+            with open(path) as f:
+                files[os.path.relpath(path, root)] = f.read().replace(root, "ROOT")
+    return files
+
+def gen_slice(root:str, jobs:int) -> int:
+    '''generate a small slice of the deck under root, and return the number of HTML files written'''
+    fcset_gen.outdir = root
+    start_count = web.file_count
+    cards = itertools.chain(
+        itertools.islice(fcset_gen.single_cards(), 20),
+        itertools.islice(fcset_gen.chord_cards(), 20),
+    )
+    fcset_gen.write_cards(cards, jobs=jobs, chunksize=4)
+    return web.file_count - start_count
+
+@pytest.mark.timeout(120)
+def test_write_cards_parallel(tmpdir, monkeypatch):
+    monkeypatch.setattr(fcset_gen, "outdir", None)
+    serial = str(tmpdir.join("serial"))
+    parallel = str(tmpdir.join("parallel"))
+    serial_count = gen_slice(serial, jobs=1)
+    parallel_count = gen_slice(parallel, jobs=2)
+
+    assert serial_count == 40
+    assert parallel_count == serial_count
+    assert read_tree(parallel) == read_tree(serial)
+
+def xml_too_hard(xml:str) -> str:
+    '''the check fcset_write used to make on the rendered XML'''
+    for reason in ('double-sharp', 'flat-flat'):
+        if f"<accidental>{reason}</accidental>" in xml:
+            return reason
+    return None
+
+# checking every card takes a while, so by default check every Nth; set FULL_CATALOG=1 to check them all
+catalog_stride = 1 if os.environ.get('FULL_CATALOG') else 7
+
+@pytest.mark.timeout(600)
+def test_too_hard_matches_xml(tmpdir, monkeypatch):
+    monkeypatch.setattr(fcset_gen, "outdir", str(tmpdir))
+    monkeypatch.setattr(fcset_gen.score, "xml_writer", "native")
+    cards = itertools.chain(fcset_gen.single_cards(), fcset_gen.interval_cards(), fcset_gen.chord_cards())
+    skipped = 0
+    for card in itertools.islice(cards, 0, None, catalog_stride):
+        outputs = card.render()
+        expected = None if outputs is None else xml_too_hard(outputs.xml)
+        assert card.too_hard(fcset_gen.Difficulty.simple) == expected, str(card)
+        assert card.too_hard(fcset_gen.Difficulty.full) is None
+        skipped += expected is not None
+    assert skipped > 0
+
+def test_write_cards_skipped(tmpdir, monkeypatch):
+    monkeypatch.setattr(fcset_gen, "outdir", str(tmpdir))
+    cards = [card for card in fcset_gen.chord_cards() if card.ctype == fcset_gen.ChordType.dim7][:30]
+    start_count = web.file_count
+    skipped = fcset_gen.write_cards(cards)
+    assert sum(skipped.values()) > 0
+    assert set(skipped) <= {'double-sharp', 'flat-flat'}
+    assert web.file_count - start_count + sum(skipped.values()) == len(cards)
+
+def test_incremental(tmpdir, monkeypatch):
+    root = str(tmpdir)
+    monkeypatch.setattr(fcset_gen, "outdir", root)
+    monkeypatch.setattr(fcset_gen, "incremental", True)
+    monkeypatch.setattr(fcset_gen, "made_dirs", set())
+
+    def run(cards):
+        start_count = web.file_count
+        (skipped, unchanged, removed) = fcset_gen.update_cards(cards)
+        return (web.file_count - start_count, unchanged, removed)
+
+    def cards():
+        return list(itertools.islice(fcset_gen.single_cards(), 10))
+
+    assert run(cards()) == (10, 0, 0)
+    before = read_tree(root)
+    assert run(cards()) == (0, 10, 0)
+    assert read_tree(root) == before
+
+    # a changed card is rewritten, a missing file is regenerated
+    changed = cards()
+    changed[0].description = "changed"
+    os.remove(changed[1].html_filename)
+    assert run(changed) == (2, 8, 0)
+
+    # cards that are gone have their files removed
+    assert run(cards()[:7]) == (1, 6, 6)
+    assert len([f for f in read_tree(root) if f.endswith(".html")]) == 7
+    assert not any(f.endswith(".tmp") or ".tmp" in f for f in read_tree(root))
+
+@pytest.mark.timeout(60)
+def test_pipeline_error(tmpdir, monkeypatch):
+    monkeypatch.setattr(fcset_gen, "outdir", str(tmpdir))
+    monkeypatch.setattr(fcset_gen, "queue_size", 2)
+    def render_card(card):
+        if card.notename == 'C4':
+            raise RuntimeError("can't render")
+        return {'xml': "<xml/>"}
+    monkeypatch.setattr(fcset_gen, "render_card", render_card)
+    # a failure part way through stops the pipeline, rather than hanging it
+    with pytest.raises(RuntimeError):
+        fcset_gen.write_cards(fcset_gen.single_cards(), chunksize=1)
+
+def test_pipeline_depths(tmpdir, monkeypatch, capsys):
+    monkeypatch.setattr(fcset_gen, "outdir", str(tmpdir))
+    manifest = {}
+    fcset_gen.write_cards(itertools.islice(fcset_gen.single_cards(), 30), manifest=manifest)
+    assert len(manifest) == 30
+    assert "average queue depths" in capsys.readouterr().out
+
+@pytest.mark.timeout(120)
+def test_instrument_sections(tmpdir, monkeypatch):
+    monkeypatch.setattr(fcset_gen, "outdir", str(tmpdir))
+    fcset_gen.instrument.take()
+    fcset_gen.instrument.enable(fcset_gen.instrumented_stages)
+    try:
+        cards = itertools.chain(itertools.islice(fcset_gen.single_cards(), 5),
+                                itertools.islice(fcset_gen.chord_cards(), 5))
+        fcset_gen.write_cards(cards, jobs=2, chunksize=2)
+    finally:
+        fcset_gen.instrument.disable()
+    rows = {(r['stage'], r['section']): r for r in fcset_gen.instrument.summary()}
+    fcset_gen.instrument.take()
+    # importing fcset_gen didn't change what instrument times by default
+    assert not set(fcset_gen.instrumented_stages) & set(fcset_gen.instrument.stages)
+    # rendering happened in the workers, and their timings came back
+    assert rows[('toXml', 'singles')]['calls'] == 5
+    assert rows[('toXml', 'chords')]['calls'] == 5
+    assert rows[('toXml', 'all')]['calls'] == 10
+    assert rows[('fcset_write', 'all')]['calls'] == 10
+    assert rows[('write_file', 'all')]['bytes'] > 0
+    assert rows[('fcset_write', 'all')]['bytes'] == rows[('toXml', 'all')]['bytes'] > 0
+    # each batch of HTML pages is from one section, and there are no empty batches
+    assert rows[('gen_musichtml', 'singles')]['calls'] + rows[('gen_musichtml', 'chords')]['calls'] \
+        == rows[('gen_musichtml', 'all')]['calls'] <= 10
+
+def test_dedupe(tmpdir, monkeypatch):
+    monkeypatch.setattr(fcset_gen, "outdir", None)
+    plain = str(tmpdir.join("plain"))
+    deduped = str(tmpdir.join("deduped"))
+    gen_slice(plain, jobs=1)
+    content_store = fcset_gen.store.ContentStore(os.path.join(deduped, "store"))
+    monkeypatch.setattr(fcset_gen, "content_store", content_store)
+    gen_slice(deduped, jobs=1)
+
+    files = read_tree(deduped)
+    stored = [f for f in files if f.startswith("store")]
+    assert len(stored) == len(content_store.bodies) == content_store.written
+    assert content_store.files == 40
+    assert {f: text for (f, text) in files.items() if not f.startswith("store")} == read_tree(plain)
+
+@pytest.mark.timeout(120)
+def test_database(tmpdir, monkeypatch):
+    monkeypatch.setattr(fcset_gen, "outdir", str(tmpdir))
+    monkeypatch.setattr(fcset_gen, "formats", ('xml', 'midi'))
+    filename = str(tmpdir.join("cards.db"))
+    monkeypatch.setattr(fcset_gen.score, "xml_writer", "native")
+    monkeypatch.setattr(fcset_gen.score, "midi_writer", "native")
+    cards = itertools.chain(itertools.islice(fcset_gen.single_cards(), 12),
+                            (c for c in fcset_gen.chord_cards()
+                             if c.ctype.name == 'dom7' and c.voicing.name == 'blues' and c.key.value in ('D', 'Bb')))
+    with fcset_gen.carddb.CardDB(filename) as db:
+        monkeypatch.setattr(fcset_gen, "database", db)
+        fcset_gen.write_cards(cards, jobs=2, chunksize=4, manifest=db)
+    # nothing but the database was written
+    assert os.listdir(str(tmpdir)) == ["cards.db"]
+
+    with fcset_gen.carddb.CardDB(filename, readonly=True) as db:
+        assert db.count == 0
+        singles = db.query(kind='single')
+        assert len(singles) == 12
+        assert {(c['keysig'], c['mode'], c['octave']) for c in singles} == {('C', 'major', 2)}
+        assert db.query(key='single/keysig-C/Csharp2')[0]['root'] == 'C#'
+        flat = db.query(ctype='dom7', voicing='blues', keysig=fcset_gen.carddb.flat_keys)
+        sharp = db.query(ctype='dom7', voicing='blues', keysig=fcset_gen.carddb.sharp_keys)
+        assert {c['keysig'] for c in flat} == {'Bb'} and {c['sharps'] for c in flat} == {-2}
+        assert {c['keysig'] for c in sharp} == {'D'} and {c['sharps'] for c in sharp} == {2}
+        assert len(db) == 12 + len(flat) + len(sharp)
+        card = flat[0]
+        assert "<score-partwise" in db.xml(card['key'])
+        assert db.midi(card['key']).startswith(b"MThd")
+
+def read_tree_names(root:str) -> list:
+    return [os.path.relpath(os.path.join(d, f), root) for (d, dirs, files) in os.walk(root) for f in files]
+
+def test_audio(tmpdir, monkeypatch):
+    root = str(tmpdir)
+    monkeypatch.setattr(fcset_gen, "outdir", root)
+    monkeypatch.setattr(fcset_gen, "incremental", True)
+    monkeypatch.setattr(fcset_gen, "made_dirs", set())
+    monkeypatch.setattr(fcset_gen, "formats", ('xml', 'wav'))
+    cards = lambda: itertools.islice(fcset_gen.chord_cards(), 6)
+    fcset_gen.update_cards(cards())
+    wavs = [f for f in read_tree_names(root) if f.endswith(".wav")]
+    assert len(wavs) == 6
+    assert all(os.path.exists(os.path.join(root, f[:-len(".wav")] + ".xml")) for f in wavs)
+    assert fcset_gen.update_cards(cards())[1:] == (6, 0) # unchanged, none removed
+
+    # turning audio off rewrites the cards, and removes the previews
+    monkeypatch.setattr(fcset_gen, "formats", ('xml',))
+    (skipped, unchanged, removed) = fcset_gen.update_cards(cards())
+    assert (unchanged, removed) == (0, 6)
+    assert not any(f.endswith(".wav") for f in read_tree_names(root))
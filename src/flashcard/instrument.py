@@ -0,0 +1,154 @@
+# per-stage timing for generation runs
+#
+# enable() wraps the functions for each stage (building the music21 score, the XML and MIDI
+# writers, sanitize, writing files and HTML pages, and any more stages passed to it) so every call
+# records how long it took and how many bytes it produced (UTF-8, for text), under the current
+# deck section.  Until enable() is called nothing is wrapped, so it costs nothing but the section()
+# calls.  Times include any stage called from inside another: toXml includes sanitize.
+#
+#   instrument.enable()   # or enable(fcset_gen.instrumented_stages), to time its stages too
+#   ... run ...
+#   instrument.report()
+#   instrument.save("output/profile.json")
+
+import functools
+import itertools
+import json
+import threading
+import time
+
+try:
+    import score
+    import web
+except:
+    from flashcard import score
+    from flashcard import web
+
+def byte_size(data) -> int:
+    '''Bytes in data, counting text as UTF-8'''
+    return len(data.encode()) if isinstance(data, str) else len(data)
+
+def result_size(args, kwargs, result) -> int:
+    return 0 if result is None else byte_size(result)
+
+def written_size(args, kwargs, result) -> int:
+    return byte_size(args[1])
+
+def card_size(args, kwargs, result) -> int:
+    '''For fcset_gen.fcset_write(): the card's XML, and its audio preview if there is one'''
+    wav = kwargs.get('wav')
+    return byte_size(args[0]) + (0 if wav is None else len(wav))
+
+# (object, attribute, stage name, function(args, kwargs, result) -> bytes or None) to time
+stages = (
+    (score.Score, 'score', 'score', None),
+    (score.Score, 'toXml', 'toXml', result_size),
+    (score.Score, 'toMidi', 'toMidi', result_size),
+    (score, 'sanitize', 'sanitize', result_size),
+    (web, 'gen_musichtml', 'gen_musichtml', None),
+    (web, 'gen_musichtml_batch', 'gen_musichtml', None),
+    (web, 'write_file', 'write_file', written_size),
+)
+
+enabled = False
+_originals = [] # (object, attribute, original function) for disable()
+
+# (section, stage) -> [call times in seconds, bytes]
+stats = {}
+_lock = threading.Lock()
+_current = threading.local()
+
+def section(name:str):
+    '''Record the stages this thread runs from now on under a deck section, e.g. 'chords' '''
+    _current.section = name
+
+def record(stage:str, seconds:float, size:int):
+    key = (getattr(_current, 'section', None), stage)
+    with _lock:
+        entry = stats.get(key)
+        if entry is None:
+            entry = stats[key] = [[], 0]
+        entry[0].append(seconds)
+        entry[1] += size or 0
+
+def timed(fn, stage:str, size=None):
+    '''Return fn wrapped to record each call as the given stage'''
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        record(stage, time.perf_counter() - start, None if size is None else size(args, kwargs, result))
+        return result
+    return wrapper
+
+def enable(more:tuple=()):
+    '''Start timing the stages, and any more given like those in stages (doing nothing if they're
+    already timed)'''
+    global enabled
+    if enabled:
+        return
+    for (owner, name, stage, size) in stages + tuple(more):
+        original = getattr(owner, name)
+        _originals.append((owner, name, original))
+        setattr(owner, name, timed(original, stage, size))
+    enabled = True
+
+def disable():
+    '''Stop timing the stages; what's been recorded stays in stats'''
+    global enabled
+    while _originals:
+        (owner, name, original) = _originals.pop()
+        setattr(owner, name, original)
+    enabled = False
+
+def take() -> dict:
+    '''Return what's been recorded, and start again (e.g. in a worker process, to send to merge())'''
+    global stats
+    with _lock:
+        (taken, stats) = (stats, {})
+    return taken
+
+def merge(taken:dict):
+    '''Add stats from take(), e.g. from a worker process'''
+    with _lock:
+        for (key, (times, size)) in taken.items():
+            entry = stats.get(key)
+            if entry is None:
+                entry = stats[key] = [[], 0]
+            entry[0].extend(times)
+            entry[1] += size
+
+def row(stage:str, section:str, times:list, size:int) -> dict:
+    times = sorted(times)
+    total = sum(times)
+    return {
+        'stage': stage,
+        'section': section,
+        'calls': len(times),
+        'total': total,
+        'mean': total / len(times),
+        'p95': times[min(len(times) - 1, int(len(times) * 0.95))],
+        'bytes': size,
+    }
+
+def summary() -> list:
+    '''Return a dict per stage (section 'all'), and per stage and deck section, sorted by stage'''
+    with _lock:
+        items = sorted((stage, section or '', list(times), size) for ((section, stage), (times, size)) in stats.items())
+    rows = []
+    for (stage, group) in itertools.groupby(items, key=lambda item: item[0]):
+        group = list(group)
+        rows.append(row(stage, 'all', [t for item in group for t in item[2]], sum(item[3] for item in group)))
+        rows += [row(stage, section, times, size) for (stage, section, times, size) in group if section]
+    return rows
+
+def report():
+    '''Print a table of the stages'''
+    print(f"{'stage':14} {'section':10} {'calls':>8} {'total s':>9} {'mean ms':>9} {'p95 ms':>9} {'MB':>8}")
+    for r in summary():
+        print(f"{r['stage']:14} {r['section']:10} {r['calls']:8} {r['total']:9.2f} "
+              f"{r['mean'] * 1e3:9.3f} {r['p95'] * 1e3:9.3f} {r['bytes'] / 1e6:8.2f}")
+
+def save(filename:str):
+    '''Write the table as JSON'''
+    web.write_file(filename, json.dumps(summary(), indent=1))
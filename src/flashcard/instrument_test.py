@@ -0,0 +1,39 @@
+import json
+
+try:
+    from score import *
+    import instrument
+except:
+    from flashcard.score import *
+    from flashcard import instrument
+
+def test_instrument(tmp_path):
+    s = Score([Sequence(Clef.Treble, [Tick(Duration(1), {Note('C4'), Note('E4')})])])
+    toXml = Score.toXml
+    instrument.take()
+    instrument.enable()
+    instrument.enable() # again: still wrapped once
+    try:
+        instrument.section('singles')
+        xml = s.toXml('native')
+    finally:
+        instrument.disable()
+        instrument.section(None)
+    assert Score.toXml is toXml
+    s.toXml('native') # not recorded now
+
+    rows = instrument.summary()
+    assert [(r['stage'], r['section'], r['calls']) for r in rows] == [('toXml', 'all', 1), ('toXml', 'singles', 1)]
+    assert rows[0]['bytes'] == len(xml.encode())
+
+    filename = str(tmp_path / "profile.json")
+    instrument.save(filename)
+    with open(filename) as f:
+        assert json.load(f) == rows
+    assert instrument.take() != {}
+    assert instrument.summary() == []
+
+def test_sizes_in_bytes():
+    assert instrument.written_size(("page.html", "♯"), {}, None) == 3
+    assert instrument.result_size((), {}, b"MThd") == 4
+    assert instrument.card_size(("<a>♯</a>", "title"), {'wav': b"RIFF"}, None) == 14
@@ -0,0 +1,92 @@
+# interval arithmetic on (step, alter, octave), without music21
+#
+# Intervals are written the way music21 and chords.py write them: a quality and a number, such as
+# 'P1', 'm3', 'M3', 'd5', 'A5' (or 'a5'), 'm9', 'A11', with a '-' for descending ('-P8' or 'P-8').
+# Like music21, the result is spelled from the interval: C4 + 'a5' is G#4, not Ab4.  An int is a
+# number of semitones, and as in music21 the result is spelled from its pitch class alone (as
+# midi_spellings), so C4 + 6 is F#4 and F#4 + 4 is Bb4.
+
+import re
+
+steps = 'CDEFGAB'
+step_semitones = (0, 2, 4, 5, 7, 9, 11)
+
+# how music21 writes an alter in a note name
+accidental_text = {-3: '---', -2: '--', -1: '-', 0: '', 1: '#', 2: '##', 3: '###'}
+
+# music21's spelling of each pitch class when there's nothing else to go on (e.g. Pitch(midi=61) is C#)
+midi_spellings = (
+    ('C', 0), ('C', 1), ('D', 0), ('E', -1), ('E', 0), ('F', 0),
+    ('F', 1), ('G', 0), ('G', 1), ('A', 0), ('B', -1), ('B', 0),
+)
+
+# semitones in each simple interval with its default quality (P or M), by number - 1
+simple_semitones = (0, 2, 4, 5, 7, 9, 11)
+perfect = (True, False, False, True, True, False, False)
+
+interval_re = re.compile(r'(-?)(P|M|m|d+|A+|a+)(-?)(\d+)$')
+
+# interval string -> (diatonic steps, semitones)
+_parsed = {}
+
+def parse(interval:str, cache:bool=True) -> tuple:
+    '''Return (diatonic steps, semitones) for an interval string, e.g. 'M3' -> (2, 4), '-P8' -> (-7, -12)
+
+    Parsed intervals are cached, unless cache is False (e.g. for strings from a client).
+    '''
+    parsed = _parsed.get(interval)
+    if parsed is not None:
+        return parsed
+    m = interval_re.match(interval)
+    if m is None or int(m.group(4)) == 0:
+        raise ValueError(f"bad interval '{interval}'")
+    (sign1, quality, sign2, number) = m.groups()
+    number = int(number)
+    (octaves, simple) = divmod(number - 1, 7)
+    semitones = simple_semitones[simple] + 12 * octaves
+    if perfect[simple]:
+        if quality in ('M', 'm'):
+            raise ValueError(f"bad interval '{interval}': {number} can't be major or minor")
+        if quality[0] == 'd':
+            semitones -= len(quality)
+        elif quality[0] in 'Aa':
+            semitones += len(quality)
+    else:
+        if quality == 'P':
+            raise ValueError(f"bad interval '{interval}': {number} can't be perfect")
+        if quality == 'm':
+            semitones -= 1
+        elif quality[0] == 'd':
+            semitones -= 1 + len(quality)
+        elif quality[0] in 'Aa':
+            semitones += len(quality)
+    generic = number - 1
+    if sign1 or sign2:
+        (generic, semitones) = (-generic, -semitones)
+    parsed = (generic, semitones)
+    if cache:
+        _parsed[interval] = parsed
+    return parsed
+
+def transpose(step:str, alter:int, octave:int, change) -> tuple:
+    '''Transpose (step, alter, octave) by an interval (or int semitones), or a tuple of them applied in order
+
+    A note without an octave stays without one (it's taken to be in octave 4, like music21).
+    '''
+    changes = change if isinstance(change, tuple) else (change,)
+    index = steps.index(step)
+    diatonic = (4 if octave is None else octave) * 7 + index
+    semitone = (4 if octave is None else octave) * 12 + step_semitones[index] + alter
+    for c in changes:
+        if isinstance(c, int):
+            semitone += c
+            (new_octave, pc) = divmod(semitone, 12)
+            (new_step, new_alter) = midi_spellings[pc]
+            diatonic = new_octave * 7 + steps.index(new_step)
+            continue
+        (generic, semitones) = parse(c)
+        diatonic += generic
+        semitone += semitones
+    (new_octave, new_index) = divmod(diatonic, 7)
+    new_alter = semitone - (new_octave * 12 + step_semitones[new_index])
+    return (steps[new_index], new_alter, None if octave is None else new_octave)
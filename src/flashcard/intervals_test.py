@@ -0,0 +1,67 @@
+import pytest
+
+import music21
+
+try:
+    from score import *
+    from chords import *
+    import intervals
+    from score_test import transpose_table
+except:
+    from flashcard.score import *
+    from flashcard.chords import *
+    from flashcard import intervals
+    from flashcard.score_test import transpose_table
+
+def test_parse():
+    assert intervals.parse('P1') == (0, 0)
+    assert intervals.parse('M3') == (2, 4)
+    assert intervals.parse('m3') == (2, 3)
+    assert intervals.parse('d5') == (4, 6)
+    assert intervals.parse('a5') == (4, 8)
+    assert intervals.parse('A11') == (10, 18)
+    assert intervals.parse('m9') == (8, 13)
+    assert intervals.parse('-P8') == (-7, -12)
+    assert intervals.parse('P-8') == (-7, -12)
+    for bad in ('', 'M5', 'P3', 'X3', 'M0', 'M'):
+        with pytest.raises(ValueError):
+            intervals.parse(bad)
+
+def test_transpose_table():
+    for (initial, change, final) in transpose_table:
+        assert Note(initial).transpose(change).name == final, f"transposing {initial} by {change}"
+
+def test_transpose_no_octave():
+    assert intervals.transpose('B', -1, None, 'M2') == ('C', 0, None)
+    assert intervals.transpose('B', 0, 3, ('M2', 'm2')) == ('D', 0, 4)
+    assert Note('C').transpose('M3').name == 'E'
+    assert Note('C').transpose(-1).name == 'B'
+
+def test_transpose_semitones():
+    assert intervals.transpose('C', 0, 4, 6) == ('F', 1, 4)
+    assert intervals.transpose('C', 0, 4, ('P8', -1)) == ('B', 0, 4)
+    for name in ('C4', 'F#4', 'B-3', 'E', 'G#2'):
+        for semitones in range(-25, 26):
+            expected = music21.pitch.Pitch(name).transpose(semitones).nameWithOctave
+            assert Note(name).transpose(semitones).name == expected, f"transposing {name} by {semitones}"
+
+def m21_chord(root:Note, parts:list) -> list:
+    '''The chord notes the old music21 path produced'''
+    note_parts = []
+    for part in parts:
+        pitches = [transpose(root.note.pitch, interval) for interval in part]
+        note_parts.append([p.name + str(p.octave) for p in music21.chord.Chord(pitches).pitches])
+    note_parts.reverse()
+    return note_parts
+
+def test_chords_match_music21():
+    dropkeys = ('Gb', 'G', 'G#', 'Ab', 'A', 'A#', 'Bb', 'B')
+    for k in root_notes:
+        root = Note(k + ('3' if k in dropkeys else '4'))
+        for ctype in ChordType:
+            for voicing in Voicing:
+                parts = Chord(ctype, voicing).parts
+                if parts is None:
+                    continue
+                actual = [[n.name for n in part] for part in chord(root, None, parts)]
+                assert actual == m21_chord(root, parts), f"{k} {ctype} {voicing}"
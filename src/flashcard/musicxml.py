@@ -0,0 +1,238 @@
+# MusicXML writer - writes our Score model straight to MusicXML, without building a music21 stream
+#
+# This produces the same notation as music21's exporter for our scores (key signature, 4/4 time,
+# clef, notes and the accidentals music21 would display), but skips music21's generic
+# makeNotation pass, so it's much faster.  It's selected with score.xml_writer = 'native'.
+#
+# The text is made a measure at a time (score_chunks), so write_xml() can write a long exercise
+# to a file without holding the whole document, or its element tree, in memory.
+
+import xml.etree.ElementTree as ET
+
+# same as music21, so durations match
+divisions = 10080 # per quarter note
+
+# time signature
+beats = 4
+beat_type = 4
+
+header = ('<?xml version="1.0" encoding="utf-8"?>\n'
+          '<!DOCTYPE score-partwise  PUBLIC "-//Recordare//DTD MusicXML 4.0 Partwise//EN"'
+          ' "http://www.musicxml.org/dtds/partwise.dtd">\n')
+
+steps = 'CDEFGAB'
+
+# order in which sharps are added to key signatures; flats are the reverse
+sharp_order = 'FCGDAEB'
+
+accidental_names = {
+    -2: 'flat-flat',
+    -1: 'flat',
+    0: 'natural',
+    1: 'sharp',
+    2: 'double-sharp',
+}
+
+def key_alters(sharps:int) -> dict:
+    '''Map step to the alters in a key signature with the given number of sharps (negative for flats)
+
+    Past 7 sharps or flats the cycle starts again with doubles, and like music21 we count both
+    the single and the double as being in the key signature.
+    '''
+    order = sharp_order if sharps >= 0 else sharp_order[::-1]
+    sign = 1 if sharps >= 0 else -1
+    alters = {}
+    for i in range(abs(sharps)):
+        step = order[i % 7]
+        alters.setdefault(step, set()).add(sign * (i // 7 + 1))
+    return alters
+
+def spelling(note) -> tuple:
+    '''Return (step, alter, octave) for a Note; notes without an octave are in octave 4, like music21'''
+    octave = 4 if note.octave is None else note.octave
+    return (note.step, note.alter, octave)
+
+def height(step:str, octave:int) -> int:
+    '''Height of a note for choosing a clef, as in music21's bestClef()'''
+    h = octave * 7 + steps.index(step) + 1 # diatonic note number
+    if h > 33: # A4
+        h += 3
+    elif h < 24: # D3
+        h -= 3
+    return h
+
+def best_clef(chords:list) -> tuple:
+    '''Return (sign, line, octave change) for the clef music21 would choose for a part without one'''
+    heights = [height(step, octave) for chord in chords for (step, alter, octave) in chord]
+    average = sum(heights) / len(heights) if heights else 29.0
+    if average > 49:
+        return ('G', 2, 1)
+    elif average > 28: # C4
+        return ('G', 2, 0)
+    elif average > 10:
+        return ('F', 4, 0)
+    return ('F', 4, -1)
+
+def clef_sign(clef, chords:list) -> tuple:
+    '''Return (sign, line, octave change) for the given Clef (or None)'''
+    name = getattr(clef, 'name', None)
+    if name == 'Treble':
+        return ('G', 2, 0)
+    if name == 'Bass':
+        return ('F', 4, 0)
+    return best_clef(chords)
+
+def accidental(note:tuple, chord:list, past:list, alters:dict):
+    '''Return the name of the accidental to display for a note, or None
+
+    note is (step, alter, octave), chord is the notes sounding with it, and past is the notes
+    earlier in the measure.  These are the rules music21 uses by default, without ties.
+    '''
+    (step, alter, octave) = note
+
+    # a different alteration of the same step in the same chord: always show it
+    if any(s == step and a != alter for (s, a, o) in chord):
+        return accidental_names[alter]
+
+    # the last earlier note with the same step and octave is what's in effect
+    for (s, a, o) in reversed(past):
+        if s == step and o == octave:
+            return None if a == alter else accidental_names[alter]
+
+    # cautionary accidental if the same step was altered differently in another octave
+    for (s, a, o) in reversed(past):
+        if s == step and a != alter:
+            return accidental_names[alter]
+
+    if alter not in alters.get(step, {0}):
+        return accidental_names[alter]
+    return None
+
+def measures(ticks:list) -> list:
+    '''Split ticks into measures of the time signature (ticks aren't split across barlines)'''
+    length = beats * 4 / beat_type # in quarters
+    out = [[]]
+    offset = 0
+    for tick in ticks:
+        ql = tick.duration.quarterLength
+        if out[-1] and offset + ql > length:
+            out.append([])
+            offset = 0
+        out[-1].append(tick)
+        offset += ql
+    return out
+
+def add_text(parent:ET.Element, tag:str, text) -> ET.Element:
+    elem = ET.SubElement(parent, tag)
+    elem.text = str(text)
+    return elem
+
+def part_measures(sequence, sharps:int):
+    '''Yield a <measure> element at a time for a Sequence
+
+    Every tick has to be one note long, with up to 2 dots: raises ValueError for a length that would
+    take tied notes (a 'complex' Duration), which only the music21 writer splits up.
+    '''
+    for tick in sequence.ticks:
+        if tick.duration.type == 'complex':
+            raise ValueError(f"can't write a {tick.duration.quarterLength:g} quarter note without ties")
+    alters = key_alters(sharps) if sharps is not None else {}
+    chords = [[spelling(n) for n in tick.ordered()] for tick in sequence.ticks]
+    (sign, line, octave_change) = clef_sign(sequence.clef, chords)
+
+    number = 1
+    index = 0
+    groups = measures(sequence.ticks)
+    for group in groups:
+        measure = ET.Element('measure', number=str(number))
+        if number == 1:
+            attributes = ET.SubElement(measure, 'attributes')
+            add_text(attributes, 'divisions', divisions)
+            if sharps is not None:
+                key = ET.SubElement(attributes, 'key')
+                add_text(key, 'fifths', sharps)
+            time = ET.SubElement(attributes, 'time')
+            add_text(time, 'beats', beats)
+            add_text(time, 'beat-type', beat_type)
+            clef = ET.SubElement(attributes, 'clef')
+            add_text(clef, 'sign', sign)
+            add_text(clef, 'line', line)
+            if octave_change:
+                add_text(clef, 'clef-octave-change', octave_change)
+
+        past = []
+        for tick in group:
+            chord = chords[index]
+            index += 1
+            (type, dots) = (tick.duration.type, tick.duration.dots)
+            ticks = round(tick.duration.quarterLength * divisions)
+            if not chord:
+                elem = ET.SubElement(measure, 'note')
+                if len(group) == 1 and tick.duration.quarterLength == beats * 4 / beat_type:
+                    # a whole measure's rest, written like music21 does, without a type
+                    ET.SubElement(elem, 'rest', measure='yes')
+                    add_text(elem, 'duration', ticks)
+                    continue
+                ET.SubElement(elem, 'rest')
+                add_text(elem, 'duration', ticks)
+                add_text(elem, 'type', type)
+                for dot in range(dots):
+                    ET.SubElement(elem, 'dot')
+            for (i, note) in enumerate(chord):
+                (step, alter, octave) = note
+                elem = ET.SubElement(measure, 'note')
+                if i > 0:
+                    ET.SubElement(elem, 'chord')
+                pitch = ET.SubElement(elem, 'pitch')
+                add_text(pitch, 'step', step)
+                if alter != 0:
+                    add_text(pitch, 'alter', alter)
+                add_text(pitch, 'octave', octave)
+                add_text(elem, 'duration', ticks)
+                add_text(elem, 'type', type)
+                for dot in range(dots):
+                    ET.SubElement(elem, 'dot')
+                acc = accidental(note, chord[:i] + chord[i+1:], past, alters)
+                if acc is not None:
+                    add_text(elem, 'accidental', acc)
+            past.extend(chord)
+
+        if number == len(groups):
+            barline = ET.SubElement(measure, 'barline', location='right')
+            add_text(barline, 'bar-style', 'light-heavy')
+        number += 1
+        yield measure
+
+def element_text(elem:ET.Element, level:int) -> str:
+    '''An element as an indented line of the document, at the given depth'''
+    ET.indent(elem, space='  ', level=level)
+    return '  ' * level + ET.tostring(elem, encoding='unicode') + '\n'
+
+def score_chunks(score):
+    '''Yield the MusicXML text for a Score a measure at a time, so a long score is never one string'''
+    sharps = None
+    if score.keyAndMode is not None:
+        sharps = score.keyAndMode.sharps
+
+    yield header + '<score-partwise version="4.0">\n'
+    part_list = ET.Element('part-list')
+    part_ids = ["part%d" % n for n in range(1, len(score.sequences) + 1)]
+    for part_id in part_ids:
+        score_part = ET.SubElement(part_list, 'score-part', id=part_id)
+        ET.SubElement(score_part, 'part-name')
+    yield element_text(part_list, 1)
+    for (part_id, sequence) in zip(part_ids, score.sequences):
+        yield f'  <part id="{part_id}">\n'
+        for measure in part_measures(sequence, sharps):
+            yield element_text(measure, 2)
+        yield '  </part>\n'
+    yield '</score-partwise>\n'
+
+def write_xml(score, f):
+    '''Write MusicXML for a Score to an open text file, a measure at a time'''
+    for chunk in score_chunks(score):
+        f.write(chunk)
+
+def score_to_xml(score) -> str:
+    '''Return MusicXML text for a Score'''
+    return ''.join(score_chunks(score))
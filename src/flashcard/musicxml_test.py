@@ -0,0 +1,140 @@
+import itertools
+import os
+import pytest
+import xml.etree.ElementTree as ET
+
+try:
+    import score
+    import fcgen
+    import fcset_gen
+    from musicxml import *
+except:
+    from flashcard import score
+    from flashcard import fcgen
+    from flashcard import fcset_gen
+    from flashcard.musicxml import *
+
+def test_key_alters():
+    assert key_alters(0) == {}
+    assert key_alters(2) == {'F': {1}, 'C': {1}}
+    assert key_alters(-3) == {'B': {-1}, 'E': {-1}, 'A': {-1}}
+    # G# major: F double-sharp
+    assert key_alters(8) == {'F': {1, 2}, 'C': {1}, 'G': {1}, 'D': {1}, 'A': {1}, 'E': {1}, 'B': {1}}
+
+def test_accidental():
+    alters = key_alters(-3) # Eb major
+    assert accidental(('E', -1, 4), [], [], alters) == None
+    assert accidental(('E', 0, 4), [], [], alters) == 'natural'
+    assert accidental(('F', 1, 4), [], [], alters) == 'sharp'
+    assert accidental(('F', 0, 4), [], [], alters) == None
+    assert accidental(('C', 2, 4), [], [], {}) == 'double-sharp'
+    # earlier in the measure
+    assert accidental(('F', 1, 4), [], [('F', 1, 4)], alters) == None
+    assert accidental(('F', 0, 4), [], [('F', 1, 4)], alters) == 'natural'
+    # same step in the chord
+    assert accidental(('F', 0, 4), [('F', 1, 5)], [], alters) == 'natural'
+
+def test_best_clef():
+    assert best_clef([[('C', 0, 4), ('E', 0, 4)]]) == ('G', 2, 0)
+    assert best_clef([[('C', 0, 3)]]) == ('F', 4, 0)
+    assert best_clef([[('B', 0, 6)]]) == ('G', 2, 1)
+    assert best_clef([]) == ('G', 2, 0)
+
+def notation(xml:str) -> list:
+    '''Return what's visible in the score: per part, the key, time, clef and notes'''
+    root = ET.fromstring(xml)
+    parts = []
+    for part in root.iter('part'):
+        attributes = part.find('measure/attributes')
+        notes = []
+        for note in part.iter('note'):
+            if note.get('print-object') == 'no':
+                continue
+            if note.find('rest') is not None:
+                notes.append(('rest', note.findtext('type'), len(note.findall('dot'))))
+                continue
+            notes.append((
+                note.find('chord') is not None,
+                note.findtext('pitch/step'),
+                int(note.findtext('pitch/alter', '0')),
+                int(note.findtext('pitch/octave')),
+                note.findtext('type'),
+                note.findtext('accidental'),
+                len(note.findall('dot')),
+            ))
+        parts.append((
+            attributes.findtext('key/fifths'),
+            attributes.findtext('time/beats'),
+            attributes.findtext('time/beat-type'),
+            attributes.findtext('clef/sign'),
+            attributes.findtext('clef/line'),
+            attributes.findtext('clef/clef-octave-change'),
+            notes,
+        ))
+    return parts
+
+def render(card, writer:str) -> str:
+    score.xml_writer = writer
+    outputs = card.render()
+    return None if outputs is None else outputs[0]
+
+# The full catalog takes several minutes with music21, so by default check every Nth card.
+# Set FULL_CATALOG=1 to check them all.
+catalog_stride = 1 if os.environ.get('FULL_CATALOG') else 100
+
+@pytest.mark.timeout(3600)
+def test_native_matches_music21(tmpdir, monkeypatch):
+    monkeypatch.setattr(fcset_gen, 'outdir', str(tmpdir))
+    monkeypatch.setattr(score, 'xml_writer', score.xml_writer)
+    cards = itertools.chain(fcset_gen.single_cards(), fcset_gen.interval_cards(), fcset_gen.chord_cards())
+    checked = 0
+    for card in itertools.islice(cards, 0, None, catalog_stride):
+        expected = render(card, 'music21')
+        actual = render(card, 'native')
+        if expected is None:
+            assert actual is None
+            continue
+        assert notation(actual) == notation(expected), str(card)
+        checked += 1
+    assert checked > 0
+
+def test_native_sequence():
+    # several ticks, more than one measure
+    seq = score.Sequence(score.Clef.Treble)
+    for name in ('C4', 'F#4', 'F4', 'G4', 'F#4'):
+        seq.add([score.Tick(score.Duration(1), {score.Note(name)})])
+    xml = score.Score([seq]).toXml('native')
+    (part,) = notation(xml)
+    accidentals = [n[5] for n in part[6]]
+    assert accidentals == [None, 'sharp', 'natural', None, 'sharp']
+    assert len(ET.fromstring(xml).findall('part/measure')) == 2
+
+def test_native_complex_duration():
+    # 5 quarters takes a tie, which the native writer doesn't do, rather than writing <type>complex</type>
+    seq = score.Sequence(score.Clef.Treble, [score.Tick(score.Duration(5), {score.Note('C4')})])
+    assert score.Duration(5).type == 'complex'
+    with pytest.raises(ValueError):
+        score.Score([seq]).toXml('native')
+
+def exercise_score(count:int) -> score.Score:
+    return fcgen.exercise(count, fcgen.NoteRange(score.Note('C3'), score.Note('C6')),
+                          score.KeyAndMode(score.Key.Eflat, score.Mode.major), chord_size=2, rests=0.15, seed=7)
+
+def test_native_exercise_matches_music21():
+    # durations, dots, rests and accidentals carried through several measures
+    s = exercise_score(120)
+    native = s.toXml('native')
+    assert notation(native) == notation(s.toXml('music21'))
+    assert len(ET.fromstring(native).findall('part/measure')) > 30
+
+def test_write_xml_by_measure():
+    s = exercise_score(2000)
+    chunks = []
+    class Recorder(object):
+        def write(self, text):
+            chunks.append(text)
+    s.writeXml(Recorder(), 'native')
+    assert "".join(chunks) == s.toXml('native')
+    measures = ET.fromstring("".join(chunks)).findall('part/measure')
+    assert len(chunks) == len(measures) + 5 # and the header, part list, part and closing tags
+    assert max(len(c) for c in chunks) < 10000
@@ -0,0 +1,124 @@
+# card packs - a whole deck of cards in one file, instead of an XML file per card
+#
+# A pack is a header, the cards' MusicXML one after another (each compressed with zlib), an index,
+# and a trailer giving where the index starts:
+#
+#   b'FCPK' version:u16   card data...   index (JSON)   index offset:u64 b'FCPK'
+#
+# The index maps each card's key (its path under output/xml without '.xml', e.g.
+# 'chords/keysig-C/standard/maj7/Cmaj7') to [offset, length, title, description].  Readers map
+# the file into memory and read just the card they want.
+
+import json
+import mmap
+import os
+import struct
+import zlib
+
+magic = b'FCPK'
+version = 1
+header = struct.Struct('>4sH')
+trailer = struct.Struct('>Q4s')
+
+suffix = '.pack'
+
+def encode(xml:str) -> bytes:
+    return zlib.compress(xml.encode(), 6)
+
+def decode(data:bytes) -> str:
+    return zlib.decompress(data).decode()
+
+def chord_key(keysig:str, voicing:str, ctype:str, root:str) -> str:
+    '''Return the key of a chord card, e.g. chord_key('C', 'standard', 'maj7', 'C')'''
+    return f"chords/keysig-{keysig}/{voicing}/{ctype}/{root}{ctype}"
+
+class PackWriter(object):
+    '''Write a pack file; use as a context manager, or call close()
+
+    The pack is written to a temporary file and renamed when it's closed, so readers never see
+    a partial pack.
+    '''
+    def __init__(self, filename:str):
+        self.filename = filename
+        self.tmp_filename = f"{filename}.tmp{os.getpid()}"
+        self.file = open(self.tmp_filename, 'wb')
+        self.file.write(header.pack(magic, version))
+        self.index = {}
+
+    def add(self, key:str, data:bytes, title:str=None, description:str=None):
+        '''Add a card, given its encoded XML (see encode())'''
+        self.index[key] = [self.file.tell(), len(data), title, description]
+        self.file.write(data)
+
+    def close(self):
+        if self.file is None:
+            return
+        index_offset = self.file.tell()
+        self.file.write(json.dumps(self.index, separators=(',', ':')).encode())
+        self.file.write(trailer.pack(index_offset, magic))
+        self.file.close()
+        self.file = None
+        os.replace(self.tmp_filename, self.filename)
+
+    def abort(self):
+        '''Give up on the pack, leaving any earlier pack file as it was'''
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        os.remove(self.tmp_filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+class PackReader(object):
+    '''Read cards from a pack file by key, through a memory map'''
+    def __init__(self, filename:str):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (m, v) = header.unpack_from(self.map, 0)
+        (index_offset, m2) = trailer.unpack_from(self.map, len(self.map) - trailer.size)
+        if m != magic or m2 != magic:
+            raise ValueError(f"{filename} isn't a card pack")
+        if v != version:
+            raise ValueError(f"{filename} is pack version {v}, not {version}")
+        self.index = json.loads(self.map[index_offset:len(self.map) - trailer.size])
+
+    def keys(self):
+        return self.index.keys()
+
+    def __contains__(self, key:str) -> bool:
+        return key in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def xml(self, key:str) -> str:
+        '''Return a card's MusicXML; raises KeyError if there's no such card'''
+        (offset, length, title, description) = self.index[key]
+        return decode(self.map[offset:offset + length])
+
+    def info(self, key:str) -> tuple:
+        '''Return a card's (title, description)'''
+        (offset, length, title, description) = self.index[key]
+        return (title, description)
+
+    def chord(self, keysig:str, voicing:str, ctype:str, root:str) -> str:
+        '''Return the MusicXML for a chord card'''
+        return self.xml(chord_key(keysig, voicing, ctype, root))
+
+    def close(self):
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
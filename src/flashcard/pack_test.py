@@ -0,0 +1,68 @@
+import itertools
+import os
+import pytest
+
+try:
+    import fcset_gen
+    import pack
+except:
+    from flashcard import fcset_gen
+    from flashcard import pack
+
+def test_pack_roundtrip(tmpdir):
+    filename = str(tmpdir.join("test.pack"))
+    cards = {f"deck/card{n}": f"<score>{'x' * n}♯</score>" for n in range(100)}
+    with pack.PackWriter(filename) as writer:
+        for (n, (key, xml)) in enumerate(cards.items()):
+            writer.add(key, pack.encode(xml), title=key, description=None if n % 2 else "d")
+    assert os.listdir(str(tmpdir)) == ["test.pack"]
+    with pack.PackReader(filename) as reader:
+        assert len(reader) == 100
+        assert set(reader.keys()) == set(cards)
+        for (key, xml) in cards.items():
+            assert reader.xml(key) == xml
+        assert reader.info("deck/card3") == ("deck/card3", None)
+        assert reader.info("deck/card4") == ("deck/card4", "d")
+        assert "deck/nope" not in reader
+        with pytest.raises(KeyError):
+            reader.xml("deck/nope")
+
+def test_pack_abort(tmpdir):
+    filename = str(tmpdir.join("test.pack"))
+    with pytest.raises(RuntimeError):
+        with pack.PackWriter(filename) as writer:
+            writer.add("a", pack.encode("a"))
+            raise RuntimeError("oops")
+    assert os.listdir(str(tmpdir)) == []
+
+def test_not_a_pack(tmpdir):
+    filename = str(tmpdir.join("bad.pack"))
+    with open(filename, "wb") as f:
+        f.write(b"not a pack at all, just some bytes")
+    with pytest.raises(ValueError):
+        pack.PackReader(filename)
+
+@pytest.mark.timeout(120)
+def test_packs_match_files(tmpdir, monkeypatch):
+    # the same cards, written as files and packed
+    monkeypatch.setattr(fcset_gen, "outdir", str(tmpdir.join("files")))
+    cards = list(itertools.chain(
+        itertools.islice(fcset_gen.single_cards(), 10),
+        itertools.islice(fcset_gen.chord_cards(), 10),
+    ))
+    fcset_gen.write_cards(cards)
+    monkeypatch.setattr(fcset_gen, "packing", True)
+    with fcset_gen.Packs(str(tmpdir.join("packs"))) as packs:
+        fcset_gen.write_cards(cards, jobs=2, chunksize=4, manifest=packs)
+    assert packs.count == 20
+    assert sorted(os.listdir(str(tmpdir.join("packs")))) == ["chords.pack", "single.pack"]
+
+    with pack.PackReader(str(tmpdir.join("packs", "chords.pack"))) as reader:
+        for card in cards[10:]:
+            with open(card.xml_filename) as f:
+                expected = f.read()
+            key = os.path.splitext(os.path.relpath(card.xml_filename, fcset_gen.outdir + "/xml"))[0]
+            assert reader.xml(key) == expected
+            assert reader.info(key) == (card.title, card.description)
+        # the first chord card is A major, standard voicing, in C
+        assert reader.chord("C", "standard", "maj", "A") == reader.xml("chords/keysig-C/standard/maj/Amaj")
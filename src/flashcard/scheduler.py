@@ -0,0 +1,390 @@
+# spaced-repetition scheduler - which card each learner should see next
+#
+# A Deck is the cards to schedule (keys as in carddb.py and pack.py), with a category per card for
+# each field that can be weighted, e.g. its chord type or key signature.  A Learner keeps a row of
+# review state per card they've seen, in NumPy arrays that grow as they go (the card, when it's
+# due, its interval and ease, reviews and lapses), and a heap of (due, row) so the next due card is
+# found in O(log n).  A review pushes the card again rather than moving it in the heap; stale
+# entries are dropped as they come to the top.  Reviews follow SM-2: a lapse starts the card's
+# repetitions again and leaves its ease as it was.
+#
+# When nothing is due, the learner gets a new card, from a category drawn from an alias table
+# (O(1) per draw) weighted towards their weak areas: categories they get wrong more often, times
+# any weights given, e.g. to practice flat keys.  The table is rebuilt (O(categories)) after a
+# lapse, when a category runs out of new cards, and otherwise every rebuild_every reviews.
+#
+# A Learner saves to one uncompressed .npz file, and loads without replaying anything: the heap is
+# rebuilt from the due times.
+#
+#   deck = Deck.from_db(carddb.CardDB("output/cards.db", readonly=True))
+#   learner = Learner(deck, weak_by='ctype', seed=1)
+#   card = learner.next(now)      # index into the deck; deck.key(card) is its key
+#   learner.review(card, grade, now)  # grade 0-5, as in SM-2: below 3 is a lapse
+#   learner.save("output/learners/alice.npz")
+#
+# python src/flashcard/scheduler.py times selection at 1M cards x 1k learners (see --help).
+
+import argparse
+import hashlib
+import heapq
+import os
+import tempfile
+import time
+
+import numpy
+
+try:
+    import carddb
+except:
+    from flashcard import carddb
+
+# SM-2
+min_ease = 1.3
+start_ease = 2.5
+first_interval = 86400.0 # seconds: a day
+second_interval = 6 * 86400.0
+relearn_interval = 600.0 # a lapsed card comes back in ten minutes
+
+slot_bits = 24 # heap entries are due << slot_bits | row, so a learner can have up to 16M cards
+rebuild_every = 64 # reviews between rebuilds of the weak-area table, if nothing else changes it
+
+class AliasTable(object):
+    '''Draw an index with probability proportional to its weight in O(1), after an O(n) build
+    (Vose's alias method)'''
+    def __init__(self, weights):
+        weights = numpy.asarray(weights, dtype=numpy.float64)
+        total = weights.sum()
+        if len(weights) == 0 or total <= 0:
+            raise ValueError("no weights to draw from")
+        n = len(weights)
+        prob = (weights * n / total).tolist()
+        alias = list(range(n))
+        small = [i for (i, p) in enumerate(prob) if p < 1.0]
+        large = [i for (i, p) in enumerate(prob) if p >= 1.0]
+        while small and large:
+            (s, l) = (small.pop(), large.pop())
+            alias[s] = l
+            prob[l] -= 1.0 - prob[s]
+            (small if prob[l] < 1.0 else large).append(l)
+        for i in small + large: # left over from rounding
+            prob[i] = 1.0
+        self.prob = prob
+        self.alias = alias
+
+    def draw(self, u:float) -> int:
+        '''Return an index for a uniform random number in [0, 1)'''
+        u *= len(self.prob)
+        i = int(u)
+        return i if u - i < self.prob[i] else self.alias[i]
+
+    def draws(self, rng:numpy.random.Generator, size:int) -> numpy.ndarray:
+        u = rng.random(size) * len(self.prob)
+        i = u.astype(numpy.int64)
+        return numpy.where(u - i < numpy.asarray(self.prob)[i], i, numpy.asarray(self.alias)[i])
+
+class Deck(object):
+    '''Cards to schedule: a key per card (or just numbers), and per field a category per card
+
+    categories maps a field to (names, codes): the names of its categories, and an int array of
+    each card's category.  Use from_rows() or from_db() to make one from card fields.
+    '''
+    def __init__(self, size:int, categories:dict, keys:list=None):
+        self.size = size
+        self.keys = keys
+        self.categories = categories
+        self._members = {}
+        self._fingerprint = None
+
+    @classmethod
+    def from_rows(cls, rows, fields=('kind', 'ctype', 'keysig', 'voicing', 'interval')):
+        '''Make a Deck from dicts with each card's 'key' and fields, e.g. carddb rows or fcset_gen
+        Card.fields() with the key added'''
+        keys = []
+        codes = {field: [] for field in fields}
+        names = {field: {} for field in fields}
+        for row in rows:
+            keys.append(row['key'])
+            for field in fields:
+                value = row[field]
+                value = '' if value is None else str(value)
+                codes[field].append(names[field].setdefault(value, len(names[field])))
+        categories = {field: (tuple(names[field]), numpy.array(codes[field], dtype=numpy.int32)) for field in fields}
+        return cls(len(keys), categories, keys)
+
+    @classmethod
+    def from_db(cls, db:carddb.CardDB, **where):
+        '''Make a Deck of the cards in a card database (all, or those matching where; see CardDB.query)'''
+        return cls.from_rows(db.query(**where))
+
+    def key(self, card:int) -> str:
+        return str(card) if self.keys is None else self.keys[card]
+
+    def members(self, field:str) -> list:
+        '''The cards in each category of a field, in deck order: a list of int arrays'''
+        if field not in self._members:
+            (names, codes) = self.categories[field]
+            order = numpy.argsort(codes, kind='stable')
+            bounds = numpy.searchsorted(codes[order], numpy.arange(len(names) + 1))
+            self._members[field] = [order[bounds[c]:bounds[c + 1]] for c in range(len(names))]
+        return self._members[field]
+
+    def fingerprint(self) -> str:
+        '''A hash of the cards in order, so a learner's saved state isn't loaded against another deck'''
+        if self._fingerprint is None:
+            h = hashlib.sha1(str(self.size).encode())
+            if self.keys is not None:
+                h.update("\n".join(self.keys).encode())
+            self._fingerprint = h.hexdigest()
+        return self._fingerprint
+
+class Learner(object):
+    '''One learner's review state over a Deck, and what to show them next'''
+    # per row: the card, when it's due (seconds), its interval (seconds), ease, reviews and lapses
+    columns = (('card', numpy.int32), ('due', numpy.int64), ('interval', numpy.float32),
+               ('ease', numpy.float32), ('reps', numpy.uint16), ('lapses', numpy.uint16))
+
+    def __init__(self, deck:Deck, weak_by:str='ctype', weights:dict=None, seed:int=None, capacity:int=64):
+        self.deck = deck
+        self.weak_by = weak_by
+        (self.names, self.codes) = deck.categories[weak_by]
+        # weights for categories by name, e.g. {'dom7': 2}; the rest are 1
+        self.weights = numpy.array([1.0 if weights is None else weights.get(n, 1.0) for n in self.names])
+        self.rng = numpy.random.default_rng(seed)
+        self.count = 0 # rows in use
+        for (name, dtype) in self.columns:
+            setattr(self, name, numpy.zeros(capacity, dtype=dtype))
+        self.rows = {} # card -> row
+        self.heap = []
+        # per category: reviews and lapses (for the weak areas), and how far into its cards new ones have come
+        self.reviews = numpy.zeros(len(self.names), dtype=numpy.int64)
+        self.misses = numpy.zeros(len(self.names), dtype=numpy.int64)
+        self.next_new = numpy.zeros(len(self.names), dtype=numpy.int64)
+        self.used_up = numpy.zeros(len(self.names), dtype=bool) # no new cards left
+        self._table = None # AliasTable over the categories with new cards left; None when it needs rebuilding
+        self._table_categories = None
+        self._table_age = 0 # reviews since the table was built
+
+    def __len__(self) -> int:
+        '''Cards seen'''
+        return self.count
+
+    def _grow(self):
+        for (name, dtype) in self.columns:
+            column = getattr(self, name)
+            setattr(self, name, numpy.concatenate((column, numpy.zeros(len(column), dtype=dtype))))
+
+    def _add(self, card:int) -> int:
+        if self.count == len(self.card):
+            self._grow()
+        row = self.count
+        if row >= 1 << slot_bits:
+            raise ValueError(f"a learner can only have {1 << slot_bits} cards")
+        self.count += 1
+        self.card[row] = card
+        self.ease[row] = start_ease
+        self.rows[card] = row
+        return row
+
+    def _push(self, row:int, due:int):
+        heapq.heappush(self.heap, (due << slot_bits) | row)
+
+    def due_card(self, now:float):
+        '''Return the card due soonest, and when it's due, or (None, None) if there are none'''
+        heap = self.heap
+        due = self.due
+        while heap:
+            entry = heap[0]
+            row = entry & ((1 << slot_bits) - 1)
+            if entry >> slot_bits == due[row]:
+                return (int(self.card[row]), int(due[row]))
+            heapq.heappop(heap) # stale: the card's been reviewed since
+        return (None, None)
+
+    def weak_weights(self) -> numpy.ndarray:
+        '''How much to favor each category for new cards: its lapse rate (smoothed) times its
+        weight, or 0 if it has no new cards left'''
+        return (self.misses + 1) / (self.reviews + 2) * self.weights * ~self.used_up
+
+    def new_card(self):
+        '''Return a card the learner hasn't seen, from a category drawn by weak_weights(), or None
+
+        A category's new cards are handed out in order, and one only counts as seen once it's
+        reviewed: until then it's handed out again, so a card that's shown and not reviewed (e.g. the
+        drill is cancelled) isn't lost.
+        '''
+        members = self.deck.members(self.weak_by)
+        while True:
+            if self._table is None:
+                weights = self.weak_weights()
+                if not weights.any():
+                    return None
+                self._table_categories = numpy.flatnonzero(weights)
+                self._table = AliasTable(weights[self._table_categories])
+                self._table_age = 0
+            category = int(self._table_categories[self._table.draw(self.rng.random())])
+            cards = members[category]
+            while self.next_new[category] < len(cards):
+                card = int(cards[self.next_new[category]])
+                if card not in self.rows:
+                    return card
+                self.next_new[category] += 1
+            self.used_up[category] = True
+            self._table = None
+
+    def next(self, now:float):
+        '''Return the card to show next: the one most overdue, else a new one, else the one due soonest'''
+        (card, due) = self.due_card(now)
+        if card is not None and due <= now:
+            return card
+        new = self.new_card()
+        return card if new is None else new
+
+    def review(self, card:int, grade:int, now:float):
+        '''Record a review of a card: grade 0-5, where below 3 means the learner got it wrong'''
+        row = self.rows.get(card)
+        if row is None:
+            row = self._add(card)
+        category = self.codes[card]
+        self.reviews[category] += 1
+        (ease, interval) = (float(self.ease[row]), float(self.interval[row]))
+        self._table_age += 1
+        if grade < 3:
+            self.misses[category] += 1
+            self._table = None # a new weak spot
+            self.lapses[row] += 1
+            self.reps[row] = 0
+            interval = relearn_interval
+        else:
+            self.reps[row] += 1
+            reps = self.reps[row]
+            interval = first_interval if reps == 1 else second_interval if reps == 2 else interval * ease
+            self.ease[row] = max(min_ease, ease + 0.1 - (5 - grade) * (0.08 + (5 - grade) * 0.02))
+        self.interval[row] = interval
+        due = int(now + interval)
+        self.due[row] = due
+        self._push(row, due)
+        if self._table_age >= rebuild_every:
+            self._table = None
+
+    def seen(self, cards, due, interval=None, reps=None):
+        '''Add cards the learner has already seen, in bulk (e.g. from another scheduler), with when
+        each is due, and optionally its interval and reviews so far
+
+        Raises ValueError if a card is given twice or has been seen already, or if there'd be more
+        cards than a learner can have.
+        '''
+        cards = numpy.asarray(cards, dtype=numpy.int32)
+        if self.count + len(cards) > 1 << slot_bits:
+            raise ValueError(f"a learner can only have {1 << slot_bits} cards")
+        if len(numpy.unique(cards)) != len(cards):
+            raise ValueError("a card is given more than once")
+        already = [card for card in cards.tolist() if card in self.rows]
+        if already:
+            raise ValueError(f"{len(already)} cards have been seen already, e.g. {already[0]}")
+        while self.count + len(cards) > len(self.card):
+            self._grow()
+        rows = numpy.arange(self.count, self.count + len(cards))
+        self.card[rows] = cards
+        self.due[rows] = due
+        self.ease[rows] = start_ease
+        self.interval[rows] = first_interval if interval is None else interval
+        self.reps[rows] = 1 if reps is None else reps
+        self.count += len(cards)
+        self.rows.update(zip(cards.tolist(), rows.tolist()))
+        self._rebuild_heap()
+        self._table = None
+
+    def _rebuild_heap(self):
+        n = self.count
+        self.heap = ((self.due[:n] << slot_bits) | numpy.arange(n)).tolist()
+        heapq.heapify(self.heap)
+
+    def save(self, filename:str):
+        '''Write the learner's state to an .npz file'''
+        n = self.count
+        numpy.savez(filename, deck=self.deck.fingerprint(), weak_by=self.weak_by, weights=self.weights,
+                    reviews=self.reviews, misses=self.misses, next_new=self.next_new, used_up=self.used_up,
+                    **{name: getattr(self, name)[:n] for (name, dtype) in self.columns})
+
+    @classmethod
+    def load(cls, deck:Deck, filename:str, seed:int=None) -> 'Learner':
+        with numpy.load(filename) as data:
+            if str(data['deck']) != deck.fingerprint():
+                raise ValueError(f"{filename} is for a different deck")
+            learner = cls(deck, str(data['weak_by']), seed=seed, capacity=max(64, len(data['card'])))
+            learner.weights = data['weights']
+            for name in ('reviews', 'misses', 'next_new', 'used_up'):
+                setattr(learner, name, data[name])
+            n = len(data['card'])
+            for (name, dtype) in cls.columns:
+                getattr(learner, name)[:n] = data[name]
+        learner.count = n
+        learner.rows = dict(zip(learner.card[:n].tolist(), range(n)))
+        learner._rebuild_heap()
+        return learner
+
+def synthetic_deck(size:int, categories:dict=None) -> Deck:
+    '''A deck of size numbered cards, each in a category per field, spread evenly; for benchmarks'''
+    if categories is None:
+        categories = {'ctype': 30, 'keysig': 12}
+    return Deck(size, {field: (tuple(f"{field}{i}" for i in range(n)), (numpy.arange(size) * 7919 % n).astype(numpy.int32))
+                       for (field, n) in categories.items()})
+
+def benchmark(cards:int, learners:int, seen:int, ops:int, seed:int=1):
+    '''Time next() and review() across many learners, each of whom has seen some of a big deck'''
+    rng = numpy.random.default_rng(seed)
+    start = time.perf_counter()
+    deck = synthetic_deck(cards)
+    deck.members('ctype')
+    population = []
+    now = 10**9
+    for i in range(learners):
+        learner = Learner(deck, 'ctype', seed=i)
+        # half of what each learner has seen is due already
+        learner.seen(rng.choice(cards, seen, replace=False), now + rng.integers(-86400, 86400, seen))
+        population.append(learner)
+    setup = time.perf_counter() - start
+    rows = sum(len(l) for l in population)
+    state = sum(sum(getattr(l, name).nbytes for (name, dtype) in Learner.columns) for l in population)
+    print(f"{cards} cards, {learners} learners with {seen} cards seen each ({rows} rows, "
+          f"{state / 1e6:.0f} MB of arrays): set up in {setup:.1f}s")
+
+    picks = rng.integers(0, learners, ops).tolist()
+    grades = rng.integers(0, 6, ops).tolist()
+    (selecting, reviewing) = (0.0, 0.0)
+    for (i, grade) in zip(picks, grades):
+        learner = population[i]
+        t0 = time.perf_counter()
+        card = learner.next(now)
+        t1 = time.perf_counter()
+        learner.review(card, grade, now)
+        t2 = time.perf_counter()
+        selecting += t1 - t0
+        reviewing += t2 - t1
+        now += 1
+    print(f"{ops} cards: next() {selecting / ops * 1e6:.1f} us, review() {reviewing / ops * 1e6:.1f} us per card")
+
+    # a new learner starting on the deck: every card's new, drawn from the weak areas
+    learner = Learner(deck, 'ctype', weights={'ctype0': 5.0}, seed=seed)
+    t0 = time.perf_counter()
+    for i in range(ops):
+        learner.review(learner.next(now), 5 if i % 4 else 1, now)
+    print(f"new learner: {(time.perf_counter() - t0) / ops * 1e6:.1f} us per card (next and review)")
+
+    with tempfile.TemporaryDirectory() as scratch:
+        filename = os.path.join(scratch, "learner.npz")
+        t0 = time.perf_counter()
+        population[0].save(filename)
+        t1 = time.perf_counter()
+        Learner.load(deck, filename)
+        t2 = time.perf_counter()
+    print(f"save {(t1 - t0) * 1e3:.2f} ms, load {(t2 - t1) * 1e3:.2f} ms for a learner with {len(population[0])} cards")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the scheduler on a synthetic deck")
+    parser.add_argument("--cards", type=int, default=1_000_000, help="cards in the deck (default %(default)s)")
+    parser.add_argument("--learners", type=int, default=1000, help="learners (default %(default)s)")
+    parser.add_argument("--seen", type=int, default=1000, help="cards each learner has seen (default %(default)s)")
+    parser.add_argument("--ops", type=int, default=100_000, help="cards to select (default %(default)s)")
+    args = parser.parse_args()
+    benchmark(args.cards, args.learners, args.seen, args.ops)
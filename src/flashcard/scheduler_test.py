@@ -0,0 +1,127 @@
+import numpy
+import pytest
+
+try:
+    import carddb
+    import scheduler
+except:
+    from flashcard import carddb
+    from flashcard import scheduler
+
+def test_alias_table():
+    table = scheduler.AliasTable([1, 2, 0, 7])
+    counts = numpy.bincount(table.draws(numpy.random.default_rng(1), 100000), minlength=4) / 100000
+    assert numpy.allclose(counts, [0.1, 0.2, 0.0, 0.7], atol=0.01)
+    draws = [table.draw(u) for u in numpy.random.default_rng(2).random(20000)]
+    assert numpy.allclose(numpy.bincount(draws, minlength=4) / 20000, counts, atol=0.02)
+    with pytest.raises(ValueError):
+        scheduler.AliasTable([0, 0])
+
+def test_due_order():
+    learner = scheduler.Learner(scheduler.synthetic_deck(100), seed=1)
+    learner.seen([5, 6, 7], [300, 100, 200])
+    assert learner.next(1000) == 6 # the most overdue
+    learner.review(6, 5, 1000)
+    assert learner.next(1000) == 7
+    learner.review(7, 5, 1000)
+    learner.review(7, 5, 1000) # the heap's older entries for 7 are stale now
+    assert learner.next(1000) == 5
+    learner.review(5, 1, 1000)
+    assert learner.due_card(1000) == (5, 1000 + int(scheduler.relearn_interval))
+
+def test_sm2():
+    learner = scheduler.Learner(scheduler.synthetic_deck(10))
+    now = 0
+    for (grade, interval) in ((5, scheduler.first_interval), (5, scheduler.second_interval),
+                              (5, scheduler.second_interval * 2.7), (2, scheduler.relearn_interval)):
+        learner.review(3, grade, now)
+        (card, due) = learner.due_card(now)
+        assert card == 3
+        assert due - now == pytest.approx(interval, rel=1e-6)
+        now = due
+    row = learner.rows[3]
+    assert (learner.reps[row], learner.lapses[row]) == (0, 1)
+    # each perfect review adds 0.1 to the ease, and a lapse leaves it alone
+    assert learner.ease[row] == pytest.approx(2.8)
+    learner.review(3, 3, now)
+    assert learner.ease[row] == pytest.approx(2.8 - 0.14)
+
+def test_new_cards():
+    deck = scheduler.synthetic_deck(200)
+    learner = scheduler.Learner(deck, seed=3)
+    shown = []
+    for now in range(200):
+        card = learner.next(now)
+        shown.append(card)
+        learner.review(card, 5, now)
+    # nothing's due for a day, so every card is new until they run out
+    assert sorted(shown) == list(range(200))
+    assert learner.new_card() is None
+    assert learner.next(300) == shown[0] # then the one due soonest
+
+def test_new_card_not_lost():
+    # a new card that's shown but not reviewed is shown again, rather than skipped
+    deck = scheduler.synthetic_deck(20, {'ctype': 1})
+    learner = scheduler.Learner(deck, seed=1)
+    first = learner.next(0)
+    assert learner.next(0) == first
+    learner.review(first, 5, 0)
+    second = learner.next(0)
+    assert second != first
+    learner.seen([second], [10])
+    assert learner.new_card() not in (first, second)
+
+def test_seen_checked():
+    learner = scheduler.Learner(scheduler.synthetic_deck(100), seed=1)
+    learner.seen([1, 2], [10, 20])
+    for cards in ([3, 3], [2, 4]):
+        with pytest.raises(ValueError):
+            learner.seen(cards, [10, 20])
+    assert len(learner) == 2
+    assert learner.rows == {1: 0, 2: 1}
+
+def test_weak_areas():
+    deck = scheduler.synthetic_deck(30000, {'ctype': 3})
+    (names, codes) = deck.categories['ctype']
+    learner = scheduler.Learner(deck, seed=4)
+    # always wrong in ctype0, always right in the rest
+    for now in range(3000):
+        card = learner.next(now)
+        learner.review(card, 0 if codes[card] == 0 else 5, now + 10**6)
+    share = numpy.bincount(codes[learner.card[:len(learner)]], minlength=3) / len(learner)
+    assert share[0] > 0.6
+
+    # weights by name favor a category from the start
+    learner = scheduler.Learner(deck, weights={'ctype2': 8.0}, seed=5)
+    drawn = [learner.new_card() for i in range(1000)]
+    assert numpy.bincount(codes[drawn], minlength=3)[2] > 700
+
+def test_save_and_load(tmp_path):
+    deck = scheduler.synthetic_deck(1000)
+    learner = scheduler.Learner(deck, weak_by='keysig', seed=6)
+    for now in range(300):
+        learner.review(learner.next(now), now % 6, now)
+    filename = str(tmp_path / "learner.npz")
+    learner.save(filename)
+    loaded = scheduler.Learner.load(deck, filename)
+    assert len(loaded) == len(learner)
+    assert loaded.weak_by == 'keysig'
+    for name in ('card', 'due', 'ease', 'reps', 'lapses', 'reviews', 'misses', 'next_new'):
+        assert (getattr(loaded, name)[:len(loaded)] == getattr(learner, name)[:len(learner)]).all()
+    assert loaded.due_card(300) == learner.due_card(300)
+    with pytest.raises(ValueError):
+        scheduler.Learner.load(scheduler.synthetic_deck(999), filename)
+
+def test_deck_from_db(tmp_path):
+    filename = str(tmp_path / "cards.db")
+    with carddb.CardDB(filename) as db:
+        for (root, ctype) in (('C', 'dom7'), ('F', 'dom7'), ('C', 'maj7')):
+            db.add(f"chords/keysig-C/blues/{ctype}/{root}{ctype}", {'kind': 'chord', 'ctype': ctype, 'keysig': 'C'}, b"<xml/>")
+    with carddb.CardDB(filename, readonly=True) as db:
+        deck = scheduler.Deck.from_db(db)
+    assert deck.size == 3
+    (names, codes) = deck.categories['ctype']
+    assert [names[c] for c in codes] == ['dom7', 'dom7', 'maj7']
+    assert deck.key(2) == "chords/keysig-C/blues/maj7/Cmaj7"
+    assert [m.tolist() for m in deck.members('ctype')] == [[0, 1], [2]]
+    assert deck.categories['interval'][0] == ('',)
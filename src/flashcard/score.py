@@ -1,14 +1,49 @@
 # Score Elements - mostly, a wrapper for music21
+#
+# music21 takes most of a second to import, so it's only imported when something needs it: the
+# music21 writers, Note.note, and note names only music21 understands.  Everything else, including
+# the native writers, works without it.
 
 from enum import Enum
 import typing
 
-import music21
-import music21.midi.translate
-from music21.duration import Duration
-
 import re
 
+try:
+    import intervals
+    import musicxml
+    import smf
+except:
+    from flashcard import intervals
+    from flashcard import musicxml
+    from flashcard import smf
+
+# How toXml() writes MusicXML: 'music21' (build a music21 stream and export it)
+# or 'native' (write it directly with musicxml.py, much faster)
+xml_writer = 'music21'
+
+# How toMidi() writes MIDI: 'music21' (streamToMidiFile) or 'native' (smf.py, much faster)
+midi_writer = 'music21'
+
+# (not the settings above: a star import would copy them, and miss later changes)
+__all__ = [
+    'm21',
+    'Clef', 'Mode', 'Key', 'KeyAndMode', 'key_sharps', 'circle', 'root_notes',
+    'Note', 'Duration', 'Tick', 'Sequence', 'Score', 'Outputs', 'output_formats',
+    'sanitize', 'transpose', 'Difficulty', 'too_hard', 'chord',
+]
+
+music21 = None # the music21 module, once m21() has imported it
+
+def m21():
+    '''Return the music21 module, importing it the first time'''
+    global music21
+    if music21 is None:
+        import music21
+        import music21.midi.translate
+        import music21.musicxml.m21ToXml
+    return music21
+
 class Clef(Enum):
     '''Clef types'''
     Treble = 1
@@ -47,14 +82,20 @@ class Key(Enum):
     Bflat = "Bb"
     B = "B"
 
-class KeyAndMode:
-    '''Key and mode'''
-    def __init__(self, tonic: Key, mode: Mode):
-        self.music21_key = music21.key.Key(tonic.name, mode.name)
-        self.name = tonic.value + " " + mode.name
-    
-    def __str__(self):
-        return self.name
+# sharps in the key signature of C in each mode (negative for flats), added to the tonic's sharps in major
+mode_sharps = {
+    Mode.major: 0, Mode.ionian: 0, Mode.minor: -3, Mode.aeolian: -3, Mode.mixolydian: -1,
+    Mode.dorian: -2, Mode.phrygian: -4, Mode.lydian: 1, Mode.locrian: -5,
+}
+
+# sharps in the major key with each natural tonic
+step_sharps = {'F': -1, 'C': 0, 'G': 1, 'D': 2, 'A': 3, 'E': 4, 'B': 5}
+
+def key_sharps(tonic: Key, mode: Mode) -> int:
+    '''Number of sharps (negative for flats) in the key signature, as music21.key.Key(...).sharps'''
+    step = tonic.value[0]
+    alter = {'#': 1, 'b': -1}.get(tonic.value[1:], 0)
+    return step_sharps[step] + 7 * alter + mode_sharps[mode]
 
 # circle of fifths
 circle = ('C', 'G', 'D', 'A', 'E', 'B', 'Gb', 'Db', 'Ab', 'Eb', 'Bb', 'F')
@@ -69,31 +110,217 @@ root_notes = ('A', 'Bb', 'B', 'C', 'C#', 'Db', 'D', 'Eb', 'E', 'F', 'F#', 'Gb',
 # Unlike music21, our Note has no duration.  We put Notes in Ticks to give duration.
 # TODO: Rests NYI
 
-# A note can be initialized from a name (str) or a MIDI note number (int).
+# A note can be initialized from a name (str), a MIDI note number (int), or a music21 Pitch.
+#
+# Notes are interned: Note('C4') or Note(61, keyAndMode) returns the same object each time, and
+# spelling is done here from small tables rather than by music21.  The music21 Note is only
+# created if something asks for it.
+
+steps = 'CDEFGAB'
+step_semitones = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
+
+# how music21 spells MIDI note numbers, by pitch class: (step, alter)
+midi_spellings = intervals.midi_spellings
+
+# accidentals in music21 note names, by alter
+accidental_text = intervals.accidental_text
+
+# accidentals we accept in note names, e.g. 'C#4', 'Eb4', 'E-4', 'F##4', 'Csharp2' (from Key names)
+accidental_alters = {'#': 1, '##': 2, '-': -1, '--': -2, 'b': -1, 'bb': -2, 'sharp': 1, 'flat': -1, 'n': 0}
+note_name_re = re.compile(r'([A-Ga-g])(##?|--?|bb?|sharp|flat|n)?(\d+)?$')
+
+# order in which sharps are added to key signatures; flats are the reverse
+sharp_order = 'FCGDAEB'
+
+def key_accidentals(sharps:int) -> dict:
+    '''Map step to alter for a key signature with this many sharps (negative for flats)
+
+    Like music21's KeySignature.accidentalByStep(), past 7 the count wraps around to doubles.
+    '''
+    order = sharp_order if sharps >= 0 else sharp_order[::-1]
+    sign = 1 if sharps >= 0 else -1
+    alters = dict.fromkeys(steps, 0)
+    for i in range(abs(sharps)):
+        alters[order[i % 7]] += sign
+    return alters
+
+def key_spellings(sharps:int) -> tuple:
+    '''Return how to spell each pitch class, as (step, alter), in a key signature with this many sharps
+
+    Notes in the key are spelled as the key signature has them (so B major has C#, and Gb major
+    has Cb).  Other notes are natural if they can be, and otherwise sharp in sharp keys, flat in
+    flat keys, and as music21 spells MIDI numbers in C.
+    '''
+    alters = key_accidentals(sharps)
+    spellings = [None] * 12
+    for step in steps:
+        spellings[(step_semitones[step] + alters[step]) % 12] = (step, alters[step])
+    for pc in range(12):
+        if spellings[pc] is not None:
+            continue
+        natural = [step for step in steps if step_semitones[step] == pc]
+        if natural:
+            spellings[pc] = (natural[0], 0)
+        elif sharps > 0:
+            spellings[pc] = (steps[steps.index(midi_spellings[pc - 1][0])], 1)
+        elif sharps < 0:
+            spellings[pc] = (steps[steps.index(midi_spellings[(pc + 1) % 12][0])], -1)
+        else:
+            spellings[pc] = midi_spellings[pc]
+    return tuple(spellings)
+
+class KeyAndMode:
+    '''Key and mode, with their key signature and scale worked out once
+
+    There's one KeyAndMode for each Key and Mode: KeyAndMode(Key.Eflat, Mode.major) looks it up in
+    registry rather than making a new one.  The music21 Key is only created if something asks for it.
+    '''
+    __slots__ = ('tonic', 'mode', 'name', 'sharps', 'alters', 'scale', 'spellings', 'diatonic', '_music21_key')
+
+    # (Key, Mode) -> KeyAndMode, for all of them
+    registry = {}
+
+    def __new__(cls, tonic: Key, mode: Mode):
+        return cls.registry[(tonic, mode)]
+
+    @classmethod
+    def _make(cls, tonic: Key, mode: Mode):
+        kam = object.__new__(cls)
+        kam.tonic = tonic
+        kam.mode = mode
+        kam.name = tonic.value + " " + mode.name
+        kam.sharps = key_sharps(tonic, mode)
+        kam.alters = key_accidentals(kam.sharps)        # step -> alter in the key signature
+        start = steps.index(tonic.value[0])
+        kam.scale = tuple((step, kam.alters[step]) for step in (steps[start:] + steps[:start])) # degrees 1-7
+        kam.spellings = key_spellings(kam.sharps)       # pitch class -> (step, alter)
+        kam.diatonic = frozenset((step_semitones[step] + alter) % 12 for (step, alter) in kam.scale)
+        kam._music21_key = None
+        return kam
+
+    def __reduce__(self):
+        return (KeyAndMode, (self.tonic, self.mode))
+
+    @property
+    def music21_key(self):
+        '''The music21 Key, created on first use'''
+        if self._music21_key is None:
+            self._music21_key = m21().key.Key(self.tonic.name, self.mode.name)
+        return self._music21_key
+
+    def __str__(self):
+        return self.name
+
+KeyAndMode.registry.update(((k, m), KeyAndMode._make(k, m)) for k in Key for m in Mode)
 
 class Note:
     '''Note or rest'''
-    def __init__(self, name: str, keyAndMode: KeyAndMode=None):
-        self.name = name
-        if name != "rest":
-            # FIXME: should use music21.pitch instead
-            self.note = music21.note.Note(name)
-            if not isinstance(name, str):
-                # it's a MIDI note number
-                self.name = self.note.name + str(self.note.octave)
-            if keyAndMode is not None:
-                # Fix the note to match the key signature
-                # FIXME: not working as intended, see test_note_named_note_fix() and test_note_midi_note_fix_flatkey()
-                ks = music21.key.KeySignature(keyAndMode.music21_key.sharps)
-                self.note.pitch.accidental = ks.accidentalByStep(self.note.pitch.step)
-                self.name = self.note.name + str(self.note.octave)
+    __slots__ = ('name', 'step', 'alter', 'octave', '_midi', '_note')
+
+    # (name or MIDI number, key signature sharps) -> Note
+    _interned = {}
+
+    def __new__(cls, name, keyAndMode: KeyAndMode=None):
+        if isinstance(name, (str, int)):
+            # spelling only depends on the key signature
+            key = (name, None if keyAndMode is None else keyAndMode.sharps)
+            note = cls._interned.get(key)
+            if note is None:
+                note = cls._interned[key] = cls._make(name, keyAndMode)
+            return note
+        # a music21 Pitch
+        step = name.step
+        alter = 0 if name.accidental is None else int(name.accidental.alter)
+        return cls._spelled(step, alter, name.octave, keyAndMode, name.name + str(name.octave))
+
+    @classmethod
+    def _make(cls, name, keyAndMode: KeyAndMode):
+        if name == "rest":
+            return cls._build(name, None, 0, None)
+        if isinstance(name, int):
+            # it's a MIDI note number, spelled for the key
+            spellings = midi_spellings if keyAndMode is None else keyAndMode.spellings
+            (step, alter) = spellings[name % 12]
+            # like music21, 0-11 are taken as pitch classes with no octave
+            octave = (name - step_semitones[step] - alter) // 12 - 1 if name >= 12 else None
+            return cls._build(step + accidental_text[alter] + ('' if octave is None else str(octave)), step, alter, octave)
+        m = note_name_re.match(name)
+        if m is None:
+            # something only music21 understands
+            pitch = m21().pitch.Pitch(name)
+            alter = 0 if pitch.accidental is None else int(pitch.accidental.alter)
+            return cls._spelled(pitch.step, alter, pitch.octave, keyAndMode, name)
+        (step, accidental, octave) = m.groups()
+        alter = accidental_alters[accidental] if accidental else 0
+        octave = None if octave is None else int(octave)
+        return cls._spelled(step.upper(), alter, octave, keyAndMode, name)
+
+    @classmethod
+    def _spelled(cls, step:str, alter:int, octave:int, keyAndMode: KeyAndMode, name:str):
+        if keyAndMode is not None:
+            # a note in the key is spelled the key's way, e.g. Db4 is C#4 in B major
+            pc = (step_semitones[step] + alter) % 12
+            if pc in keyAndMode.diatonic and keyAndMode.spellings[pc] != (step, alter):
+                (new_step, new_alter) = keyAndMode.spellings[pc]
+                if octave is not None:
+                    octave += (step_semitones[step] + alter - step_semitones[new_step] - new_alter) // 12
+                (step, alter) = (new_step, new_alter)
+                name = step + accidental_text[alter] + ('' if octave is None else str(octave))
+        return cls._build(name, step, alter, octave)
+
+    @classmethod
+    def _build(cls, name:str, step:str, alter:int, octave:int):
+        note = object.__new__(cls)
+        note.name = name
+        note.step = step
+        note.alter = alter
+        note.octave = octave
+        if step is None:
+            note._midi = None
+        else:
+            # like music21, a note without an octave is in octave 4
+            midi = ((4 if octave is None else octave) + 1) * 12 + step_semitones[step] + alter
+            # and notes out of MIDI range are folded back into it
+            if midi > 127:
+                midi = 12 * 9 + midi % 12
+                if midi < 127 - 12:
+                    midi += 12
+            elif midi < 0:
+                midi = midi % 12
+            note._midi = midi
+        note._note = None
+        return note
+
+    def __reduce__(self):
+        # the name is fully spelled, so it's all we need to make the same note again
+        return (Note, (self.name,))
+
+    @property
+    def note(self):
+        '''The music21 note, created on first use'''
+        if self._note is None:
+            self._note = m21().note.Rest() if self.step is None else m21().note.Note(self.m21Name())
+        return self._note
+
+    def transpose(self, change) -> 'Note':
+        '''Return the note an interval away (e.g. 'M3', '-P8', or 4 semitones), or a tuple of intervals applied in order
+
+        The result is spelled from the interval, like music21, and named like music21 (e.g. 'E-4').
+        '''
+        (step, alter, octave) = intervals.transpose(self.step, self.alter, self.octave, change)
+        return Note(step + accidental_text[alter] + ('' if octave is None else str(octave)))
+
+    def m21Name(self) -> str:
+        '''Name in music21's spelling, such as E-4'''
+        octave = '' if self.octave is None else str(self.octave)
+        return self.step + accidental_text[self.alter] + octave
 
     def __str__(self):
         return self.name
     
     def midi(self):
         '''Return the MIDI number of the note'''
-        return self.note.pitch.midi
+        return self._midi
 
     def __eq__(self, other):
         if not isinstance(other, Note):
@@ -109,8 +336,11 @@ def sanitize(xml:str) -> str:
     xml = re.sub(r'<software>music21.*?</software>', '<software>music21</software>', xml)  # drop version
     return xml
 
-def transpose(pitch:music21.pitch.Pitch, change:str):
+def transpose(pitch:'music21.pitch.Pitch', change:str):
     # change is either a Music21 degree (e.g., 'M3', 'm3', 'P5') or a tuple of degrees to apply in order
+    # pitch can also be a Note, which is transposed without music21
+    if isinstance(pitch, Note):
+        return pitch.transpose(change)
     degrees = (change,)
     if isinstance(change, tuple):
         degrees = change
@@ -118,36 +348,109 @@ def transpose(pitch:music21.pitch.Pitch, change:str):
         pitch = pitch.transpose(d)
     return pitch
 
-def chord(root: Note, keysig: Key, parts: list[list[str]]):
-    '''Return one or two lists of notes for the chord with the given parts (lists of intervals, per clef)'''
+# Difficulty decides which cards are too hard to show.  For now that's just double sharps and
+# double flats; see https://www.musictheory.net/exercises/chord and its "Difficulty" setting.
+class Difficulty(Enum):
+    simple = "simple"   # no double sharps or double flats on the staff
+    full = "full"       # anything goes
+
+def too_hard(parts: list[list[Note]], keyAndMode: KeyAndMode, difficulty: Difficulty=Difficulty.simple) -> str:
+    '''Return why the notes are too hard for the difficulty (e.g. 'double-sharp'), or None if they're fine
+
+    parts are lists of notes sounding together, one per clef.  This looks at the accidentals the
+    score would show, so it can be checked before anything's rendered: a double sharp in the key
+    signature (e.g. F## in G# major) isn't shown, so it's fine.
+    '''
+    if difficulty == Difficulty.full:
+        return None
+    sharps = 0 if keyAndMode is None else keyAndMode.sharps
+    alters = musicxml.key_alters(sharps)
+    for part in parts:
+        spelled = [musicxml.spelling(note) for note in part]
+        for (i, note) in enumerate(spelled):
+            if abs(note[1]) < 2:
+                continue
+            shown = musicxml.accidental(note, spelled[:i] + spelled[i+1:], [], alters)
+            if shown in ('double-sharp', 'flat-flat'):
+                return shown
+    return None
+
+def chord(root: Note, keysig: Key, parts: list[list[str]], difficulty: Difficulty=Difficulty.full):
+    '''Return one or two lists of notes for the chord with the given parts (lists of intervals, per clef)
+
+    Returns None if there are no parts, or the chord is too hard for the difficulty in the key signature.
+    '''
     if parts is None:
         return None
-    root_pitch = root.note.pitch
     note_parts = []
     for part in parts:
-        intervals = [transpose(root_pitch, interval) for interval in part]
-        note_parts.append([Note(pitch) for pitch in music21.chord.Chord(intervals).pitches])
+        note_parts.append([root.transpose(interval) for interval in part])
     # put treble part first
     note_parts.reverse()
+    if difficulty != Difficulty.full:
+        keyAndMode = None if keysig is None else KeyAndMode(keysig, Mode.major)
+        if too_hard(note_parts, keyAndMode, difficulty) is not None:
+            return None
     return note_parts
 
+class Duration:
+    '''How long a Tick lasts, in quarter notes: Duration(1), Duration(0.5) or Duration('half', dots=1)
+
+    Like music21's Duration, with just the parts we use (and equal to a music21 Duration of the same length).
+    '''
+    # quarter length of each note type
+    type_lengths = {'breve': 8.0, 'whole': 4.0, 'half': 2.0, 'quarter': 1.0, 'eighth': 0.5, '16th': 0.25,
+                    '32nd': 0.125, '64th': 0.0625}
+
+    def __init__(self, length=1.0, dots:int=0):
+        if isinstance(length, str):
+            self.type = length
+            self.dots = dots
+            self.quarterLength = self.type_lengths[length] * (2 - 0.5 ** dots)
+        else:
+            self.quarterLength = float(length)
+            (self.type, self.dots) = self.type_and_dots(self.quarterLength)
+
+    @classmethod
+    def type_and_dots(cls, quarterLength:float) -> tuple:
+        '''Return the (type, dots) written for a length, with up to 2 dots, or ('complex', 0) if it'd
+        take tied notes (as music21 says; the native MusicXML writer refuses those)'''
+        for dots in (0, 1, 2):
+            for (type, length) in cls.type_lengths.items():
+                if length * (2 - 0.5 ** dots) == quarterLength:
+                    return (type, dots)
+        return ('complex', 0)
+
+    def __eq__(self, other):
+        return self.quarterLength == getattr(other, 'quarterLength', None)
+
+    def __hash__(self):
+        return hash(self.quarterLength)
+
+    def __repr__(self):
+        return f"Duration({self.quarterLength})"
+
 class Tick:
-    '''set of Notes and rests that happen at the same time for the same duration'''
+    '''set of Notes that happen at the same time for the same duration; no notes is a rest'''
     def __init__(self, duration: Duration, notes: set[Note]=None):
         self.duration = duration
         if notes == None:
             notes = set()
-        else:
-            self.notes = notes
+        self.notes = notes
 
     def __str__(self):
-        # TODO: for now, ignore duration because it's always 1
-        # return "Tick " + str(self.duration) + " " + " ".join(sorted([str(n) for n in self.notes]))
-        return "Tick " + " ".join(sorted([str(n) for n in self.notes]))
+        # the duration is only shown if it isn't a quarter note, which most cards are
+        length = "" if self.duration.quarterLength == 1 else f"{self.duration.quarterLength:g} "
+        return "Tick " + length + (" ".join(sorted([str(n) for n in self.notes])) or "rest")
     
     def add(self, notes: set[Note]):
         self.notes.update(notes)
 
+    def ordered(self) -> list[Note]:
+        '''The notes from low to high, so the writers give the same output in every process
+        (the order of a set of Notes depends on string hashing, which changes from run to run)'''
+        return sorted(self.notes, key=lambda n: (n.midi() is not None, n.midi() or 0, n.name))
+
 class Sequence:
     '''A sequence of Ticks, all in the same clef'''
     def __init__(self, clef: Clef=None, ticks: list[Tick]=None):
@@ -181,6 +484,7 @@ class Score:
     
     def score(self):
         '''Render the system to a score'''
+        music21 = m21()
         score = music21.stream.Score()
         part_num = 1
         for sequence in self.sequences:
@@ -193,16 +497,24 @@ class Score:
 
             # FIXME: key signature doesn't appear
             if self.keyAndMode is not None:
-                key_sig = music21.key.KeySignature(self.keyAndMode.music21_key.sharps)
+                key_sig = music21.key.KeySignature(self.keyAndMode.sharps)
                 part.append(key_sig)
             match sequence.clef:
                 case Clef.Bass:
                     part.append(music21.clef.BassClef())
                 case Clef.Treble:
                     part.append(music21.clef.TrebleClef())
+            # build the part's chords first and append them in one go: appending one at a time
+            # redoes the part's bookkeeping for every tick, which adds up in a long exercise
+            chords = []
             for tick in sequence.ticks:
-                chord = music21.chord.Chord([note.note for note in tick.notes])
-                part.append(chord)
+                ql = tick.duration.quarterLength
+                if not tick.notes:
+                    chords.append(music21.note.Rest(quarterLength=ql))
+                    continue
+                # new music21 notes every time, because the chord takes ownership of them
+                chords.append(music21.chord.Chord([note.m21Name() for note in tick.ordered()], quarterLength=ql))
+            part.append(chords)
             score.append(part)
             part_num += 1
         # TODO: put treble part first, so treble clef is on top in rendering
@@ -216,20 +528,111 @@ class Score:
         self.score().write('musicxml', fp=filename)
         print("Wrote '" + filename + "'")
 
-    def toXml(self) -> str:
+    def toXml(self, writer:str=None, m21_score:'music21.stream.Score'=None) -> str:
         # generate XML text rather than writing to file
-        m21_score = self.score()
-        xml = music21.musicxml.m21ToXml.GeneralObjectExporter(m21_score).parse().decode('utf-8')
+        # writer is 'music21' or 'native', and defaults to xml_writer
+        # m21_score is the result of score(), if the caller already has it
+        if (writer or xml_writer) == 'native':
+            return musicxml.score_to_xml(self)
+        if m21_score is None:
+            m21_score = self.score()
+        # the exporter works on a copy, so m21_score can be reused
+        xml = m21().musicxml.m21ToXml.GeneralObjectExporter(m21_score).parse().decode('utf-8')
         return sanitize(xml)
 
-    def toMidi(self) -> bytes:
-        m21_score = self.score()
-        mf = music21.midi.translate.streamToMidiFile(m21_score)
+    def writeXml(self, f, writer:str=None):
+        '''Write MusicXML to an open text file; the native writer writes it a measure at a time'''
+        if (writer or xml_writer) == 'native':
+            musicxml.write_xml(self, f)
+        else:
+            f.write(self.toXml('music21'))
+
+    def toMidi(self, writer:str=None, m21_score:'music21.stream.Score'=None) -> bytes:
+        # writer is 'music21' or 'native', and defaults to midi_writer
+        if (writer or midi_writer) == 'native':
+            return smf.score_to_midi(self)
+        if m21_score is None:
+            m21_score = self.score()
+        mf = m21().midi.translate.streamToMidiFile(m21_score)
         midi_bytes = mf.writestr()
         return midi_bytes
     
-    def toOutputs(self) -> typing.Tuple[str, bytes]:
-        return (self.toXml(), self.toMidi())
+    def toOutputs(self) -> 'Outputs':
+        return Outputs(self)
+
+class Outputs:
+    '''The rendered outputs of a Score, each rendered the first time it's read
+
+    Read outputs.xml, outputs.midi, or outputs.get(format) for any format in output_formats.
+    The music21 score is built at most once, and only if a music21 writer needs it.
+    For compatibility, this also acts like the (xml, midi) tuple that toOutputs() used to return.
+    '''
+    def __init__(self, score: Score):
+        self.score = score
+        self._m21_score = None
+        self._rendered = {}
+
+    def m21Score(self) -> 'music21.stream.Score':
+        '''The music21 score, built on first use'''
+        if self._m21_score is None:
+            self._m21_score = self.score.score()
+        return self._m21_score
+
+    def get(self, format:str):
+        '''Return the given format, rendering it if it hasn't been already'''
+        if format not in self._rendered:
+            self._rendered[format] = output_formats[format](self)
+        return self._rendered[format]
+
+    @property
+    def xml(self) -> str:
+        return self.get('xml')
+
+    @property
+    def midi(self) -> bytes:
+        return self.get('midi')
+
+    def rendered(self) -> list[str]:
+        '''Formats that have been rendered so far'''
+        return list(self._rendered)
+
+    # tuple compatibility: xml, midi = outputs
+    def __iter__(self):
+        yield self.xml
+        yield self.midi
+
+    def __getitem__(self, index:int):
+        if isinstance(index, slice):
+            return tuple(self)[index]
+        return self.get(('xml', 'midi')[index])
+
+    def __len__(self):
+        return 2
+
+def render_xml(outputs: Outputs) -> str:
+    if xml_writer == 'native':
+        return outputs.score.toXml('native')
+    return outputs.score.toXml('music21', outputs.m21Score())
+
+def render_midi(outputs: Outputs) -> bytes:
+    if midi_writer == 'native':
+        return outputs.score.toMidi('native')
+    return outputs.score.toMidi('music21', outputs.m21Score())
+
+def render_wav(outputs: Outputs) -> bytes:
+    # audio needs numpy, so it's only imported for the first preview
+    try:
+        import audio
+    except:
+        from flashcard import audio
+    return audio.score_to_wav(outputs.score)
+
+# format name -> function(Outputs) that renders it; add more formats here
+output_formats = {
+    'xml': render_xml,
+    'midi': render_midi,
+    'wav': render_wav,
+}
 
 if __name__ == '__main__': # pragma: no cover
 
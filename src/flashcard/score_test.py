@@ -5,9 +5,11 @@ import music21
 
 try:
     from score import *
+    import score
     import chords
 except:
     from flashcard.score import *
+    from flashcard import score
     from flashcard import chords
 
 def test_KeyAndMode():
@@ -16,6 +18,23 @@ def test_KeyAndMode():
 
     assert str(kam) == kam.name
 
+def test_key_sharps_match_music21():
+    for key in Key:
+        for mode in Mode:
+            kam = KeyAndMode(key, mode)
+            assert kam.sharps == music21.key.Key(key.name, mode.name).sharps, kam.name
+            assert kam.music21_key.sharps == kam.sharps
+
+def test_duration():
+    for (ql, type, dots) in ((1, 'quarter', 0), (2, 'half', 0), (0.5, 'eighth', 0), (1.5, 'quarter', 1),
+                             (3.5, 'half', 2), (4, 'whole', 0), (5, 'complex', 0)):
+        d = Duration(ql)
+        m21 = music21.duration.Duration(ql)
+        assert (d.quarterLength, d.type, d.dots) == (m21.quarterLength, m21.type, m21.dots) == (ql, type, dots)
+        assert d == m21
+    assert Duration('half', dots=1) == Duration(3)
+    assert Duration('quarter') != Duration('eighth')
+
 def test_note_no_octave():
     n = Note('C')
     assert n.name == 'C'
@@ -37,19 +56,33 @@ def test_note_midi_note_fix_sharpkey():
     assert n.name == 'C#4'
     assert n.midi() == 61
 
-@pytest.mark.skip # For Bb major, 61 should be Db, not C#
 def test_note_midi_note_fix_flatkey():
     # make sure the note is a flat for a flat key and sharp for a sharp key
     n = Note(61, KeyAndMode(Key.Bflat, Mode.major))
-    assert n.name == 'Db4'
+    assert n.name == 'D-4' # MIDI numbers are named in music21's spelling
+    assert (n.step, n.alter) == ('D', -1)
     assert n.midi() == 61
 
-@pytest.mark.skip # Db should be changed to C#, but we don't actually use this case.
 def test_note_named_note_fix():
     n = Note('Db4', KeyAndMode(Key.B, Mode.major))
-    if False:
-        # FIXME
-        assert n.name == 'C#4'
+    assert n.name == 'C#4'
+    assert n.midi() == 61
+    # notes that aren't in the key keep their spelling
+    assert Note('Db4', KeyAndMode(Key.C, Mode.major)).name == 'Db4'
+    # and the octave follows the pitch
+    assert Note('C4', KeyAndMode(Key.Csharp, Mode.major)).name == 'B#3'
+    assert Note('B4', KeyAndMode(Key.Gflat, Mode.major)).name == 'C-5'
+
+def test_key_registry():
+    kam = KeyAndMode(Key.Eflat, Mode.minor)
+    assert kam is KeyAndMode(Key.Eflat, Mode.minor)
+    assert len(KeyAndMode.registry) == len(Key) * len(Mode)
+    assert kam.sharps == -6
+    assert kam.scale == (('E', -1), ('F', 0), ('G', -1), ('A', -1), ('B', -1), ('C', -1), ('D', -1))
+    assert kam.alters['C'] == -1 and kam.alters['F'] == 0
+    assert kam.spellings[11] == ('C', -1)
+    import pickle
+    assert pickle.loads(pickle.dumps(kam)) is kam
 
 def test_note_equal():
     n = Note('C4')
@@ -138,15 +171,17 @@ def test_tick():
     t = Tick(qn, set((Note('C4'),)))
     assert t.duration == qn
     s = str(t)
-    # TODO: for now, ignore duration because it's always 1
-    # assert s == "Tick " + str(qn) + " C4"
     assert s == "Tick C4"
 
     t.add(set((Note('D4'),)))
-    # TODO: for now, ignore duration because it's always 1
-    # assert str(t) == "Tick " + str(qn) + " C4 D4"
     assert str(t) == "Tick C4 D4"
 
+    # the duration is shown if it isn't a quarter; no notes is a rest
+    assert str(Tick(Duration('half', dots=1), {Note('C4')})) == "Tick 3 C4"
+    rest = Tick(Duration(0.5))
+    assert rest.notes == set()
+    assert str(rest) == "Tick 0.5 rest"
+
 def test_sequence():
     s = Sequence()
     assert s.clef == None
@@ -184,3 +219,156 @@ def test_score(tmpdir:str):
 
     xml, midi = s.toOutputs()
 
+
+def test_outputs_lazy(monkeypatch):
+    qn = music21.duration.Duration(1)
+    s = Score([Sequence(Clef.Treble, ticks=[Tick(qn, {Note('C4'), Note('E4')})])])
+    built = []
+    m21_score = s.score
+    monkeypatch.setattr(s, 'score', lambda: built.append(1) or m21_score())
+
+    outputs = s.toOutputs()
+    assert outputs.rendered() == []
+    assert built == []
+
+    xml = outputs.xml
+    assert '<step>E</step>' in xml
+    assert outputs.rendered() == ['xml']
+    assert outputs.xml is xml   # kept, not rendered again
+
+    midi = outputs.midi
+    assert midi[:4] == b'MThd'
+    assert len(built) == 1      # music21 score built once for both
+
+    # tuple compatible
+    assert len(outputs) == 2
+    assert outputs[0] is xml
+    assert outputs[1] is midi
+    assert outputs[:] == (xml, midi)
+    x, m = outputs
+    assert (x, m) == (xml, midi)
+
+def test_outputs_native(monkeypatch):
+    s = Score([Sequence(Clef.Treble, ticks=[Tick(music21.duration.Duration(1), {Note('C4')})])])
+    monkeypatch.setattr(s, 'score', lambda: pytest.fail("music21 score shouldn't be built"))
+    monkeypatch.setattr(score, 'xml_writer', 'native')
+    monkeypatch.setattr(score, 'midi_writer', 'native')
+    outputs = s.toOutputs()
+    assert '<step>C</step>' in outputs.xml
+    assert outputs.midi[:4] == b'MThd'
+
+def enharmonics(pitch):
+    '''Every other spelling of a music21 pitch, with up to double sharps or flats'''
+    octave = pitch.implicitOctave
+    out = []
+    for step in 'CDEFGAB':
+        for alter in (-2, -1, 0, 1, 2):
+            for o in (octave - 1, octave, octave + 1):
+                p = music21.pitch.Pitch(step=step, octave=o)
+                if alter:
+                    p.accidental = music21.pitch.Accidental(alter)
+                if p.ps == pitch.ps and (p.step, alter, o) != (pitch.step, pitch.alter, octave):
+                    out.append(p)
+    return out
+
+def m21_note(name, sharps=None):
+    '''(name, midi) of a note spelled for a key signature, worked out with music21
+
+    The pitch stays the same.  If one of its spellings is in the key signature, that's the one;
+    otherwise a MIDI number is natural if it can be, else sharp in sharp keys and flat in flat keys.
+    '''
+    n = music21.note.Note(name)
+    if sharps is None:
+        return (n.name + ('' if n.octave is None else str(n.octave)) if not isinstance(name, str) else name, n.pitch.midi)
+    pitch = n.pitch
+    ks = music21.key.KeySignature(sharps)
+    alter = lambda p: 0 if p.accidental is None else int(p.accidental.alter)
+    in_key = lambda p: alter(p) == (0 if ks.accidentalByStep(p.step) is None else int(ks.accidentalByStep(p.step).alter))
+    candidates = [pitch] + enharmonics(pitch)
+    spelled = [p for p in candidates if in_key(p)]
+    if spelled:
+        p = spelled[0]
+    elif not isinstance(name, int) or sharps == 0:
+        return (name if isinstance(name, str) else n.name + ('' if n.octave is None else str(n.octave)), pitch.midi)
+    else:
+        naturals = [p for p in candidates if alter(p) == 0]
+        accidentals = [p for p in candidates if alter(p) == (1 if sharps > 0 else -1)]
+        p = (naturals + accidentals)[0]
+    if isinstance(name, str) and p.name == pitch.name and p.octave == pitch.octave:
+        return (name, pitch.midi)
+    if pitch.octave is None:
+        # a pitch class: no octave, so it's taken to be in octave 4
+        return (p.name, music21.pitch.Pitch(p.name).midi)
+    return (p.name + str(p.octave), p.midi)
+
+def test_note_spelling_matches_music21():
+    kams = [None] + [KeyAndMode(k, m) for k in Key for m in (Mode.major, Mode.minor)]
+    for kam in kams:
+        sharps = None if kam is None else kam.music21_key.sharps
+        for nn in range(128):
+            n = Note(nn, kam)
+            assert (n.name, n.midi()) == m21_note(nn, sharps), f"{nn} in {kam}"
+        for name in ('C4', 'C#4', 'Eb4', 'E-4', 'F##4', 'B--4', 'Csharp2', 'Bflat3', 'c4', 'bb3', 'C'):
+            n = Note(name, kam)
+            assert (n.name, n.midi()) == m21_note(name, sharps), f"{name} in {kam}"
+
+def test_note_interned():
+    assert Note('C4') is Note('C4')
+    kam = KeyAndMode(Key.D, Mode.major)
+    assert Note(61, kam) is Note(61, kam)
+    assert Note(61, kam) is Note(61, KeyAndMode(Key.D, Mode.major))
+    assert Note(61) is not Note(61, kam)
+    n = Note('Eb4')
+    assert (n.step, n.alter, n.octave, n.midi()) == ('E', -1, 4, 63)
+    assert n.m21Name() == 'E-4'
+    assert not hasattr(n, '__dict__')
+
+def test_note_pickle():
+    import pickle
+    n = Note(63, KeyAndMode(Key.Eflat, Mode.major))
+    assert pickle.loads(pickle.dumps(n)) == n
+    assert pickle.loads(pickle.dumps(n)).midi() == 63
+
+# how many times as long as a bare Python startup importing the generator and the service may take
+# (about 4x here, and music21 alone is about 8x; its import is caught by the sys.modules check)
+import_budget = 10
+
+def startup_time(code:str, cwd:str) -> float:
+    '''Seconds a fresh Python takes to run code, the best of 3 so a busy machine doesn't count'''
+    import subprocess, sys, time
+    times = []
+    for i in range(3):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=cwd, check=True)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def test_startup_without_music21(tmpdir):
+    '''Enumerating cards, native rendering and reading packs don't import music21, so start quickly'''
+    import os, subprocess, sys
+    script = f"""
+import sys
+import fcset_gen, service, pack
+assert 'music21' not in sys.modules, 'music21 was imported by the imports'
+fcset_gen.outdir = {str(tmpdir)!r}
+cards = list(fcset_gen.chord_cards())
+assert cards
+fcset_gen.score.xml_writer = fcset_gen.score.midi_writer = 'native'
+outputs = cards[0].render()
+(outputs.xml, outputs.midi)
+with pack.PackWriter({str(tmpdir.join('test.pack'))!r}) as w:
+    w.add('a', pack.encode(outputs.xml))
+assert pack.PackReader({str(tmpdir.join('test.pack'))!r}).xml('a') == outputs.xml
+assert 'music21' not in sys.modules, 'music21 was imported'
+"""
+    src = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, "-c", script], cwd=src, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    # timed against Python's own startup on this machine, rather than a fixed time
+    bare = startup_time("pass", src)
+    imports = startup_time("import fcset_gen, service, pack", src)
+    assert imports < bare * import_budget, f"imports took {imports:.2f}s, a bare startup {bare:.2f}s"
+
+def test_tick_ordered():
+    t = Tick(Duration(1), {Note('G4'), Note('C4'), Note('E-4'), Note('C3')})
+    assert [n.name for n in t.ordered()] == ['C3', 'C4', 'E-4', 'G4']
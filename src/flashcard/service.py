@@ -0,0 +1,316 @@
+# flashcard service - renders any card on demand over HTTP
+#
+# Unlike serving the pre-generated files, this can serve any card the fcgen generators can make:
+#
+#   GET /notes?notes=C4,E4,G4&clef=Treble&key=Eb&mode=major&format=xml
+#   GET /randnote?low=C4&high=G5&key=D          (picks a note, then it's the same as /notes)
+#   GET /interval?note=C4&interval=M3
+#   GET /chord?root=C4&type=dom7&voicing=blues&key=F&format=midi
+#
+# format is 'xml' (the default) or 'midi'.  Renders run in a pool of worker processes so the event
+# loop never waits on music21, and results are kept in an LRU cache keyed by the normalized card
+# spec.  Responses have an ETag, and a request with a matching If-None-Match gets a 304.
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import hashlib
+import urllib.parse
+
+try:
+    from score import Clef, Key, KeyAndMode, Mode, Note
+    from chords import ChordType, Voicing
+    from fcgen import NoteRange, fc_chord, fc_interval, fc_notes, random_note
+    import intervals
+    import score
+except:
+    from flashcard.score import Clef, Key, KeyAndMode, Mode, Note
+    from flashcard.chords import ChordType, Voicing
+    from flashcard.fcgen import NoteRange, fc_chord, fc_interval, fc_notes, random_note
+    from flashcard import intervals
+    from flashcard import score
+
+content_types = {
+    'xml': 'application/vnd.recordare.musicxml+xml',
+    'midi': 'audio/midi',
+}
+
+class BadRequest(Exception):
+    pass
+
+class NotFound(Exception):
+    pass
+
+def enum_value(enum, text:str):
+    '''Return the member of enum with the given name or value, e.g. Key 'Bflat' or 'Bb', ChordType 'dom7' or '7' '''
+    if text is None:
+        return None
+    if text in enum.__members__:
+        return enum[text]
+    for member in enum:
+        if member.value == text:
+            return member
+    raise BadRequest(f"unknown {enum.__name__} '{text}'")
+
+def parse_note(text:str) -> Note:
+    '''Return the Note a client asked for, named the one way music21 would (so 'C04' and 'C4', or 'Cb4'
+    and 'C-4', are the same card)
+
+    It isn't interned like Note(text), since clients can send any number of different names.
+    '''
+    if not text:
+        raise BadRequest("missing note")
+    m = score.note_name_re.match(text)
+    if m is None:
+        raise BadRequest(f"bad note '{text}'")
+    (step, accidental, octave) = m.groups()
+    alter = score.accidental_alters[accidental] if accidental else 0
+    return checked_note(step.upper(), alter, None if octave is None else int(octave), text)
+
+def checked_note(step:str, alter:int, octave:int, text:str) -> Note:
+    if alter not in score.accidental_text:
+        raise BadRequest(f"too many accidentals in '{text}'")
+    midi = ((4 if octave is None else octave) + 1) * 12 + score.step_semitones[step] + alter
+    if not 0 <= midi <= 127:
+        raise BadRequest(f"'{text}' is out of MIDI range")
+    name = step + score.accidental_text[alter] + ('' if octave is None else str(octave))
+    return Note._build(name, step, alter, octave)
+
+def note_name(text:str) -> str:
+    return parse_note(text).name
+
+def interval_name(text:str, note:Note) -> str:
+    '''Return an interval a client asked for from note, named one way (e.g. 'a5' and 'A05' are 'A5')'''
+    try:
+        (generic, semitones) = intervals.parse(text, cache=False)
+    except ValueError as e:
+        raise BadRequest(str(e))
+    quality = intervals.interval_re.match(text).group(2).replace('a', 'A')
+    if len(quality) > 3 or abs(semitones) > 127:
+        raise BadRequest(f"interval '{text}' is too big")
+    name = ('-' if generic < 0 else '') + quality + str(abs(generic) + 1)
+    (step, alter, octave) = intervals.transpose(note.step, note.alter, note.octave, name)
+    checked_note(step, alter, octave, f"{note.name} + {name}")
+    return name
+
+def key_and_mode(query:dict) -> tuple:
+    '''Return (key, mode) names from the query, or (None, None); the mode defaults to major'''
+    key = enum_value(Key, query.get('key'))
+    mode = enum_value(Mode, query.get('mode'))
+    if key is None:
+        if mode is not None:
+            raise BadRequest("mode needs a key")
+        return (None, None)
+    return (key.name, (mode or Mode.major).name)
+
+def card_spec(path:str, query:dict) -> tuple:
+    '''Return the normalized spec of the card a request is for, so equal cards have equal specs
+
+    Raises BadRequest if the request doesn't make sense, or NotFound for an unknown path.
+    '''
+    format = query.get('format', 'xml')
+    if format not in content_types:
+        raise BadRequest(f"unknown format '{format}'")
+    clef = enum_value(Clef, query.get('clef'))
+    clef = None if clef is None else clef.name
+    match path:
+        case '/notes':
+            names = [n for n in query.get('notes', '').split(',') if n]
+            if not names:
+                raise BadRequest("missing notes")
+            notes = {parse_note(n) for n in names}
+            notes = tuple(n.name for n in sorted(notes, key=lambda n: (n.midi(), n.name)))
+            return ('notes', notes, clef) + key_and_mode(query) + (format,)
+        case '/randnote':
+            (key, mode) = key_and_mode(query)
+            kam = None if key is None else KeyAndMode(Key[key], Mode[mode])
+            low = parse_note(query.get('low', 'C4'))
+            high = parse_note(query.get('high', 'C5'))
+            if low.midi() > high.midi():
+                raise BadRequest("low is above high")
+            note = random_note(NoteRange(low, high), kam)
+            return ('notes', (note.name,), clef, key, mode, format)
+        case '/interval':
+            note = parse_note(query.get('note'))
+            interval = interval_name(query.get('interval', ''), note)
+            return ('interval', note.name, interval, clef) + key_and_mode(query) + (format,)
+        case '/chord':
+            root = note_name(query.get('root'))
+            ctype = enum_value(ChordType, query.get('type', 'maj'))
+            voicing = enum_value(Voicing, query.get('voicing', 'standard'))
+            key = enum_value(Key, query.get('key', 'C'))
+            return ('chord', root, ctype.name, voicing.name, key.name, format)
+    raise NotFound(path)
+
+def render(spec:tuple) -> bytes:
+    '''Worker: render a card from its spec; returns None if there's no such card'''
+    # the names in a spec are checked and spelled one way, so there are only so many Notes to intern
+    kind = spec[0]
+    format = spec[-1]
+    if kind == 'chord':
+        (kind, root, ctype, voicing, key, format) = spec
+        outputs = fc_chord(Note(root), ChordType[ctype], Voicing[voicing], Key[key])
+    else:
+        (clef, key, mode) = spec[-4:-1]
+        clef = None if clef is None else Clef[clef]
+        kam = None if key is None else KeyAndMode(Key[key], Mode[mode])
+        if kind == 'notes':
+            outputs = fc_notes([Note(n) for n in spec[1]], clef=clef, keyAndMode=kam)
+        else:
+            outputs = fc_interval(Note(spec[1]), spec[2], clef=clef, keyAndMode=kam)
+    if outputs is None:
+        return None
+    data = outputs.get(format)
+    return data.encode() if isinstance(data, str) else data
+
+def init_worker(xml_writer:str, midi_writer:str):
+    score.xml_writer = xml_writer
+    score.midi_writer = midi_writer
+
+class LRUCache(object):
+    '''A dict that holds at most maxsize items, dropping the least recently used'''
+    def __init__(self, maxsize:int):
+        self.maxsize = maxsize
+        self.items = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.items.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+no_card = object() # cached for a spec with no card (e.g. too hard), so it isn't rendered again
+
+class Service(object):
+    '''The card service: card(spec) renders (or finds in the cache) a card, and serve() answers HTTP'''
+    def __init__(self, executor:concurrent.futures.Executor=None, jobs:int=None, cache_size:int=4096):
+        if executor is None:
+            executor = concurrent.futures.ProcessPoolExecutor(jobs, initializer=init_worker,
+                                                              initargs=(score.xml_writer, score.midi_writer))
+        self.executor = executor
+        self.cache = LRUCache(cache_size)
+        self.rendering = {} # spec -> Task, so a card being rendered isn't rendered again
+        self.renders = 0
+
+    async def card(self, spec:tuple) -> tuple:
+        '''Return (etag, body) for a card, or None if there's no such card'''
+        cached = self.cache.get(spec)
+        if cached is not None:
+            return None if cached is no_card else cached
+        task = self.rendering.get(spec)
+        if task is None:
+            task = self.rendering[spec] = asyncio.ensure_future(self.render(spec))
+        return await task
+
+    async def render(self, spec:tuple) -> tuple:
+        '''Render a card in the pool, and cache it'''
+        self.renders += 1
+        try:
+            body = await asyncio.get_running_loop().run_in_executor(self.executor, render, spec)
+        finally:
+            del self.rendering[spec]
+        if body is None:
+            self.cache.put(spec, no_card)
+            return None
+        cached = ('"' + hashlib.sha1(body).hexdigest() + '"', body)
+        self.cache.put(spec, cached)
+        return cached
+
+    async def respond(self, method:str, target:str, headers:dict) -> tuple:
+        '''Return (status, headers, body) for a request (the body even for HEAD, for its length)'''
+        if method not in ('GET', 'HEAD'):
+            return (405, {'Allow': 'GET, HEAD'}, b'')
+        url = urllib.parse.urlsplit(target)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        try:
+            spec = card_spec(url.path, query)
+            card = await self.card(spec)
+            if card is None:
+                raise NotFound(target)
+        except BadRequest as e:
+            return (400, {'Content-Type': 'text/plain'}, str(e).encode())
+        except NotFound:
+            return (404, {'Content-Type': 'text/plain'}, b'no such card')
+        except Exception as e:
+            return (500, {'Content-Type': 'text/plain'}, f"{type(e).__name__}: {e}".encode())
+        (etag, body) = card
+        out_headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if etag in [t.strip() for t in headers.get('if-none-match', '').split(',')]:
+            return (304, out_headers, b'')
+        out_headers['Content-Type'] = content_types[spec[-1]]
+        return (200, out_headers, body)
+
+    async def serve(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter):
+        '''Answer HTTP/1.1 requests on a connection until it's closed'''
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    (method, target, version) = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    (name, _, value) = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                (status, out_headers, body) = await self.respond(method, target, headers)
+                close = headers.get('connection', '').lower() == 'close' or version == 'HTTP/1.0'
+                lines = [f"HTTP/1.1 {status} {status_text.get(status, '')}"]
+                lines += [f"{name}: {value}" for (name, value) in out_headers.items()]
+                lines.append(f"Content-Length: {len(body)}")
+                if close:
+                    lines.append("Connection: close")
+                if method == 'HEAD':
+                    body = b''
+                writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body)
+                await writer.drain()
+                if close:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+status_text = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               500: 'Internal Server Error'}
+
+async def main(host:str, port:int, jobs:int, cache_size:int):
+    service = Service(jobs=jobs, cache_size=cache_size)
+    server = await asyncio.start_server(service.serve, host, port)
+    print(f"Serving flashcards on http://{host}:{port}/")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve flashcards rendered on demand")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--jobs", "-j", type=int, default=None,
+                        help="number of worker processes (default one per CPU)")
+    parser.add_argument("--cache-size", type=int, default=4096, help="number of cards to cache")
+    parser.add_argument("--xml-writer", choices=("music21", "native"), default=score.xml_writer)
+    parser.add_argument("--midi-writer", choices=("music21", "native"), default=score.midi_writer)
+    args = parser.parse_args()
+    score.xml_writer = args.xml_writer
+    score.midi_writer = args.midi_writer
+    try:
+        asyncio.run(main(args.host, args.port, args.jobs, args.cache_size))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,128 @@
+import asyncio
+import concurrent.futures
+import pytest
+import time
+
+try:
+    import fcgen
+    import service
+except:
+    from flashcard import fcgen
+    from flashcard import service
+
+def test_card_spec():
+    spec = service.card_spec('/notes', {'notes': 'G4,C4,E4,C4', 'key': 'Bb'})
+    assert spec == ('notes', ('C4', 'E4', 'G4'), None, 'Bflat', 'major', 'xml')
+    assert service.card_spec('/notes', {'notes': 'E4,G4,C4', 'key': 'Bflat', 'mode': 'major'}) == spec
+    assert service.card_spec('/chord', {'root': 'C4', 'type': '7', 'format': 'midi'}) == \
+        service.card_spec('/chord', {'root': 'C4', 'type': 'dom7', 'voicing': 'standard', 'key': 'C', 'format': 'midi'})
+    spec = service.card_spec('/randnote', {'low': 'C4', 'high': 'C4', 'clef': 'Bass'})
+    assert spec == ('notes', ('C4',), 'Bass', None, None, 'xml')
+    for (path, query) in (
+        ('/notes', {}),
+        ('/notes', {'notes': 'H4'}),
+        ('/notes', {'notes': 'C4', 'mode': 'major'}),
+        ('/notes', {'notes': 'C4', 'format': 'pdf'}),
+        ('/interval', {'note': 'C4', 'interval': 'M5'}),
+        ('/chord', {'root': 'C4', 'type': 'dom99'}),
+    ):
+        with pytest.raises(service.BadRequest):
+            service.card_spec(path, query)
+    with pytest.raises(service.NotFound):
+        service.card_spec('/nope', {})
+
+def test_card_spec_normalized():
+    assert service.card_spec('/notes', {'notes': 'Cb4,C04,cflat4'}) == service.card_spec('/notes', {'notes': 'C-4,C4'})
+    assert service.card_spec('/notes', {'notes': 'C-4,C4'})[1] == ('C-4', 'C4')
+    assert service.card_spec('/interval', {'note': 'C04', 'interval': 'a05'}) == \
+        service.card_spec('/interval', {'note': 'C4', 'interval': 'A5'})
+    assert service.card_spec('/interval', {'note': 'C4', 'interval': 'P-8'})[2] == '-P8'
+    for (path, query) in (
+        ('/notes', {'notes': 'C99'}),
+        ('/notes', {'notes': 'G#9'}),
+        ('/interval', {'note': 'C4', 'interval': 'P99'}),
+        ('/interval', {'note': 'C4', 'interval': 'dddd5'}),
+    ):
+        with pytest.raises(service.BadRequest):
+            service.card_spec(path, query)
+
+def test_card_spec_not_interned():
+    interned = len(service.Note._interned)
+    for octave in range(1000, 1100):
+        with pytest.raises(service.BadRequest):
+            service.card_spec('/notes', {'notes': f'C{octave}'})
+    for octave in range(0, 9):
+        service.card_spec('/notes', {'notes': f'D#0{octave}'})
+    assert len(service.Note._interned) == interned
+
+def test_render_matches_fcgen():
+    spec = service.card_spec('/chord', {'root': 'F4', 'type': 'min7', 'voicing': 'blues', 'key': 'Eb'})
+    expected = fcgen.fc_chord(fcgen.Note('F4'), fcgen.ChordType.min7, fcgen.Voicing.blues, fcgen.Key.Eflat).xml
+    assert service.render(spec) == expected.encode()
+    spec = service.card_spec('/chord', {'root': 'C4', 'type': 'hdim', 'voicing': 'blues'})
+    assert service.render(spec) is None
+
+def test_lru_cache():
+    cache = service.LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3) # drops b, the least recently used
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c'), len(cache)) == (1, 3, 2)
+
+async def request(port:int, target:str, headers:str="") -> tuple:
+    '''Send a GET on a new connection; return (status, headers, body)'''
+    (reader, writer) = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: x\r\nConnection: close\r\n{headers}\r\n".encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    (head, _, body) = response.partition(b'\r\n\r\n')
+    lines = head.decode().split('\r\n')
+    status = int(lines[0].split()[1])
+    out_headers = dict(line.split(': ', 1) for line in lines[1:])
+    return (status, out_headers, body)
+
+@pytest.mark.timeout(60)
+def test_service():
+    async def run():
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            svc = service.Service(executor=executor, cache_size=16)
+            server = await asyncio.start_server(svc.serve, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            target = '/chord?root=C4&type=dom7&voicing=blues&key=F'
+
+            # concurrent requests for the same card render it once
+            responses = await asyncio.gather(*[request(port, target) for n in range(4)])
+            assert [r[0] for r in responses] == [200] * 4
+            assert len({r[2] for r in responses}) == 1
+            assert svc.renders == 1
+            (status, headers, body) = responses[0]
+            assert headers['Content-Type'] == service.content_types['xml']
+            assert body.startswith(b'<?xml')
+
+            assert (await request(port, target, f"If-None-Match: {headers['ETag']}\r\n"))[0] == 304
+            (status, midi_headers, midi) = await request(port, target + '&format=midi')
+            assert (status, midi[:4]) == (200, b'MThd')
+            assert midi_headers['ETag'] != headers['ETag']
+
+            # a chord there's no card for is a 404, and remembered as one
+            renders = svc.renders
+            assert (await request(port, '/chord?root=C4&type=hdim&voicing=blues'))[0] == 404
+            assert (await request(port, '/chord?root=C4&type=hdim&voicing=blues'))[0] == 404
+            assert svc.renders == renders + 1
+            assert (await request(port, '/notes?notes=X9'))[0] == 400
+            assert (await request(port, '/nothing'))[0] == 404
+
+            # cached cards come back quickly
+            times = []
+            for n in range(50):
+                start = time.perf_counter()
+                assert (await request(port, target))[0] == 200
+                times.append(time.perf_counter() - start)
+            assert sorted(times)[-1] < 0.5
+
+            server.close()
+            await server.wait_closed()
+    asyncio.run(run())
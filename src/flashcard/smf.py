@@ -0,0 +1,91 @@
+# Standard MIDI File writer - writes our Score model straight to MIDI bytes, without music21
+#
+# Like music21's streamToMidiFile, this writes a format 1 file with a conductor track (tempo, time
+# and key signature) followed by one track per Sequence.  It's selected with score.midi_writer = 'native'.
+
+import struct
+
+# defaults, same as music21
+division = 10080 # ticks per quarter note
+tempo = 120 # quarter notes per minute
+velocity = 90
+channel = 0 # i.e. MIDI channel 1
+
+# meta events
+TRACK_NAME = 0x03
+END_OF_TRACK = 0x2F
+SET_TEMPO = 0x51
+TIME_SIGNATURE = 0x58
+KEY_SIGNATURE = 0x59
+
+# channel events
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+PROGRAM_CHANGE = 0xC0
+
+def varlen(value:int) -> bytes:
+    '''Encode a MIDI variable-length quantity'''
+    out = bytearray((value & 0x7F,))
+    value >>= 7
+    while value:
+        out.insert(0, (value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(out)
+
+def meta(type:int, data:bytes=b'') -> bytes:
+    return bytes((0xFF, type)) + varlen(len(data)) + data
+
+def track(events:list, end:int=0) -> bytes:
+    '''Return an MTrk chunk for a list of (absolute tick, event bytes), which must be in time order'''
+    body = bytearray()
+    now = 0
+    for (when, event) in events:
+        body += varlen(when - now) + event
+        now = when
+    body += varlen(max(end - now, 0)) + meta(END_OF_TRACK)
+    return b'MTrk' + struct.pack('>I', len(body)) + bytes(body)
+
+def conductor_track(sharps:int, bpm:float, length:int) -> bytes:
+    usec_per_quarter = round(60_000_000 / bpm)
+    events = [
+        (0, meta(SET_TEMPO, usec_per_quarter.to_bytes(3, 'big'))),
+        # 4/4, 24 clocks per click, 8 32nds per quarter
+        (0, meta(TIME_SIGNATURE, bytes((4, 2, 24, 8)))),
+    ]
+    if sharps is not None and -7 <= sharps <= 7:
+        events.append((0, meta(KEY_SIGNATURE, struct.pack('>bB', sharps, 0))))
+    return track(events, length)
+
+def sequence_track(sequence, ticks_per_quarter:int) -> tuple:
+    '''Return (MTrk chunk, length in ticks) for a Sequence'''
+    events = [
+        (0, meta(TRACK_NAME)),
+        (0, bytes((PROGRAM_CHANGE | channel, 0))), # piano
+    ]
+    now = 0
+    for tick in sequence.ticks:
+        end = now + round(tick.duration.quarterLength * ticks_per_quarter)
+        pitches = [note.midi() for note in tick.ordered()]
+        events.extend((now, bytes((NOTE_ON | channel, p, velocity))) for p in pitches)
+        events.extend((end, bytes((NOTE_OFF | channel, p, 0))) for p in pitches)
+        now = end
+    return (track(events, now), now)
+
+def score_to_midi(score, bpm:float=None, ticks_per_quarter:int=None) -> bytes:
+    '''Return Standard MIDI File bytes for a Score'''
+    bpm = tempo if bpm is None else bpm
+    ticks_per_quarter = division if ticks_per_quarter is None else ticks_per_quarter
+    sharps = None
+    if score.keyAndMode is not None:
+        sharps = score.keyAndMode.sharps
+
+    tracks = []
+    length = 0
+    for sequence in score.sequences:
+        (chunk, seq_length) = sequence_track(sequence, ticks_per_quarter)
+        tracks.append(chunk)
+        length = max(length, seq_length)
+    tracks.insert(0, conductor_track(sharps, bpm, length))
+
+    header = b'MThd' + struct.pack('>IHHH', 6, 1, len(tracks), ticks_per_quarter)
+    return header + b''.join(tracks)
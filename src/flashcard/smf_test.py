@@ -0,0 +1,89 @@
+import pytest
+
+import music21
+
+try:
+    from score import *
+    from chords import *
+    from fcgen import *
+    from smf import *
+except:
+    from flashcard.score import *
+    from flashcard.chords import *
+    from flashcard.fcgen import *
+    from flashcard.smf import *
+
+def test_varlen():
+    assert varlen(0) == b'\x00'
+    assert varlen(0x7F) == b'\x7F'
+    assert varlen(0x80) == b'\x81\x00'
+    assert varlen(10080) == b'\xCE\x60'
+    assert varlen(0x0FFFFFFF) == b'\xFF\xFF\xFF\x7F'
+
+def events(midi:bytes) -> tuple:
+    '''Return (tempo, [per track: (time in quarters, event type, pitch)]) from MIDI file bytes'''
+    mf = music21.midi.MidiFile()
+    mf.readstr(midi)
+    tempo = None
+    tracks = []
+    for t in mf.tracks:
+        now = 0
+        out = []
+        for e in t.events:
+            if isinstance(e, music21.midi.DeltaTime):
+                now += e.time
+            elif e.type == music21.midi.MetaEvents.SET_TEMPO:
+                tempo = e.data
+            elif e.type in (music21.midi.ChannelVoiceMessages.NOTE_ON, music21.midi.ChannelVoiceMessages.NOTE_OFF):
+                out.append((now / mf.ticksPerQuarterNote, e.type.name, e.pitch))
+        tracks.append(out)
+    return (tempo, tracks)
+
+def scores():
+    yield Score([Sequence(Clef.Treble, [Tick(Duration(1), {Note('C4')})])])
+    yield Score([Sequence(None, [Tick(Duration(1), {Note('C4'), Note('E-4'), Note('G4')})])],
+                keyAndMode=KeyAndMode(Key.Eflat, Mode.major))
+    for (root, type, voicing, key) in (
+        ('C4', ChordType.dom7, Voicing.blues, Key.C),
+        ('Bb3', ChordType.dom13, Voicing.standard, Key.Bflat),
+        ('F#4', ChordType.min9, Voicing.blues_tight, Key.D),
+    ):
+        parts = chord(Note(root), key, Chord(type, voicing).parts)
+        seqs = [Sequence(Clef.Treble if i == 0 else Clef.Bass, [Tick(Duration(1), part)]) for (i, part) in enumerate(parts)]
+        yield Score(seqs, keyAndMode=KeyAndMode(key, Mode.major))
+    # several ticks
+    seq = Sequence(Clef.Treble)
+    for name in ('C4', 'D4', 'E4', 'F4', 'G4'):
+        seq.add([Tick(Duration(1), {Note(name)})])
+    yield Score([seq])
+    # an exercise, with other lengths and rests
+    yield exercise(60, NoteRange(Note('C3'), Note('C6')), chord_size=2, rests=0.2, seed=11)
+
+def test_native_matches_music21():
+    for s in scores():
+        assert events(s.toMidi('native')) == events(s.toMidi('music21')), str(s)
+
+def test_durations():
+    seq = Sequence(Clef.Treble)
+    for (name, ql) in (('C4', 1), ('D4', 2), ('E4', 0.5), ('F4', 0.5)):
+        seq.add([Tick(Duration(ql), {Note(name)})])
+    (tempo, tracks) = events(Score([seq]).toMidi('native'))
+    assert tracks[1] == [
+        (0.0, 'NOTE_ON', 60), (1.0, 'NOTE_OFF', 60),
+        (1.0, 'NOTE_ON', 62), (3.0, 'NOTE_OFF', 62),
+        (3.0, 'NOTE_ON', 64), (3.5, 'NOTE_OFF', 64),
+        (3.5, 'NOTE_ON', 65), (4.0, 'NOTE_OFF', 65),
+    ]
+
+def test_division_and_tempo():
+    s = Score([Sequence(Clef.Treble, [Tick(Duration(2), {Note('A4')})])])
+    midi = score_to_midi(s, bpm=60, ticks_per_quarter=480)
+    assert midi[:4] == b'MThd'
+    mf = music21.midi.MidiFile()
+    mf.readstr(midi)
+    assert mf.format == 1
+    assert mf.ticksPerQuarterNote == 480
+    assert len(mf.tracks) == 2
+    (tempo, tracks) = events(midi)
+    assert tempo == (1_000_000).to_bytes(3, 'big')
+    assert tracks[1] == [(0.0, 'NOTE_ON', 69), (2.0, 'NOTE_OFF', 69)]
@@ -0,0 +1,90 @@
+# content-addressed store - each distinct card body is written once, and cards link to it
+#
+# Bodies are kept under their SHA-1 (the same hash the manifest keeps for each card's XML), e.g.
+# output/store/3f/3f2a....xml, and each card's file is a hard link to its body.  A body that's
+# already in the store, from this run or an earlier one, isn't written again, so a full rebuild
+# only writes the bodies that changed.  Where hard links aren't supported, cards get a copy.
+
+import hashlib
+import os
+import shutil
+import threading
+
+try:
+    import web
+except:
+    from flashcard import web
+
+class ContentStore(object):
+    '''A directory of bodies by hash; add() stores a body (once) and links a file to it'''
+    def __init__(self, dir:str, suffix:str=".xml"):
+        self.dir = dir
+        self.suffix = suffix
+        self.bodies = set()     # hashes of the bodies added in this run
+        self.files = 0          # files linked in this run
+        self.written = 0        # bodies that weren't in the store yet
+        self.file_bytes = 0     # size of all the files linked
+        self.body_bytes = 0     # size of the distinct bodies
+        self.links = True       # False once hard links have failed, so files are copies
+
+    def path(self, digest:str) -> str:
+        return os.path.join(self.dir, digest[:2], digest + self.suffix)
+
+    def put(self, data:bytes) -> str:
+        '''Store a body if it isn't there already, and return its hash'''
+        digest = hashlib.sha1(data).hexdigest()
+        if digest not in self.bodies:
+            self.bodies.add(digest)
+            self.body_bytes += len(data)
+            path = self.path(digest)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                web.write_file(path, data)
+                self.written += 1
+        return digest
+
+    def link(self, digest:str, filename:str):
+        '''Make filename a hard link to (or a copy of) a stored body, replacing any file that was there'''
+        tmp_filename = f"{filename}.tmp{os.getpid()}.{threading.get_ident()}"
+        if self.links:
+            try:
+                os.link(self.path(digest), tmp_filename)
+            except OSError:
+                self.links = False
+        if not self.links:
+            shutil.copyfile(self.path(digest), tmp_filename)
+        os.replace(tmp_filename, filename)
+
+    def add(self, data:bytes, filename:str) -> str:
+        '''Store a body and link filename to it; returns the body's hash'''
+        digest = self.put(data)
+        self.link(digest, filename)
+        self.files += 1
+        self.file_bytes += len(data)
+        return digest
+
+    def ratio(self) -> float:
+        '''Files per distinct body in this run'''
+        return self.files / max(len(self.bodies), 1)
+
+    def prune(self, keep:set) -> int:
+        '''Remove bodies whose hashes aren't in keep; returns how many were removed'''
+        removed = 0
+        if not os.path.isdir(self.dir):
+            return 0
+        for sub in os.listdir(self.dir):
+            subdir = os.path.join(self.dir, sub)
+            for fname in os.listdir(subdir):
+                digest = fname[:-len(self.suffix)] if fname.endswith(self.suffix) else None
+                if digest not in keep:
+                    os.remove(os.path.join(subdir, fname))
+                    removed += 1
+            if not os.listdir(subdir):
+                os.rmdir(subdir)
+        return removed
+
+    def report(self) -> str:
+        how = "linked" if self.links else "copied"
+        return (f"{self.files} card files {how} from {len(self.bodies)} distinct bodies "
+                f"(dedupe ratio {self.ratio():.2f}); {self.written} new bodies written, "
+                f"{self.body_bytes / 1e6:.1f} MB stored for {self.file_bytes / 1e6:.1f} MB of cards")
@@ -0,0 +1,31 @@
+import os
+
+try:
+    import store
+except:
+    from flashcard import store
+
+def test_store(tmp_path):
+    s = store.ContentStore(str(tmp_path / "store"))
+    (a, b, c) = (str(tmp_path / "a.xml"), str(tmp_path / "b.xml"), str(tmp_path / "c.xml"))
+    da = s.add(b"<same/>", a)
+    assert s.add(b"<same/>", b) == da
+    dc = s.add(b"<other/>", c)
+    assert (s.files, len(s.bodies), s.written) == (3, 2, 2)
+    assert s.ratio() == 1.5
+    with open(b, "rb") as f:
+        assert f.read() == b"<same/>"
+    assert os.path.samefile(a, b)
+    assert os.path.samefile(a, s.path(da))
+    assert "dedupe ratio 1.50" in s.report()
+
+    # a body from an earlier run isn't written again
+    s2 = store.ContentStore(s.dir)
+    s2.add(b"<same/>", b)
+    assert (s2.files, s2.written) == (1, 0)
+
+    assert s2.prune({da}) == 1
+    assert not os.path.exists(s.path(dc))
+    assert os.path.exists(s.path(da))
+    with open(c, "rb") as f:
+        assert f.read() == b"<other/>" # the card's link still has it
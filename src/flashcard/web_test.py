@@ -0,0 +1,58 @@
+import os
+import threading
+
+try:
+    import musicxml # fails unless we're run from src/flashcard, where 'web' is this web.py, not src/web.py
+    import web
+except:
+    from flashcard import web
+
+def test_template():
+    t = web.Template("<h1>{{ title }}</h1>{{ description }}<p>{{ title }}</p>")
+    assert t.render(title="T", description="D") == "<h1>T</h1>D<p>T</p>"
+    buffer = bytearray(b"old")
+    del buffer[:]
+    t.render_into(buffer, title="♯", description="")
+    assert buffer.decode() == "<h1>♯</h1><p>♯</p>"
+
+def test_template_unknown_placeholder():
+    # like str.replace, a placeholder nothing fills in is left alone
+    t = web.Template("<h1>{{ title }}</h1>{{ subtitle }}")
+    assert t.render(title="T") == "<h1>T</h1>{{ subtitle }}"
+    buffer = bytearray()
+    t.render_into(buffer, title="T")
+    assert buffer.decode() == "<h1>T</h1>{{ subtitle }}"
+
+def test_template_matches_replace():
+    with open(web.template_filename) as f:
+        text = f.read()
+    expected = text.replace("{{ title }}", "a title")\
+                   .replace("{{ description }}", "<h2>about it</h2>")\
+                   .replace("{{ score_filename }}", "output/x%20y.xml")
+    assert web.musichtml("a title", "output/x y.xml", "about it") == expected
+
+def test_template_reloaded(tmpdir):
+    path = str(tmpdir.join("t.html"))
+    with open(path, "w") as f:
+        f.write("{{ title }}!")
+    assert web.template(path).render(title="a") == "a!"
+    assert web.template(path) is web.template(path)
+    with open(path, "w") as f:
+        f.write("{{ title }}?")
+    os.utime(path, ns=(0, 0))
+    assert web.template(path).render(title="a") == "a?"
+
+def test_batch_threads(tmpdir):
+    start_count = web.file_count
+    def write(n:int):
+        pages = [(f"t{n}.{i}", str(tmpdir.join(f"{n}.{i}.html")), f"{n}.{i}.xml", "") for i in range(50)]
+        assert web.gen_musichtml_batch(pages) == 50
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert web.file_count - start_count == 200
+    assert len(os.listdir(str(tmpdir))) == 200
+    with open(str(tmpdir.join("3.7.html"))) as f:
+        assert f.read() == web.musichtml("t3.7", "3.7.xml")
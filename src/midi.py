@@ -1,28 +1,214 @@
 # MIDI functions
+#
+# midi_play() plays one card and waits for it.  For a drill, a PlaybackSession plays a list of
+# cards one after another: the mixer is set up once, the next few cards are loaded in a background
+# thread while the current one plays, and start(), stop() and skip() return straight away.  The
+# session records the time from each play request (start, skip, or the end of the card before) to
+# the audio starting.  Cards can be MIDI, played through pygame.mixer.music (which needs a MIDI
+# synth, e.g. timidity), or WAV (see flashcard/audio.py), decoded ahead into Sounds, which start
+# fastest.  Set SDL_AUDIODRIVER=dummy to run without a sound device.
 
 import io
+import queue
+import threading
+import time
+
 import pygame
 
-def midi_play(midi:str):
-    # Create an in-memory file object from the bytes
-    midi_file = io.BytesIO(midi)
+def init_mixer():
+    '''Start the mixer, if it isn't already'''
+    if not pygame.mixer.get_init():
+        pygame.mixer.init()
 
-    pygame.mixer.init()
+def midi_play(midi:str):
+    init_mixer()
 
-    # Load and play the MIDI data
-    pygame.mixer.music.load(midi_file)
+    # Load and play the MIDI data, from an in-memory file object
+    pygame.mixer.music.load(io.BytesIO(midi))
     pygame.mixer.music.play()
 
     # Keep the program running while the music plays
+    clock = pygame.time.Clock()
     while pygame.mixer.music.get_busy():
-        pygame.time.Clock().tick(10)
+        clock.tick(10)
+
+done = None # end of the cards, on the preload queue
+
+class PlaybackSession(object):
+    '''Play cards one after another, without blocking the caller; use as a context manager, or call close()
+
+    cards is an iterable of card outputs (anything with get(format), e.g. fcgen's Outputs) or of
+    the bytes to play, in the given format ('midi' or 'wav').  Up to preload cards are loaded
+    ahead of the one playing.  Nothing plays until start().
+    '''
+    poll = 0.005 # seconds between checks for the end of a card
+
+    def __init__(self, cards, format:str='midi', preload:int=3):
+        if format not in ('midi', 'wav'):
+            raise ValueError(f"can't play '{format}'")
+        init_mixer()
+        self.format = format
+        self.ready = queue.Queue(maxsize=preload) # (index, loaded card), then done
+        self.commands = queue.Queue() # (command, time requested)
+        self.closed = threading.Event()
+        self.finished = threading.Event() # all the cards have played, or close()
+        self.latencies = [] # seconds from each play request to the audio starting
+        self.now_playing = None # index of the card sounding
+        self.played = 0
+        self.error = None
+        self.loader = threading.Thread(target=self._preload, args=(cards,), daemon=True)
+        self.player = threading.Thread(target=self._run, daemon=True)
+        self.loader.start()
+        self.player.start()
+
+    def start(self):
+        '''Play from the next card (or carry on after stop())'''
+        self.commands.put(('start', time.perf_counter()))
+
+    def stop(self):
+        '''Stop the card playing, and don't play any more until start()'''
+        self.commands.put(('stop', time.perf_counter()))
+
+    def skip(self):
+        '''Stop the card playing and go on to the next one (or, if stopped, drop the next one)'''
+        self.commands.put(('skip', time.perf_counter()))
+
+    def wait(self, timeout:float=None) -> bool:
+        '''Wait until all the cards have played; returns False on timeout'''
+        finished = self.finished.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return finished
+
+    def report(self) -> str:
+        if not self.latencies:
+            return "nothing played"
+        latencies = sorted(self.latencies)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return (f"{len(latencies)} cards played, latency mean {sum(latencies) / len(latencies) * 1e3:.1f} ms, "
+                f"p95 {p95 * 1e3:.1f} ms, max {latencies[-1] * 1e3:.1f} ms")
+
+    def close(self):
+        self.closed.set()
+        self.commands.put(('close', time.perf_counter()))
+        self.player.join()
+        self.loader.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def load(self, card):
+        '''Return a card ready to play: a Sound for WAV, or a file object for pygame.mixer.music'''
+        data = card if isinstance(card, (bytes, bytearray)) else card.get(self.format)
+        if self.format == 'wav':
+            return pygame.mixer.Sound(file=io.BytesIO(data))
+        return io.BytesIO(data)
+
+    def _put(self, item) -> bool:
+        # wait for room on the queue, but not past close()
+        while not self.closed.is_set():
+            try:
+                self.ready.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _next(self):
+        # the next loaded card, or done at the end or on close()
+        while not self.closed.is_set():
+            try:
+                return self.ready.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return done
+
+    def _preload(self, cards):
+        try:
+            for (index, card) in enumerate(cards):
+                if not self._put((index, self.load(card))):
+                    return
+        except Exception as e:
+            self.error = e
+        self._put(done)
+
+    def _play(self, loaded):
+        '''Start a loaded card; returns what to ask get_busy() and stop()'''
+        if isinstance(loaded, pygame.mixer.Sound):
+            channel = loaded.play()
+            if channel is None:
+                raise RuntimeError("no mixer channel free")
+            return channel
+        pygame.mixer.music.load(loaded)
+        pygame.mixer.music.play()
+        return pygame.mixer.music
+
+    def _run(self):
+        playing = False   # between start() and stop()
+        current = None    # the card sounding (a Channel, or pygame.mixer.music)
+        requested = None  # when the next card was asked for
+        try:
+            while True:
+                try:
+                    (command, at) = self.commands.get(timeout=self.poll if current is not None else None)
+                except queue.Empty:
+                    command = None
+                if command == 'close':
+                    return
+                if command in ('stop', 'skip') and current is not None:
+                    current.stop()
+                    current = None
+                    self.now_playing = None
+                if command == 'start' and not playing:
+                    playing = True
+                    requested = at
+                elif command == 'stop':
+                    playing = False
+                elif command == 'skip':
+                    if playing:
+                        requested = at
+                    elif self._next() is done:
+                        break
+                if current is not None and not current.get_busy():
+                    # the card ended, so the next one is wanted now
+                    current = None
+                    self.now_playing = None
+                    requested = time.perf_counter()
+                if playing and current is None:
+                    item = self._next()
+                    if item is done:
+                        break
+                    (index, loaded) = item
+                    current = self._play(loaded)
+                    deadline = time.perf_counter() + 0.1
+                    while not current.get_busy() and time.perf_counter() < deadline:
+                        time.sleep(0.0005)
+                    self.latencies.append(time.perf_counter() - requested)
+                    self.now_playing = index
+                    self.played += 1
+        except Exception as e:
+            self.error = e
+        finally:
+            if current is not None:
+                current.stop()
+            self.now_playing = None
+            self.finished.set()
 
 if __name__ == "__main__":
-    if True:
-        from flashcard import score
-        from flashcard import chords
-        from flashcard import fcgen
+    import argparse
+    parser = argparse.ArgumentParser(description="Play a chord card")
+    parser.add_argument("--drill", action="store_true",
+                        help="play the dom7 blues chord on every root instead, as WAV previews, and report the latency")
+    args = parser.parse_args()
+
+    from flashcard import score
+    from flashcard import chords
+    from flashcard import fcgen
 
+    if not args.drill:
         # play a chord
         note = score.Note("C4")
         ct = chords.ChordType.dom7
@@ -30,3 +216,11 @@ if __name__ == "__main__":
         voicing = chords.Voicing.blues
         (scoreXml, scoreMidi) = fcgen.fc_chord(note, type=ct, voicing=voicing, key=key)
         midi_play(scoreMidi)
+    else:
+        # a drill: the dom7 blues chords on every root, as WAV previews
+        cards = (fcgen.fc_chord(score.Note(f"{n.name}3"), chords.ChordType.dom7, chords.Voicing.blues, score.Key.C)
+                 for n in score.Key)
+        with PlaybackSession(cards, format='wav') as session:
+            session.start()
+            session.wait()
+            print(session.report())
@@ -0,0 +1,60 @@
+import os
+import time
+
+import numpy
+import pytest
+
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy") # no sound device needed
+
+import midi
+from flashcard import audio
+
+def tone(seconds:float) -> bytes:
+    return audio.pcm_to_wav(audio.note_wave(69, int(seconds * audio.sample_rate)))
+
+def wait_for(condition, timeout:float=5.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, "timed out"
+        time.sleep(0.005)
+
+@pytest.mark.timeout(30)
+def test_plays_in_order():
+    cards = [tone(0.05) for i in range(5)]
+    with midi.PlaybackSession(cards, format='wav', preload=2) as session:
+        time.sleep(0.1)
+        assert session.played == 0 # nothing until start()
+        session.start()
+        assert session.wait(10)
+    assert session.played == 5
+    assert len(session.latencies) == 5
+    assert max(session.latencies) < 0.5
+    assert "5 cards played" in session.report()
+
+@pytest.mark.timeout(30)
+def test_start_stop_skip():
+    cards = [tone(5) for i in range(4)]
+    with midi.PlaybackSession(cards, format='wav') as session:
+        # none of the controls wait for the audio
+        start = time.perf_counter()
+        session.start()
+        wait_for(lambda: session.now_playing == 0)
+        session.skip()
+        assert time.perf_counter() - start < 1
+        wait_for(lambda: session.now_playing == 1)
+        session.stop()
+        wait_for(lambda: session.now_playing is None)
+        assert not midi.pygame.mixer.get_busy()
+        session.skip() # drops card 2
+        session.start()
+        wait_for(lambda: session.now_playing == 3)
+        assert time.perf_counter() - start < 3 # long before the first card would have ended
+        assert not session.wait(0)
+    assert session.played == 3
+
+@pytest.mark.timeout(30)
+def test_bad_card():
+    with midi.PlaybackSession([tone(0.01), b"not audio"], format='wav') as session:
+        session.start()
+        with pytest.raises(midi.pygame.error):
+            session.wait(10)
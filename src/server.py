@@ -1,36 +1,171 @@
+# development web server: serves the repo directory, and reloads pages in the browser when
+# .html, .css or .js files change
+#
+# Files are served in-process, and HTML pages get a small script that listens for reloads on
+# /__reload (server-sent events).  File change events are collected for a short quiet period and
+# then sent as one reload, and changes in generated output (e.g. fcset_gen writing thousands of
+# pages) are ignored, so there's nothing to restart and no reload storm.
+
+import http.server
 import os
+import queue
 import sys
+import threading
 import time
-import subprocess
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
-class RestartServerHandler(FileSystemEventHandler):
-    def __init__(self, server_process):
-        self.server_process = server_process
+port = 8000
+debounce = 0.3 # seconds without changes before reloading
+watched = (".html", ".css", ".js")
+ignored = ("output", ".git", "__pycache__", ".pytest_cache") # directories whose changes don't reload
+reload_path = "/__reload"
+
+reload_script = f"""<script>
+new EventSource("{reload_path}").addEventListener("reload", function () {{ location.reload(); }});
+</script>
+"""
+
+def inject_reload(html:bytes) -> bytes:
+    '''Add the reload script to an HTML page, before </body> if there is one'''
+    script = reload_script.encode()
+    i = html.rfind(b"</body>")
+    if i < 0:
+        return html + script
+    return html[:i] + script + html[i:]
+
+def is_watched(path:str, root:str=".") -> bool:
+    '''Is path a file whose changes should reload pages?'''
+    if not path.endswith(watched):
+        return False
+    parts = os.path.relpath(path, root).split(os.sep)
+    return not any(part in ignored for part in parts[:-1])
+
+class Debouncer(object):
+    '''Call action(paths) once things have been quiet for delay seconds after the last trigger()'''
+    def __init__(self, delay:float, action):
+        self.delay = delay
+        self.action = action
+        self.lock = threading.Lock()
+        self.timer = None
+        self.paths = set()
+
+    def trigger(self, path:str):
+        with self.lock:
+            self.paths.add(path)
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.delay, self.fire)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def fire(self):
+        with self.lock:
+            (paths, self.paths, self.timer) = (self.paths, set(), None)
+        if paths:
+            self.action(paths)
+
+class Reloader(object):
+    '''Tells every connected browser to reload'''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients = set() # a queue per /__reload connection
+        self.reloads = 0
+
+    def connect(self) -> queue.Queue:
+        q = queue.Queue()
+        with self.lock:
+            self.clients.add(q)
+        return q
 
-    def on_modified(self, event):
-        if event.src_path.endswith((".html", ".css", ".js")):  # Watch specific file types
-            print(f"Detected change in {event.src_path}. Restarting server...")
-            self.server_process.terminate()  # Stop the server
-            time.sleep(1)  # Give it a moment to release the port
-            self.server_process = subprocess.Popen([sys.executable, "-m", "http.server"])
-            print("Server restarted.")
+    def disconnect(self, q:queue.Queue):
+        with self.lock:
+            self.clients.discard(q)
+
+    def reload(self, paths):
+        self.reloads += 1
+        print(f"Reloading pages for {len(paths)} changed file(s), e.g. {sorted(paths)[0]}")
+        with self.lock:
+            for q in self.clients:
+                q.put(sorted(paths))
+
+reloader = Reloader()
+
+class DevRequestHandler(http.server.SimpleHTTPRequestHandler):
+    '''Serves files, with the reload script added to HTML pages, and the reload events'''
+
+    def do_GET(self):
+        if self.path == reload_path:
+            self.send_events()
+        elif self.path.split("?")[0].endswith(".html"):
+            self.send_html()
+        else:
+            super().do_GET()
+
+    def send_html(self):
+        path = self.translate_path(self.path)
+        try:
+            with open(path, "rb") as f:
+                html = inject_reload(f.read())
+        except OSError:
+            self.send_error(404, "File not found")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(html)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(html)
+
+    def send_events(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        q = reloader.connect()
+        try:
+            while True:
+                try:
+                    paths = q.get(timeout=15)
+                    self.wfile.write(f"event: reload\ndata: {len(paths)}\n\n".encode())
+                except queue.Empty:
+                    self.wfile.write(b": keep-alive\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            reloader.disconnect(q)
+
+class ReloadHandler(FileSystemEventHandler):
+    def __init__(self, debouncer:Debouncer, root:str="."):
+        self.debouncer = debouncer
+        self.root = root
+
+    def on_any_event(self, event):
+        if event.is_directory or event.event_type not in ("created", "modified", "moved"):
+            return
+        path = getattr(event, "dest_path", "") or event.src_path
+        if is_watched(path, self.root):
+            self.debouncer.trigger(path)
 
 if __name__ == "__main__":
-    server_process = subprocess.Popen([sys.executable, "-m", "http.server"])
-    event_handler = RestartServerHandler(server_process)
+    if len(sys.argv) > 1:
+        port = int(sys.argv[1])
+    server = http.server.ThreadingHTTPServer(("", port), DevRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
     observer = Observer()
-    observer.schedule(event_handler, path=".", recursive=True)
+    observer.schedule(ReloadHandler(Debouncer(debounce, reloader.reload)), path=".", recursive=True)
     observer.start()
 
-    print("Watching for file changes. Press Ctrl+C to stop.")
+    print(f"Serving on http://localhost:{port}/ and watching for file changes. Press Ctrl+C to stop.")
 
     try:
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
         observer.stop()
-        server_process.terminate()
+        server.shutdown()
 
     observer.join()
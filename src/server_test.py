@@ -0,0 +1,54 @@
+import http.client
+import http.server
+import os
+import threading
+import time
+
+import server
+
+def test_inject_reload():
+    html = b"<html><body><h1>x</h1></body></html>"
+    out = server.inject_reload(html)
+    assert out.startswith(b"<html><body><h1>x</h1><script>")
+    assert out.endswith(b"</script>\n</body></html>")
+    assert server.inject_reload(b"<p>") == b"<p>" + server.reload_script.encode()
+
+def test_is_watched():
+    assert server.is_watched(os.path.join(".", "src", "styles.css"))
+    assert server.is_watched(os.path.join(".", "options.html"))
+    assert not server.is_watched(os.path.join(".", "src", "score.py"))
+    assert not server.is_watched(os.path.join(".", "output", "html", "chords", "Cmaj.html"))
+
+def test_debouncer():
+    calls = []
+    debouncer = server.Debouncer(0.1, calls.append)
+    for n in range(100):
+        debouncer.trigger(f"page{n % 10}.html")
+    assert calls == []
+    time.sleep(0.3)
+    assert calls == [{f"page{n}.html" for n in range(10)}]
+
+def test_serve_and_reload(tmpdir):
+    with open(str(tmpdir.join("page.html")), "w") as f:
+        f.write("<html><body>hi</body></html>")
+    handler = lambda *args: server.DevRequestHandler(*args, directory=str(tmpdir))
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    port = httpd.server_address[1]
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        conn.request("GET", "/page.html")
+        page = conn.getresponse().read()
+        assert b"EventSource" in page and page.endswith(b"</body></html>")
+
+        events = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        events.request("GET", server.reload_path)
+        response = events.getresponse()
+        assert response.getheader("Content-Type") == "text/event-stream"
+        while not server.reloader.clients:
+            time.sleep(0.01)
+        server.reloader.reload({"page.html"})
+        assert response.readline() == b"event: reload\n"
+    finally:
+        httpd.shutdown()
@@ -1,29 +1,113 @@
+import os
+import re
+import threading
 import urllib
 
 file_count = 0
+file_count_lock = threading.Lock() # file_count is shared by threads writing pages
+
+# src/template.html, wherever we're run from
+template_filename = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "template.html"))
+
+class Template(object):
+    '''An HTML template with {{ name }} placeholders, split once into text and placeholders
+
+    render() fills in the placeholders by joining the pieces, rather than searching the whole
+    template once per placeholder.  A placeholder without a value is left as it is.
+    '''
+    placeholder_re = re.compile(r'\{\{ (\w+) \}\}')
+
+    def __init__(self, text:str):
+        # even pieces are text, odd pieces are placeholder names
+        self.pieces = self.placeholder_re.split(text)
+        self.encoded = [piece.encode() for piece in self.pieces]
+
+    def render(self, **values) -> str:
+        pieces = self.pieces[:]
+        for i in range(1, len(pieces), 2):
+            pieces[i] = values.get(pieces[i], '{{ %s }}' % pieces[i])
+        return "".join(pieces)
+
+    def render_into(self, buffer:bytearray, **values):
+        '''Render (UTF-8) into the end of buffer'''
+        encoded = self.encoded
+        for i in range(len(encoded)):
+            if i % 2 == 0:
+                buffer += encoded[i]
+            else:
+                buffer += values.get(self.pieces[i], '{{ %s }}' % self.pieces[i]).encode()
+
+# filename -> (modification time, Template)
+_templates = {}
+
+def template(filename:str=None) -> Template:
+    '''Return the Template for a file, loading it again only if the file has changed'''
+    filename = template_filename if filename is None else filename
+    mtime = os.stat(filename).st_mtime_ns
+    cached = _templates.get(filename)
+    if cached is None or cached[0] != mtime:
+        with open(filename, "r") as template_file:
+            cached = _templates[filename] = (mtime, Template(template_file.read()))
+    return cached[1]
+
+def write_file(filename:str, text):
+    '''Write a file atomically: readers see the old file or the new one, never part of one
+
+    text can be a str, or bytes (e.g. a bytearray) which are written as they are.
+    '''
+    tmp_filename = f"{filename}.tmp{os.getpid()}.{threading.get_ident()}"
+    if isinstance(text, str):
+        with open(tmp_filename, "w") as f:
+            f.write(text)
+    else:
+        with open(tmp_filename, "wb") as f:
+            f.write(text)
+    os.replace(tmp_filename, filename)
+
+def musichtml_values(title:str, score_filename:str, description:str="") -> dict:
+    '''Return the template values for a page displaying the given musicXml file'''
+    return {
+        'title': title,
+        'description': f"<h2>{description}</h2>" if description else "",
+        'score_filename': urllib.parse.quote(score_filename),
+    }
+
+def musichtml(title:str, score_filename:str, description:str="") -> str:
+    '''Return the HTML to display the given musicXml file'''
+    return template().render(**musichtml_values(title, score_filename, description))
 
 def gen_musichtml(title:str, html_filename:str, score_filename:str, description:str=""):
     '''Given musicXml file, write HTML file to display it'''
 
     global file_count
 
-    safe_score_filename = urllib.parse.quote(score_filename)
-    
-    with open("src/template.html", "r") as template_file:
-        template = template_file.read()
-    
-    desc_html = f"<h2>{description}</h2>" if description else ""
-
-    # Replace placeholders in the template
-    html_content = template.replace("{{ title }}", title)\
-                           .replace("{{ description }}", desc_html)\
-                           .replace("{{ score_filename }}", safe_score_filename)
+    html_content = musichtml(title, score_filename, description)
 
     # Write to the new HTML file
-    with open(html_filename, "w") as f:
-        f.write(html_content)
+    write_file(html_filename, html_content)
+    with file_count_lock:
         file_count += 1
 
+def gen_musichtml_batch(pages) -> int:
+    '''Write many HTML files, given (title, html_filename, score_filename, description) for each
+
+    The pages are rendered into one reused buffer.  Returns the number of files written, which is
+    also added to file_count; a process running this for another should add it to its own.
+    '''
+    global file_count
+
+    tmpl = template()
+    buffer = bytearray()
+    written = 0
+    for (title, html_filename, score_filename, description) in pages:
+        del buffer[:]
+        tmpl.render_into(buffer, **musichtml_values(title, score_filename, description))
+        write_file(html_filename, buffer)
+        written += 1
+    with file_count_lock:
+        file_count += written
+    return written
+
 import urllib.parse
 import webbrowser
 